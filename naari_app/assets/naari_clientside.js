@@ -0,0 +1,72 @@
+/*
+ * Clientside callbacks for UI-only interactions (no device or server state involved).
+ * Registered from Python with ClientsideFunction(namespace='naari', function_name=...).
+ */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    naari: {
+        // Main content: device card collapse. Even clicks = open, odd = closed.
+        collapse_element: function (clicks) {
+            return !((clicks || 0) % 2);
+        },
+
+        // Main content: mirror a slider value into its brightness indicator.
+        brightness_indicator: function (brightnessValue) {
+            return brightnessValue;
+        },
+
+        // Main content: power button color from the device's power_on store (true = on, false = off, null = unknown).
+        power_button_color: function (powerOn) {
+            if (powerOn === true) {
+                return 'success';
+            }
+            return powerOn === false ? 'danger' : 'secondary';
+        },
+
+        // Theme tab: theme card collapse and its caret (odd clicks = closed).
+        theme_collapse: function (clicks) {
+            var closed = Boolean((clicks || 0) % 2);
+            var icon = {
+                namespace: 'dash_html_components',
+                type: 'I',
+                props: {className: closed ? 'bi bi-caret-down-fill fs-5' : 'bi bi-caret-left-fill fs-5'}
+            };
+            return [!closed, icon];
+        },
+
+        // Theme tab: name field is editable only while the edit toggle is on.
+        update_theme_name: function (titleSwitch) {
+            return !titleSwitch;
+        },
+
+        // General tab: setting input is enabled only while its edit switch is on.
+        allow_for_setting_edit: function (value) {
+            return !value;
+        },
+
+        // Device tab: collapse view and editability of a device card (odd clicks = closed and read-only).
+        view_device_settings: function (button) {
+            if (button === undefined || button === null) {
+                return window.dash_clientside.no_update;
+            }
+            var closed = Boolean(button % 2);
+            var icon = {
+                namespace: 'dash_html_components',
+                type: 'I',
+                props: {className: closed ? 'bi bi-caret-down-fill fs-5' : 'bi bi-caret-left-fill fs-5'}
+            };
+            return [!closed, icon, closed, closed];
+        },
+
+        // Device tab: only one device may be the Master Sync device.
+        master_sync_device_switch: function (_values) {
+            var context = window.dash_clientside.callback_context;
+            var triggered = context.triggered_id;
+            if (!triggered || typeof triggered !== 'object') {
+                return window.dash_clientside.no_update;
+            }
+            return context.inputs_list[0].map(function (item) {
+                return item.id.device_id === triggered.device_id;
+            });
+        }
+    }
+});
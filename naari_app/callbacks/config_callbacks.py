@@ -12,11 +12,14 @@ import logging
 
 from dotenv import load_dotenv
 from dash.exceptions import PreventUpdate
-from dash import Input, Output, State, ALL, ctx
+from dash import Input, Output, State, ALL, ctx, no_update, Patch
 
 from naari_logging.naari_logger import LogManager
-from naari_app.util.util_functions import save_configer
-from naari_app.util.config_builder import DeviceConfig, UISettings, ThemeSelectionConfig, NaariSettingsConfig
+from naari_app.util.config_store import CONFIG_STORE, ConfigToken
+from naari_app.util.theme_plans import THEME_PLANS
+from naari_app.util.render_cache import RENDER_CACHE
+from naari_app.modals.config_modal import CONFIG_TABS, config_tab_content
+from naari_app.util.config_builder import DeviceConfig, UISettings, ThemeSelectionConfig, ConfigValidationError
 
 MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ",,"))
 load_dotenv(os.path.join(MAINDIR, ".env"))
@@ -30,6 +33,7 @@ def config_callbacks(app):
             - Opening and closing the modal via config/save/cancel buttons
             - Saving all tab-based settings into the naari_settings store
             - Resetting stack state and button counters when modal is reopened
+            - Building each tab's cards the first time the tab is viewed
 
         Future adjustments may expand cancel behavior to fully revert
         changes to previously saved configuration.
@@ -49,11 +53,12 @@ def config_callbacks(app):
             Input('config_cancel_button', 'n_clicks')
         ],
         [
-            State('theme_cards_stack', 'children'),
-            State('devices_stack', 'children')
+            # Card ids in stack order; the stacks themselves are only patched, never sent over
+            State({'type': 'theme_card', 'theme_id': ALL, 'theme_card_added': ALL}, 'id'),
+            State({'type': 'device_card_settings', 'device_id': ALL, 'device_added': ALL}, 'id')
         ],
     )
-    def open_model(open_button, save_button, close_button, current_themes_children_set, current_devices_children_set):
+    def open_model(open_button, save_button, close_button, theme_card_ids, device_card_ids):
         """ Handles the opening and closing of the Modal. For when someone clicks Cancel, will revert back to previous state. """
         if not ctx.triggered:
             raise PreventUpdate
@@ -62,35 +67,19 @@ def config_callbacks(app):
 
         #if data_app_load_check and trigger_id == 'config-btn':
         if trigger_id == 'config-btn':                                                                          # pylint: disable=no-else-return
-            return True, 0, current_themes_children_set, 0, current_devices_children_set, True
+            return True, 0, no_update, 0, no_update, True
 
         #elif data_app_load_check and data_app_load_check and trigger_id == 'config_save_button':
         elif trigger_id == 'config_save_button':                                                                # pylint: disable=no-else-return
-            return False, 0, current_themes_children_set, 0, current_devices_children_set, True
+            return False, 0, no_update, 0, no_update, True
 
         #elif data_app_load_check and trigger_id == 'config_cancel_button':
         elif trigger_id == 'config_cancel_button':                                                              # pylint: disable=no-else-return
-            updated_theme_children = []
-            for child in current_themes_children_set:
-                if (
-                        isinstance(child, dict) and
-                        'props' in child and
-                        child['props'].get('id', {}).get('theme_card_added') is False
-                ):
-                    continue  # Skip this card (i.e., remove it)
-                updated_theme_children.append(child)
-
-            update_device_children = []
-            for child in current_devices_children_set:
-                if (
-                        isinstance(child, dict) and
-                        'props' in child and
-                        child['props'].get('id', {}).get('device_added') is False
-                ):
-                    continue  # Skip this card (i.e., remove it)
-                update_device_children.append(child)
-
-            return False, 0, updated_theme_children, 0, update_device_children, True
+            # Drop the cards added since the modal was opened (not in the config yet)
+            theme_patch = _remove_added_cards(theme_card_ids, 'theme_card_added')
+            device_patch = _remove_added_cards(device_card_ids, 'device_added')
+
+            return False, 0, theme_patch, 0, device_patch, True
 
         else:
             LogManager.print_message(
@@ -102,6 +91,35 @@ def config_callbacks(app):
             raise PreventUpdate
 
 
+    @app.callback(
+        [
+            *[Output(stack_id, 'children', allow_duplicate=True) for stack_id in CONFIG_TABS.values()],
+            Output('config_tabs_loaded', 'data')
+        ],
+        [
+            Input('config_modal', 'is_open'),
+            Input('config_modal_tabs', 'active_tab')
+        ],
+        State('config_tabs_loaded', 'data'),
+        prevent_initial_call=True
+    )
+    def build_config_tab(is_open, active_tab, loaded_tabs):
+        """
+            Fill in the shown tab the first time it is viewed (per modal render); later views keep what is there.
+            Contents come from the render cache, so a tab is only built once per config version.
+        """
+        loaded_tabs = loaded_tabs or []
+        if not is_open or active_tab not in CONFIG_TABS or active_tab in loaded_tabs:
+            raise PreventUpdate
+
+        tab_children = [
+            RENDER_CACHE.render(f"config_tab_{tab_id}", lambda tab_id=tab_id: config_tab_content(tab_id, CONFIG_STORE.get()))
+            if tab_id == active_tab else no_update
+            for tab_id in CONFIG_TABS
+        ]
+        return *tab_children, loaded_tabs + [active_tab]
+
+
     @app.callback(
         Output("naari_settings", "data", allow_duplicate=True),
         Input("config_save_button", "n_clicks"),
@@ -120,25 +138,39 @@ def config_callbacks(app):
             State({"type": "input_general_settings", "name": ALL}, "value"),
             State({"type": "general_settings_row_meta", "name": ALL}, "data"),
 
-            # Existing config (optional, fallback)
-            State("naari_settings", "data"),
+            # Tabs never opened have no widgets, their section is kept as saved
+            State('config_tabs_loaded', 'data')
         ]
     )
     def save_config( n_clicks, device_instance_names, device_addresses, device_master_syncs, device_actives, theme_names,   # pylint: disable=too-many-arguments, too-many-positional-arguments
-                     theme_preset_values, ui_setting_values, ui_setting_metas, existing_config) -> NaariSettingsConfig:
-        """ Handles the saving and updating of the Config file of current settings. """
+                     theme_preset_values, ui_setting_values, ui_setting_metas, loaded_tabs) -> ConfigToken:
+        """
+            Handles the saving and updating of the Config file of current settings.
+            Returns the new config version token; an unchanged config is a no-op (no write, no UI rebuild).
+        """
 
         if not n_clicks:
             raise PreventUpdate
 
+        loaded_tabs = loaded_tabs or []
+        saved_config = CONFIG_STORE.get()
         try:
             current_config = {
-                "devices": format_device_settings_export(callback_state=ctx.states_list),
-                "themes": format_theme_settings_export(callback_state=ctx.states_list),
-                "ui_settings": format_ui_settings_export(
-                    callback_state=ctx.states_list,
-                    existing_ui_settings=existing_config['ui_settings']
+                "devices": (
+                    format_device_settings_export(callback_state=ctx.states_list)
+                    if 'devices' in loaded_tabs else saved_config['devices']
+                ),
+                "themes": (
+                    format_theme_settings_export(callback_state=ctx.states_list)
+                    if 'themes' in loaded_tabs else saved_config['themes']
+                ),
+                "ui_settings": (
+                    format_ui_settings_export(
+                        callback_state=ctx.states_list,
+                        existing_ui_settings=saved_config['ui_settings']
                     )
+                    if 'general' in loaded_tabs else saved_config['ui_settings']
+                )
             }
         except Exception as err:
             # TODO: Add in notification window?
@@ -150,17 +182,52 @@ def config_callbacks(app):
             )
             raise PreventUpdate         # pylint: disable=raise-missing-from
 
+        # Presets of devices removed in the Devices tab go with them (validation rejects unknown devices)
+        current_config['themes'] = _drop_removed_device_presets(current_config['themes'], current_config['devices'])
+
         try:
-            save_configer(current_config)
+            if not CONFIG_STORE.save(current_config):
+                return no_update
+        except ConfigValidationError as err:
+            # TODO: Add in notification window?
+            LogManager.print_message(
+                "Config not saved: %s",
+                err,
+                to_log=TO_LOG,
+                log_level=logging.ERROR
+            )
+            raise PreventUpdate         # pylint: disable=raise-missing-from
         except OSError:
             # TODO: Add in notification window?
             raise PreventUpdate         # pylint: disable=raise-missing-from
 
-        return current_config
+        THEME_PLANS.plans()     # compile the saved themes now (logs stale presets) instead of on first use
+        return CONFIG_STORE.token()
 
 
 #---------------------- Helper Functions ---------------------------------------------------------#
 
+def _remove_added_cards(card_ids: list[dict], added_key: str):
+    """ Patch deleting the cards whose id carries `added_key: False` (last index first, so indexes stay valid). """
+    added_indexes = [index for index, card_id in enumerate(card_ids) if card_id.get(added_key) is False]
+    if not added_indexes:
+        return no_update
+
+    stack_patch = Patch()
+    for index in reversed(added_indexes):
+        del stack_patch[index]
+    return stack_patch
+
+
+def _drop_removed_device_presets(themes: list[ThemeSelectionConfig], devices: list[DeviceConfig]) -> list[ThemeSelectionConfig]:
+    """ Themes without the presets of devices no longer in `devices` (new dicts, inputs untouched). """
+    device_ids = {str(device.get('id')) for device in devices}
+    return [
+        {**theme, 'presets': [preset for preset in theme.get('presets', []) if str(preset.get('device_id')) in device_ids]}
+        for theme in themes
+    ]
+
+
 def format_device_settings_export(callback_state: list[list[dict]]) -> list[DeviceConfig]:
     """ Builds the Device settings output for the config file. """
     device_name_entries = collect_states_by_type(
@@ -1,12 +1,42 @@
-from dash import Input, Output, MATCH
+from dash import Input, Output, State, MATCH, ctx, no_update, ClientsideFunction
+
+from naari_app.ui_parts.main_content import filter_devices, page_count, device_page
+from naari_app.util.config_store import CONFIG_STORE
 
 def main_content_callback(app):
 
-    @app.callback(
+    # Even = True (collapse element = open)
+    # Odd = False (collapse element = close)
+    app.clientside_callback(
+        ClientsideFunction(namespace='naari', function_name='collapse_element'),
         Output({'type': 'collapse_segment', 'device_id': MATCH}, 'is_open'),
         Input({'type': 'active_device_collapse_button', 'device_id': MATCH}, 'n_clicks'),
     )
-    def collapse_element(clicks):
-        # Even = True (collapse element = open)
-        # Odd = False (collapse element = close)
-        return not bool(clicks % 2)
+
+    @app.callback(
+        [
+            Output('main_content_stack', 'children'),
+            Output('device_page', 'max_value'),
+            Output('device_page', 'active_page'),
+            Output('data_app_load_check', 'data', allow_duplicate=True)
+        ],
+        [
+            Input('device_filter', 'value'),
+            Input('device_page', 'active_page')
+        ],
+        State('elements_initialized', 'data'),
+        prevent_initial_call=True
+    )
+    def device_list_view(query, active_page, elements_initialized):
+        """
+            Mount only the cards of the selected page (after filtering by name/address).
+            Re-signals the page load so presets, power colors and sliders get filled in for the newly mounted cards
+            (sliders filled that way are flagged per device, so nothing is sent to the devices).
+        """
+        devices = filter_devices(CONFIG_STORE.index().devices, query)
+        total = page_count(len(devices))
+        page = 1 if ctx.triggered_id == 'device_filter' else min(max(active_page or 1, 1), total)
+
+        if not elements_initialized:
+            return device_page(devices, page), total, page, no_update
+        return device_page(devices, page), total, page, True
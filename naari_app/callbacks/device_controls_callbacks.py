@@ -8,19 +8,24 @@ These controls are scoped to single devices or device groups—distinct from glo
 actions that affect the entire system.
 """
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future
 import os
 import logging
 
 from dotenv import load_dotenv
-import dash.exceptions
-from dash import Input, Output, State, ALL, ctx
+from dash import Input, Output, State, ALL, MATCH, ctx, ClientsideFunction, no_update
 from dash.exceptions import PreventUpdate
 
 from naari_logging.naari_logger import LogManager
-from naari_app.util.config_builder import DeviceConfig, UISettings
-from naari_app.util.send_payload import  send_preset, brightness_adjustment, PayloadRetryError
-from naari_app.util.util_functions import get_device
+from naari_app.util.config_builder import DeviceConfig
+from naari_app.util.config_model import Settings
+from naari_app.util.send_payload import confirmed_state, PayloadRetryError
+from naari_app.util.command_queue import (submit_device_update, wait_result, log_command_failure,
+                                         CommandQueueFull, CommandTimeout)
+from naari_app.util.config_store import CONFIG_STORE
+from naari_app.util.theme_plans import THEME_PLANS
+from naari_app.util.preset_cache import PRESET_CACHE
+from naari_app.util.util_functions import changed_only
 
 __all__ = ['device_controls_callbacks']
 
@@ -43,27 +48,24 @@ def device_controls_callbacks(app):     # pylint: disable=too-many-statements
     """
 
     @app.callback(
-        Output({'type': "brightness_slider", 'device_id': ALL}, "value"),
         [
-            Input('brightness_chain_trigger', 'n_clicks'),
-            Input({'type': 'preset_selection', 'device_id': ALL}, 'value'),
+            Output({'type': "brightness_slider", 'device_id': ALL}, "value"),
+            Output({'type': 'brightness_slider_meta', 'device_id': ALL}, 'data')
         ],
+        Input('brightness_chain_trigger', 'n_clicks'),
         [
-            State('auto_mode', 'data'),
             State('device_catch_data', 'data'),
-            State('devices_catch_presets', 'data'),
-            State('naari_settings', 'data'),
-            State('elements_initialized', 'data')
-        ]
+            State('elements_initialized', 'data'),
+            State({'type': "brightness_slider", 'device_id': ALL}, "value")
+        ],
+        prevent_initial_call=True
     )
-    def brightness_preset_setter(brightness_chain_trigger, preset_option, is_auto_mode, polled_cach_data,      #pylint: disable=too-many-locals, too-many-branches, too-many-arguments, too-many-positional-arguments
-                                 cached_presets, naari_settings, elements_initialized):
+    def brightness_sync(_brightness_chain_trigger, polled_cach_data, elements_initialized, current_brightness):
         """
-            The selected preset will perform the following actions
-            1) will adjust the Brightness slider widget according to current polled device data
-            2) if preset is selected, will adjust the brightness widget accordingly and send a 'POST' call to the device chanigng to selected preset.
+            Sets the mounted Brightness sliders to the current polled device data (page load, preset refresh).
+            Sliders moved here get their `brightness_slider_meta` flag set, so the change isn't sent back to the device.
         """
-        if not ctx.triggered_id or not elements_initialized:
+        if not elements_initialized:
             raise PreventUpdate
 
         # Build baseline: device_id -> current brightness from polled data
@@ -81,160 +83,196 @@ def device_controls_callbacks(app):     # pylint: disable=too-many-statements
             )
             raise PreventUpdate     # pylint: disable=raise-missing-from
 
-        # Use the UI-rendered order for preset dropdowns to map ids -> values robustly
-        # inputs_list[1] corresponds to the second Input group: preset_selection 'value'
-        preset_inputs_group_order = dash.ctx.inputs_list[1]
-        widget_ordered_preset_ids = [
-            item['id']['device_id']
-            for item in preset_inputs_group_order
-            if isinstance(item.get('id'), dict) and item.get('property') == 'value'
-        ]
-
-        if isinstance(ctx.triggered_id, dict) and ctx.triggered_id['type'] == 'preset_selection':
-            submissions = {}  # device_id -> (preset_id:int, device_info)
-
-            if is_auto_mode:
-                # Preset set to for UI as a str ex -> "2: Work"
-                preset_values = [parse_preset_id(preset) for preset in preset_option]
-                widget_preset_mapping = dict(zip(widget_ordered_preset_ids, preset_values))
-
-                for dev_id, preset_id_str in widget_preset_mapping.items():
-                    if preset_id_str not in (None, "", "0"):
-                        device_info = get_device(devices=naari_settings['devices'], device_id=dev_id)
-                        submissions[dev_id] = (int(preset_id_str), device_info)
-
-                devices_brightness = {
-                    device_id: get_brightness(device_id, preset, cached_presets)
-                    for device_id, preset in widget_preset_mapping.items()
-                }
-
-            else:  # User selects specific 'Card' preset widget.
-                triggered_info = ctx.triggered[0]  # {'prop_id': '...', 'value': '<id: name>'}
-                triggered_device_id = ctx.triggered_id['device_id']
-                preset_value = parse_preset_id(triggered_info.get('value'))
-
-                selected_device = get_device(
-                    device_id=triggered_device_id,
-                    devices=naari_settings['devices']
-                )
+        # Only sliders whose value changes are sent back (and flagged)
+        values_out = changed_only(
+            [devices_brightness.get(item['id']['device_id'], 0) for item in ctx.outputs_list[0]],
+            current_brightness
+        )
+        set_by_app = [no_update if value is no_update else True for value in values_out]
 
-                # For sending POST bellow
-                if preset_value not in (None, "", 0):
-                    submissions[triggered_device_id] = (int(preset_value), selected_device)
+        return values_out, set_by_app
 
-                # Note: preset_value must be str
-                changed_brightness = next(
-                    (data['data'].get(preset_value, {}).get('bri')
-                     for data in cached_presets if data['device_id'] == triggered_device_id),
-                    None
-                )
-                if changed_brightness is not None:
-                    devices_brightness[triggered_device_id] = changed_brightness
-
-            # Send presets only *after* app is loaded
-            # Utilizing Threading to best simulate all lights triggering at once
-            # Only utilizing 4 threads due to lower strain on Pi
-            if submissions:
-                with ThreadPoolExecutor(max_workers=4) as executor:
-                    for preset_value, target_device in submissions.values():
-                        executor.submit(
-                            _preset_sender,
-                            preset_value,
-                            target_device,
-                            naari_settings['ui_settings']
-                        )
-
-        values_out = []
-        for item in preset_inputs_group_order:
-            if isinstance(item.get('id'), dict) and item.get('property') == 'value':
-                device_id = item['id']['device_id']
-                values_out.append(devices_brightness.get(device_id, 0))
-
-        return values_out
 
     @app.callback(
         [
-            Output('auto_mode', 'data', allow_duplicate=True),
-            Output({'type': 'brightness_indicator', 'device_id': ALL}, 'children'),
-            Output('init_brightness_chain_trigger', 'data', allow_duplicate=True),
-            Output('reset_poll_interval', 'data', allow_duplicate=True)
+            Output({'type': "brightness_slider", 'device_id': MATCH}, "value", allow_duplicate=True),
+            Output({'type': 'brightness_slider_meta', 'device_id': MATCH}, 'data', allow_duplicate=True)
         ],
-        Input({'type': "brightness_slider", 'device_id': ALL}, "value"),
+        Input({'type': 'preset_selection', 'device_id': MATCH}, 'value'),
         [
-            State('auto_mode', 'data'),
-            State("naari_settings", 'data'),
-            State('init_brightness_chain_trigger', 'data')
+            State('elements_initialized', 'data'),
+            State('room-theme-mode', 'value'),
+            State({'type': "brightness_slider", 'device_id': MATCH}, "value")
         ],
         prevent_initial_call=True
     )
-    def handle_brightness_changes(brightness_values, auto_mode, naari_settings, brightness_chain_trigger):
+    def device_preset_selected(preset_option, elements_initialized, selected_theme_id, current_brightness):
         """
-            Mirror slider values into the brightness indicators;
-            if user-driven and auto mode is off, send a brightness update to the targeted device.
+            A device's preset dropdown changed (by the user, or by a theme being applied):
+            1) sends a 'POST' to that device changing to the selected preset
+            2) moves its Brightness slider to the brightness the device confirmed (flagged as set by the app).
+            Runs per device, so one slow device never holds up the others.
         """
-        if not ctx.triggered:
+        if not isinstance(ctx.triggered_id, dict) or not elements_initialized or not preset_option:
             raise PreventUpdate
 
-        # Prevents turning devices on/off during initial page loading.
-        if brightness_chain_trigger:
-            return False, list(brightness_values), False, False
+        device_id = ctx.triggered_id['device_id']
+        target_device = CONFIG_STORE.index().device(device_id)
+        if target_device is None:
+            raise PreventUpdate
 
-        # Only when manipulated manually by user
-        if not auto_mode:
-            target_device_id = ctx.triggered_id['device_id']
-            target_device = get_device(
-                devices=naari_settings['devices'],
-                device_id=target_device_id
-            )
+        # Theme applied: the compiled plan has the request body ready for the preset it set
+        plan = THEME_PLANS.plan(int(selected_theme_id)) if selected_theme_id is not None else None
+        step = plan.by_device.get(device_id) if plan is not None else None
+
+        if step is not None and step.option == preset_option and step.preset_id != 0:
+            preset_value, body, brightness = step.preset_id, step.body, step.brightness
+        else:   # User selects specific 'Card' preset widget.
+            preset_id = parse_preset_id(preset_option)
+            if not preset_id or not preset_id.isdigit():
+                raise PreventUpdate
+            preset_value, body, brightness = int(preset_id), None, None
+
+        if brightness is None:
+            brightness = get_brightness(target_device['address'], str(preset_value))
+
+        # Slider follows the brightness the device confirmed with the preset applied
+        ui_settings = CONFIG_STORE.settings()
+        state = _preset_result(
+            _preset_sender(preset_value, target_device, ui_settings, body),
+            preset_value, target_device['address'], ui_settings
+        )
+        if state and state.get('bri') is not None:
+            brightness = state['bri']
+
+        if brightness is None or brightness == current_brightness:
+            return no_update, no_update
+        return brightness, True
+
+
+    # Mirror slider value into the brightness indicator (browser side)
+    app.clientside_callback(
+        ClientsideFunction(namespace='naari', function_name='brightness_indicator'),
+        Output({'type': 'brightness_indicator', 'device_id': MATCH}, 'children'),
+        Input({'type': "brightness_slider", 'device_id': MATCH}, "value"),
+        prevent_initial_call=True
+    )
 
-            # Build a mapping of device_id -> slider_value from the current input group
-            # Easier extraction?
-            input_group = ctx.inputs_list[0]  # Only input in Callback
-            widget_value_map = {ui_widget['id'].get('device_id'): ui_widget['value'] for ui_widget in input_group}
-            changed_value = widget_value_map.get(target_device_id, None)
-
-            if changed_value is not None:
-                try:
-                    brightness_adjustment(
-                        change_value=changed_value,
-                        device_info=target_device,
-                        ui_settings=naari_settings["ui_settings"]
-                    )
-                except PayloadRetryError as err:
-                    # TODO: add trigger indicating what device had an error?
-                    LogManager.print_message(
-                        "Brightness update failed after %s attempts (url=%s): %s",
-                        getattr(err, 'attempts', 'n/a'),
-                        getattr(err, 'url', 'n/a'),
-                        getattr(err, 'last_exception', err),
-                        to_log=TO_LOG,
-                        log_level=logging.ERROR
-                    )
-
-                except Exception as exc:        # pylint: disable=broad-exception-caught
-                    # TODO: Make popup?
-                    LogManager.print_message(
-                        "Unexpected error updating device_id %s: %s",
-                        target_device_id, exc,
-                        to_log=TO_LOG,
-                        log_level=logging.ERROR
-                    )
-
-        return False, list(brightness_values), False, True
+    @app.callback(
+        Output({'type': 'brightness_slider_meta', 'device_id': MATCH}, 'data', allow_duplicate=True),
+        Input({'type': "brightness_slider", 'device_id': MATCH}, "value"),
+        State({'type': 'brightness_slider_meta', 'device_id': MATCH}, 'data'),
+        prevent_initial_call=True
+    )
+    def handle_brightness_changes(brightness_value, set_by_app):
+        """
+            If user-driven, send a brightness update to the device of the moved slider.
+            Values set by the app (flagged in `brightness_slider_meta`) only clear the flag.
+        """
+        if not isinstance(ctx.triggered_id, dict):
+            raise PreventUpdate
+
+        # Prevents resending what was just read from (or confirmed by) the device.
+        if set_by_app:
+            return False
+
+        target_device_id = ctx.triggered_id['device_id']
+        target_device = CONFIG_STORE.index().device(target_device_id)
+
+        if brightness_value is not None and target_device is not None:
+            # Not waited on: while dragging, queued values get superseded by the newest one.
+            try:
+                submit_device_update(
+                    payload={"bri": brightness_value},
+                    device_info=target_device,
+                    ui_settings=CONFIG_STORE.settings()
+                ).add_done_callback(log_command_failure)
+            except CommandQueueFull as err:
+                # Device is backed up; dropping this value, the next slider event carries a newer one.
+                LogManager.print_message(
+                    "Brightness update skipped: %s",
+                    err,
+                    to_log=TO_LOG,
+                    log_level=logging.WARNING
+                )
+
+            except Exception as exc:        # pylint: disable=broad-exception-caught
+                # TODO: Make popup?
+                LogManager.print_message(
+                    "Unexpected error updating device_id %s: %s",
+                    target_device_id, exc,
+                    to_log=TO_LOG,
+                    log_level=logging.ERROR
+                )
+
+        # Device state is written through on the response, no extra poll needed
+        raise PreventUpdate
 
 
 #----------------------------------- helper functions-----------------------#
-def _preset_sender(preset_value: int, target_device: DeviceConfig, ui_settings: UISettings):
-    send_preset(
-        preset_value=preset_value,
-        device_info=target_device,
-        ui_settings=ui_settings
-    )
+def _preset_sender(preset_value: int, target_device: DeviceConfig, ui_settings: Settings,
+                   body: bytes | None = None) -> Future | None:
+    """ Queues the preset on the device command queue. None if the device could not take it. """
+    try:
+        return submit_device_update(
+            payload={"ps": preset_value},
+            device_info=target_device,
+            ui_settings=ui_settings,
+            body=body
+        )
+    except CommandQueueFull as err:
+        LogManager.print_message(
+            "Preset %s not sent: %s",
+            preset_value, err,
+            to_log=TO_LOG,
+            log_level=logging.WARNING
+        )
+    except Exception as exc:        # pylint: disable=broad-exception-caught
+        LogManager.print_message(
+            "Unexpected error sending preset %s: %s",
+            preset_value, exc,
+            to_log=TO_LOG,
+            log_level=logging.ERROR
+        )
+    return None
+
+
+def _preset_result(sent: Future | None, preset_value: int, address: str, ui_settings: Settings) -> dict | None:
+    """ Waits (bounded) for a queued preset and returns the confirmed device state (None on failure). """
+    if sent is None:
+        return None
+    try:
+        return confirmed_state(wait_result(sent, address, ui_settings))
+    except CommandTimeout as err:
+        LogManager.print_message(
+            "Preset %s not confirmed: %s",
+            preset_value, err,
+            to_log=TO_LOG,
+            log_level=logging.WARNING
+        )
+    except PayloadRetryError as err:
+        LogManager.print_message(
+            "Preset update failed after %s attempts (url=%s): %s",
+            getattr(err, 'attempts', 'n/a'),
+            getattr(err, 'url', 'n/a'),
+            getattr(err, 'last_exception', err),
+            to_log=TO_LOG,
+            log_level=logging.ERROR
+        )
+    except Exception as exc:        # pylint: disable=broad-exception-caught
+        LogManager.print_message(
+            "Unexpected error sending preset %s: %s",
+            preset_value, exc,
+            to_log=TO_LOG,
+            log_level=logging.ERROR
+        )
+    return None
 
 def parse_preset_id(preset: str):
     if not preset:
         return None
     return preset.split(":")[0].strip()
 
-def get_brightness(selected_device, preset_value, presets_data):
-    return next((device['data'][preset_value].get('bri', None) for device in presets_data if device['device_id'] == selected_device), 0)
+def get_brightness(address: str, preset_value: str) -> int | None:
+    """ Brightness stored with a preset, from the server-side preset cache. """
+    return ((PRESET_CACHE.presets(address) or {}).get(preset_value) or {}).get('bri')
@@ -10,13 +10,11 @@ device actions are performed here.
 """
 
 import dash.exceptions
-from dash import html, Input, Output, State, ALL, ctx, MATCH
+from dash import Input, Output, State, ALL, ctx, MATCH, ClientsideFunction, Patch
 
 from naari_app.modals.device_tab import device_card
-
-# TODO: move this into master call class?
-COLLAPSE_OPEN_SYMBOL = html.I(className="bi bi-caret-left-fill fs-5")
-COLLAPSE_CLOSE_SYMBOL = html.I(className="bi bi-caret-down-fill fs-5")
+from naari_app.util.config_store import CONFIG_STORE
+from naari_app.util.util_functions import stack_index
 
 
 def device_settings_callback(app):
@@ -28,7 +26,9 @@ def device_settings_callback(app):
         - Enforcing a single Master Sync device selection
         - Adding or removing device entries from the configuration stack
     """
-    @app.callback(
+    # Toggle the device card collapse view and editability of its fields (odd clicks → closed and read-only).
+    app.clientside_callback(
+        ClientsideFunction(namespace='naari', function_name='view_device_settings'),
         [
             Output({'type': 'device_collapse_element', 'device_id': MATCH}, 'is_open'),
             Output({'type': 'device_collapse_button', 'device_id': MATCH}, 'children'),
@@ -36,42 +36,14 @@ def device_settings_callback(app):
             Output({'type': 'device_address', 'device_id': MATCH}, 'readonly')
         ],
         Input({'type': 'device_collapse_button', 'device_id': MATCH}, 'n_clicks'),
-
     )
-    def view_device_settings(button):
-        """Toggle the device card collapse view and editability of its fields."""
-
-        if not ctx.triggered:
-            raise dash.exceptions.PreventUpdate
 
-        # Collapse logic: odd clicks → open, even clicks → closed
-        collapse_is_open = not bool(button % 2)
-
-        card_name_readonly = card_address_readonly = bool(button % 2)
-
-        button_image = COLLAPSE_CLOSE_SYMBOL if button % 2 else COLLAPSE_OPEN_SYMBOL
-
-        return  collapse_is_open, button_image, card_name_readonly, card_address_readonly
-
-
-    @app.callback(
+    # Ensures only one device is selected as the Master Sync
+    app.clientside_callback(
+        ClientsideFunction(namespace='naari', function_name='master_sync_device_switch'),
         Output({'type': 'device_master_sync', 'device_id': ALL}, 'value'),
         Input({'type': 'device_master_sync', 'device_id': ALL}, 'value'),
     )
-    def master_sync_device_switch(_):
-        """ Ensures only one device is selected as the Master Sync """
-        if not ctx.triggered:
-            raise dash.exceptions.PreventUpdate
-
-        triggered_device_id  = ctx.triggered_id ['device_id']
-
-        # Resets all False
-        device_state_map  = {card['id']['device_id']: False for card in ctx.inputs_list[0]}
-
-        # Assigns only one device based off what device 'ID' got triggered
-        device_state_map[triggered_device_id ] = True
-
-        return list(device_state_map.values())
 
 
     @app.callback(
@@ -80,23 +52,22 @@ def device_settings_callback(app):
             Input('device_add_button', 'n_clicks'),
             Input({'type': 'device_remove_button', 'device_id': ALL}, 'n_clicks')
         ],
-        [
-            State('devices_stack', 'children'),
-            State('naari_settings', 'data'),
-        ],
+        # Card ids in stack order (the stack holds only device cards), the stack itself is never sent over
+        State({'type': 'device_card_settings', 'device_id': ALL, 'device_added': ALL}, 'id'),
     )
-    def add_remove_device_card(add_mode_click, remove_mode_clicks, current_children_set, naari_settings):    # pylint: disable=unused-argument
-
+    def add_remove_device_card(add_mode_click, remove_mode_clicks, card_ids):    # pylint: disable=unused-argument
+        """ Add or remove a device card, as a `Patch` (append / delete at index) on the devices stack. """
         if not ctx.triggered:
             raise dash.exceptions.PreventUpdate
 
         triggered = ctx.triggered_id
+        stack_patch = Patch()
 
 
         if triggered == 'device_add_button' and add_mode_click:     # pylint: disable=no-else-return
 
-            # Collect existing device IDs from config and performce a safe additoin if nothing in config file.
-            device_ids = [device.get("id", 0) for device in naari_settings['devices']]
+            # Collect existing device IDs (config and cards added since) and performce a safe additoin if nothing in config file.
+            device_ids = list(CONFIG_STORE.index().by_id) + [card_id['device_id'] for card_id in card_ids]
             next_id = (max(device_ids) + 1) if device_ids else 1        # pylint: disable=using-constant-test
 
             # Setup the dictionary that will be sent
@@ -114,27 +85,15 @@ def device_settings_callback(app):
                 init_loaded=False
             )
 
-            # Safely appends the new card into the set
-            render_set = current_children_set + [new_card]
-
-            return render_set
-
-        elif isinstance(triggered, dict) and triggered['type'] == 'device_remove_button':    # pylint disable=no-else-return
-            device_to_remove = triggered['device_id']
-
-            updated_children = []
-            # Shifts through to find card being removed.
-            for child in current_children_set:
+            stack_patch.append(new_card)
+            return stack_patch
 
-                if (
-                        isinstance(child, dict) and
-                        'props' in child and
-                        child['props'].get('id', {}).get('type') == 'device_card_settings' and
-                        child['props'].get('id', {}).get('device_id') == device_to_remove
-                ):
-                    continue  # Skip this card (i.e., remove it)
-                updated_children.append(child)
+        elif isinstance(triggered, dict) and triggered['type'] == 'device_remove_button':    # pylint: disable=no-else-return
+            removed_index = stack_index(card_ids, 'device_id', triggered['device_id'])
+            if removed_index is None:
+                raise dash.exceptions.PreventUpdate
 
-            return updated_children
+            del stack_patch[removed_index]
+            return stack_patch
 
-        return current_children_set
+        raise dash.exceptions.PreventUpdate
@@ -6,7 +6,7 @@ planned for additional controls such as polling rates, global toggles, or
 other system-wide configuration fields.
 """
 
-from dash import Input, Output, MATCH
+from dash import Input, Output, MATCH, ClientsideFunction
 
 def general_settings_callback(app):
     """
@@ -17,13 +17,9 @@ def general_settings_callback(app):
 
        This module is designed to support additional general configuration features in the future.
        """
-    @app.callback(
+    # Allows for Specific Widget to be editable (browser side, no server round-trip).
+    app.clientside_callback(
+        ClientsideFunction(namespace='naari', function_name='allow_for_setting_edit'),
         Output({'type': 'input_general_settings', "name": MATCH}, 'disabled'),
         Input({'type': 'edit_general_input_switch', "name": MATCH}, 'value')
     )
-
-    def allow_for_setting_edit(value):
-        """ Callback function allows for Specific Widget to be editable. """
-        if value:
-            return False
-        return True
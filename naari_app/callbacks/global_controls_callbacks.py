@@ -13,8 +13,11 @@ from dash import Input, Output, State, ALL, ctx
 from dash.exceptions import PreventUpdate
 
 from naari_logging.naari_logger import LogManager
-from naari_app.util.send_payload import  send_payload
-from naari_app.util.util_functions import get_master_device
+from naari_app.util.send_payload import confirmed_state, PayloadRetryError
+from naari_app.util.command_queue import submit_payload, wait_result, fan_out_power, CommandQueueFull, CommandTimeout
+from naari_app.util.device_state_cache import DEVICE_STATE_CACHE
+from naari_app.util.config_store import CONFIG_STORE
+from naari_app.util.theme_plans import THEME_PLANS
 
 MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ",,"))
 load_dotenv(os.path.join(MAINDIR, ".env"))
@@ -37,23 +40,17 @@ def global_controls_callback(app):
        These callbacks apply system-wide logic and affect multiple devices at once.
     """
     @app.callback(
-        [
-            Output('auto_mode', 'data', allow_duplicate=True),
-            Output({'type': 'preset_selection', 'device_id': ALL}, 'value')
-        ],
+        Output({'type': 'preset_selection', 'device_id': ALL}, 'value'),
         Input('room-theme-mode', 'value'),
-        [
-            State({'type': 'preset_selection', 'device_id': ALL}, 'options'),
-            State('naari_settings', 'data'),
-            State('elements_initialized', 'data')
-        ],
+        State('elements_initialized', 'data'),
     )
-    def mode_change(selected_theme_id, _preset_options, naari_settings, elements_initialized):
+    def mode_change(selected_theme_id, elements_initialized):
         """
-            When the room theme changes, enable auto mode and set each device's preset dropdown
-            to the theme-defined preset. Returns [True, <list of preset names aligned to UI order>].
+            When the room theme changes, set each device's preset dropdown to the theme-defined preset.
+            Returns <list of preset names aligned to UI order>.
 
-            Note: Auto_mode starts here
+            Presets come from the compiled theme plan, entries flagged stale there are left empty.
+            Each changed dropdown then sends its plan step through `device_preset_selected` (per device).
         """
         if not ctx.triggered:
             raise dash.exceptions.PreventUpdate
@@ -61,9 +58,8 @@ def global_controls_callback(app):
         if elements_initialized is False:
             raise PreventUpdate
 
-        themes = naari_settings.get('themes', [])
-        theme = next((theme for theme in themes if theme.get('id') == int(selected_theme_id)), None)
-        if not theme:
+        plan = THEME_PLANS.plan(int(selected_theme_id))
+        if not plan:
             LogManager.print_message(
                 "Theme not in Config. Check Settings",
                 to_log=TO_LOG,
@@ -72,25 +68,13 @@ def global_controls_callback(app):
             # TODO: Popup issue
             raise PreventUpdate
 
-        presets_for_theme = theme.get('presets', [])
-        preset_by_device_id = {preset.get('device_id'): preset.get('preset_name') for preset in presets_for_theme}
-
-        # ctx.states_list[0] corresponds to State({'type': 'preset_selection', ...}, 'options')
-        state_group = ctx.states_list[0]
-        device_options_by_widget_device_id = {
-            item['id'].get('device_id'): item['value']
-            for item in state_group
-            if isinstance(item.get('id'), dict) and item.get('property') == 'options'
-        }
-
-        # Build values list aligned to UI order (None if theme lacks a preset)
-        # Also checks if config preset is in combobox dropdown.
+        # Values aligned to UI order (empty if the theme lacks a usable preset for the device)
         new_dropdown_values = []
-        for device_id, options in device_options_by_widget_device_id.items():
-            desired = preset_by_device_id.get(device_id)  # /d: Name
-            new_dropdown_values.append(desired if desired in options else "")  # Options: list of /d: Name
+        for item in ctx.outputs_list:
+            step = plan.by_device.get(item['id'].get('device_id'))
+            new_dropdown_values.append(step.option if step else "")
 
-        return True, new_dropdown_values
+        return new_dropdown_values
 
 
     @app.callback(
@@ -102,32 +86,55 @@ def global_controls_callback(app):
             Input('master-power-btn', 'n_clicks'),
             Input('initial_device_catch_data', 'data')      # Aids in initial color value.
         ],
-        [
-            State("device_catch_data", 'data'),
-            State('naari_settings', 'data'),
-        ]
+        State("device_catch_data", 'data')
     )
-    def master_power_button(_button_click, _initial_load, polled_devices, naari_settings):    # pylint: disable=too-many-return-statements
+    def master_power_button(_button_click, _initial_load, polled_devices):    # pylint: disable=too-many-return-statements
         """
             Handle clicks on the Master Power button.
 
-            - Finds the master device from settings
-            - Reads its current state from cached device data
-            - Sends a payload to toggle power on click
-            - Returns a color representing current/failed state
+            Master Sync mode (default):
+                - Finds the master device from settings
+                - Reads its current state from cached device data
+                - Sends a payload to toggle power on click, WLED UDP sync carries it to the other devices
+            Fan-out mode (setting `power_fan_out`, or no usable Master Sync device):
+                - Sends on/off to every active device concurrently and verifies each response
+
+            Returns a color representing current/failed state
         """
         if not ctx.triggered_id:
             raise PreventUpdate
 
-        master_device = get_master_device(naari_settings.get('devices'))
-        if not master_device:
-            return 'danger', False  # TODO: Work on pupop window for this error.
+        polled_devices = polled_devices or []
+        naari_settings = CONFIG_STORE.get()
+        master_device = CONFIG_STORE.index().master
+        master_state = _latest_power_state(master_device['address'], polled_devices) if master_device else None
+
+        # UDP sync can only carry the change when a reachable master has sync sending enabled
+        use_fan_out = (
+            CONFIG_STORE.settings().power_fan_out
+            or master_state is None
+            or not master_state.get('udpn', {}).get('send')
+        )
+
+        if use_fan_out:
+            active_devices = [device for device in naari_settings['devices'] if device['active']]
+            power_states = {
+                device['address']: (_latest_power_state(device['address'], polled_devices) or {}).get('on')
+                for device in active_devices
+            }
+
+            if not ctx.triggered_id == 'master-power-btn':
+                return _aggregate_power_color(power_states), False
 
-        udpn_enabled = next((device.get('data', None).get('state').get('udpn').get('send') for device in polled_devices if device['ip'] == master_device['address']), None)
-        if udpn_enabled is None:
-            return 'danger', False  # TODO: need popup window for this error.
+            # Anything lit -> room off, otherwise room on
+            system_power_on = not any(power_states.values())
+            confirmed = fan_out_power(system_power_on, active_devices, CONFIG_STORE.settings())
+            power_states = {address: (state or {}).get('on') for address, state in confirmed.items()}
 
-        is_power_on = next((device['data']['state']["on"] for device in polled_devices if device['ip'] == master_device['address']))
+            # Every device answered with its own state, nothing left to poll for
+            return _aggregate_power_color(power_states), False
+
+        is_power_on = master_state.get('on')
 
         # Initial button color value
         if not ctx.triggered_id == 'master-power-btn':
@@ -138,12 +145,56 @@ def global_controls_callback(app):
         # Toggle target power state
         # Not using API function call because intent is to use Master Sync device
         system_power_on = not is_power_on       # Changes state
-        power_payload = {"on": system_power_on}
-        api_response = send_payload(master_device["address"], power_payload)
+        power_payload = {"on": system_power_on, "v": True}
+        try:
+            api_response = wait_result(
+                submit_payload(master_device["address"], power_payload),
+                master_device["address"],
+                CONFIG_STORE.settings()
+            )
+        except (PayloadRetryError, CommandQueueFull, CommandTimeout) as err:
+            LogManager.print_message(
+                "Master power toggle failed: %s",
+                err,
+                to_log=TO_LOG,
+                log_level=logging.ERROR
+            )
+            return 'danger', True
 
-        if api_response.status_code == 200 and is_power_on:     # Devices Off   pylint: disable=no-else-return
-            return 'secondary', True
-        elif api_response.status_code == 200 and not is_power_on:   # Devices On
-            return 'primary', True
-        else:
+        # Color follows the confirmed master state; the state cache was written through by send_payload.
+        # Synced devices only change through UDP, so a poll is still needed to pick them up.
+        state = confirmed_state(api_response)
+        if state is None and api_response.status_code == 200:
+            state = {"on": system_power_on}     # Older firmware ignoring "v"
+
+        if state is None:       # pylint: disable=no-else-return
             return 'danger', True  # Issues on response
+        elif state.get('on'):   # Devices On
+            return 'primary', True
+        else:                   # Devices Off
+            return 'secondary', True
+
+
+#---------------------- Helper Functions ---------------------------------------------------------#
+
+def _latest_power_state(address: str, polled_devices: list[dict]) -> dict | None:
+    """ Latest known `state` of a device: state confirmed by commands first, last poll otherwise. """
+    cached_state = DEVICE_STATE_CACHE.get_state(address)
+    if cached_state is not None:
+        return cached_state
+    return next(
+        (device['data'].get('state') for device in polled_devices
+         if device.get('ip') == address and isinstance(device.get('data'), dict)),
+        None
+    )
+
+
+def _aggregate_power_color(power_states: dict[str, bool | None]) -> str:
+    """ Master button color for the whole room: all on, all off, mixed, or any device unknown. """
+    if not power_states or any(is_on is None for is_on in power_states.values()):
+        return 'danger'
+    if all(power_states.values()):
+        return 'primary'    # Devices On
+    if not any(power_states.values()):
+        return 'secondary'  # Devices Off
+    return 'warning'        # Mixed room
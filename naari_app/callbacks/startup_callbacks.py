@@ -16,12 +16,13 @@ import time
 import os
 
 from dotenv import load_dotenv
-from dash import Input, Output
+from dash import Input, Output, State, no_update
 from dash.exceptions import PreventUpdate
 
 from naari_logging.naari_logger import LogManager
 from naari_app.util.wled_device_status import poll_all_devices
-from naari_app.util.util_functions import get_devices_ip, device_polled_data_mapping, naari_config_load
+from naari_app.util.util_functions import get_devices_ip, device_polled_data_mapping
+from naari_app.util.config_store import CONFIG_STORE
 from naari_app.util.initial_load import get_initial_load
 
 MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ",,"))
@@ -47,10 +48,10 @@ def startup_callbacks(app):
             Output('data_app_load_check', 'data')
         ],
         Input('url', 'pathname'),
-
+        State('naari_settings', 'data')
     )
     # TODO: see if there a way I can send a notification or make a UI change if an error occures.
-    def page_data_load(_):
+    def page_data_load(_, config_token):
         """
             Triggered on initial page load or reload.
 
@@ -63,12 +64,14 @@ def startup_callbacks(app):
         """
 
         naari_settings, cach_data, cach_presets = initial_load()
+        # The browser only keeps the version token; a matching token leaves the rendered UI alone
+        config_token = no_update if CONFIG_STORE.is_current(config_token) else CONFIG_STORE.token()
 
         for _ in range(2):
 
             if cach_data and all('data' in device for device in cach_data):
                 #return False, cach_data, True
-                return naari_settings, cach_data, cach_presets, False, True
+                return config_token, cach_data, cach_presets, False, True
             LogManager.print_message(
                 "Initial polling failed. RE-polling devices",
                 to_log=TO_LOG,
@@ -76,7 +79,7 @@ def startup_callbacks(app):
             )
 
             ip_list = get_devices_ip(
-                naari_devices=naari_settings.get('devices'),
+                naari_devices=naari_settings['devices'],
                 get_inactive=False
             )
             cach_data = poll_all_devices(device_address_list= ip_list)
@@ -88,14 +91,14 @@ def startup_callbacks(app):
             to_log=TO_LOG,
             log_level=logging.ERROR
         )
-        return naari_settings, None, None, True, False
+        return config_token, None, None, True, False
 
 
 #---------------Helper Function----------------#
 
 def initial_load():
     """ Loads the NAARI configuration and performs the first poll of all active devices. """
-    naari_settings = naari_config_load()
+    naari_settings = CONFIG_STORE.get()
 
     if not naari_settings:
         LogManager.print_message(
@@ -10,25 +10,23 @@ import logging
 import math
 
 from dotenv import load_dotenv
-from dash import Input, Output, State, ALL, ctx
+from dash import Input, Output, State, ALL, MATCH, ctx, no_update, ClientsideFunction
 from dash.exceptions import PreventUpdate
 
 from naari_logging.naari_logger import LogManager
-from naari_app.util.config_builder import NaariSettingsConfig
-from naari_app.util.wled_device_status import PollingThreadLock, get_devices_ip, poll_all_devices, poll_device_presets
-from naari_app.util.send_payload import send_device_power_update, PayloadRetryError
-from naari_app.util.util_functions import device_polled_data_mapping, is_device_active, get_device
+from naari_app.util.config_model import Settings
+from naari_app.util.wled_device_status import PollingThreadLock, poll_all_devices, poll_device_presets
+from naari_app.util.send_payload import confirmed_state, PayloadRetryError
+from naari_app.util.command_queue import submit_device_update, wait_result, CommandQueueFull, CommandTimeout
+from naari_app.util.device_state_cache import DEVICE_STATE_CACHE
+from naari_app.util.preset_cache import PRESET_CACHE
+from naari_app.util.util_functions import device_polled_data_mapping, changed_only
+from naari_app.util.config_store import CONFIG_STORE
 
 MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ",,"))
 load_dotenv(os.path.join(MAINDIR, ".env"))
 TO_LOG = int(os.getenv("LOGGING", "0")) == 1
 
-BUTTON_INDICATOR = {
-    True: "success",    #Onn
-    False: "danger",    #Off
-    None: 'secondary'   #Error
-}
-
 
 def status_callbacks(app):      # pylint: disable=too-many-statements
     """
@@ -59,40 +57,46 @@ def status_callbacks(app):      # pylint: disable=too-many-statements
 
 
     @app.callback(
-
-        Output('device_catch_data', 'data'),
+        [
+            Output('device_catch_data', 'data'),
+            Output('naari_settings', 'data', allow_duplicate=True)
+        ],
         Input('poll_interval', 'n_intervals'),
         [
-            State('naari_settings', 'data'),
-            State('device_catch_data', 'data')
-        ]
+            State('device_catch_data', 'data'),
+            State('naari_settings', 'data')
+        ],
+        prevent_initial_call=True
     )
     # TODO: see if there a way I can send a notification or make a UI change if an error occures.
-    def poll_devices(n_interval, naari_settings, previous_polled_data):
-        """ Callback function responsible for acquiring data from devices based on interval. Has built in idle throttle. """
+    def poll_devices(n_interval, previous_polled_data, config_token):
+        """
+            Callback function responsible for acquiring data from devices based on interval. Has built in idle throttle.
+            Also hands the browser the new config token when the config changed on the server (e.g. edited on disk).
+        """
 
         if not ctx.triggered:
             raise PreventUpdate
 
         poll_allowed = poll_interval_trigger(
             elapsed_interval=n_interval,
-            naari_config=naari_settings
+            settings=CONFIG_STORE.settings(),
+            device_count=len(CONFIG_STORE.index().devices)
         )
+        config_token = no_update if CONFIG_STORE.is_current(config_token) else CONFIG_STORE.token()
 
         if ctx.triggered_id == 'poll_interval' and poll_allowed:
-            ip_list = get_devices_ip(
-                naari_devices=naari_settings.get('devices'),
-                get_inactive=False
-            )
+            devices_index = CONFIG_STORE.index()
+            ip_list = devices_index.addresses(get_inactive=False)
 
             try:
                 catch_data = device_polled_data_mapping(
                     cach_data=poll_all_devices(device_address_list= ip_list),
-                    devices=naari_settings.get('devices')
+                    devices=devices_index.devices
                 )
                 if catch_data and all('data' in device for device in catch_data):
                     polling_error_counter = 0
-                    return catch_data
+                    return catch_data, config_token
             except PollingThreadLock as err:
                 polling_error_counter =+ 1
                 LogManager.print_message(
@@ -104,7 +108,9 @@ def status_callbacks(app):      # pylint: disable=too-many-statements
             if polling_error_counter >= 4:      # pylint: disable=possibly-used-before-assignment
                 # TODO: Create popup error?
                 pass
-            return previous_polled_data
+            return previous_polled_data, config_token
+        if config_token is not no_update:
+            return no_update, config_token
         raise PreventUpdate
 
 
@@ -124,13 +130,12 @@ def status_callbacks(app):      # pylint: disable=too-many-statements
         ],
         [
             State("devices_catch_presets", "data"),
-            State('brightness_chain_trigger', 'n_clicks'),
-            State('naari_settings', 'data')
+            State('brightness_chain_trigger', 'n_clicks')
         ],
         prevent_initial_call=True
     )
     # TODO: Improvements? Highlight mismatches or defualt sets on errors?
-    def preset_population(_app_load_check, _presets_refresh, cached_preset_data, brightness_chain_trigger, naari_settings):
+    def preset_population(_app_load_check, _presets_refresh, cached_preset_data, brightness_chain_trigger):
         """ Populate preset dropdowns for active devices and refresh data when triggered. Shows a popup to indicate success or failure during refresh. """
         if not ctx.triggered:
             raise PreventUpdate
@@ -143,10 +148,10 @@ def status_callbacks(app):      # pylint: disable=too-many-statements
         if ctx.triggered_id == 'refresh_button':
             reset_poll_interval = True
             try:
-                device_ips = get_devices_ip(naari_devices=naari_settings.get('devices'))
+                devices_index = CONFIG_STORE.index()
                 cached_preset_data = device_polled_data_mapping(
-                    cach_data=poll_device_presets(device_address_list = device_ips),
-                    devices=naari_settings.get('devices')
+                    cach_data=poll_device_presets(device_address_list = devices_index.addresses()),
+                    devices=devices_index.devices
                 )
                 time.sleep(1)   # to provide time for async polling to catch up if needed with UI.
                 popup_message = "Presets Re-Loaded"
@@ -177,178 +182,170 @@ def status_callbacks(app):      # pylint: disable=too-many-statements
                 popup_color = 'danger'
                 popup_message = "Preset refresh failed"
 
-        active_devices_presets = [
-            device_preset for device_preset in cached_preset_data
-            if is_device_active(
-                device_id=device_preset['device_id'],
-                devices=naari_settings['devices']
-            )
+        # Options aligned to the preset dropdowns currently mounted (one page of device cards),
+        # memoized per preset content in the preset cache (fed by the same fetches)
+        devices_index = CONFIG_STORE.index()
+        options_per_device = [
+            PRESET_CACHE.options(device['address']) if device else []
+            for device in (devices_index.device(item['id'].get('device_id')) for item in ctx.outputs_list[0])
         ]
-        options_per_device = [device_preset_list(device_preset) for device_preset in active_devices_presets]
 
         return options_per_device, cached_preset_data, popup_open, popup_color, popup_message, brightness_chain_trigger + 1, reset_poll_interval
 
 
     @app.callback(
-        [
-            Output({'type': 'power_button', 'device_id': ALL}, 'color'),
-            Output('reset_poll_interval', 'data', allow_duplicate=True)
-        ],
+        Output({'type': 'power_on', 'device_id': ALL}, 'data'),
         [
             Input('data_app_load_check', 'data'),
-            Input("device_catch_data", "data"),
-            Input({'type': 'power_button', 'device_id': ALL}, 'n_clicks')
+            Input("device_catch_data", "data")
         ],
         [
-            State("device_catch_data", "data"),
-            State('poll_interval', 'n_intervals'),
-            State('naari_settings', 'data'),
             State('elements_initialized', 'data'),
-            State('reset_poll_interval', 'data')
+            State({'type': 'power_on', 'device_id': ALL}, 'data')
         ],
         prevent_initial_call=True,
     )
-    def device_power_button_status(_page_load_check, polled_data, _button_click, cached_device_data, poll_interval,         # pylint: disable=possibly-used-before-assignment, too-many-positional-arguments, too-many-locals
-        naari_settings, elements_initialized, reset_poll_interval):
-        """ Updates the Power Button widget color based on if device is on or off. """
+    def device_power_states(_page_load_check, polled_data, elements_initialized, current_power_states):
+        """
+            Feeds each mounted device's `power_on` store (True/False/None) from the polled data, on load and every poll.
+            Only the stores whose state changed are written; the button colors follow their store.
+        """
         # Nothing polled yet? Don’t render.
-        if not cached_device_data or not isinstance(cached_device_data, list):
+        if not polled_data or not isinstance(polled_data, list):
             LogManager.print_message(
                 "No polled data to determine power status:: %s",
-                cached_device_data,
+                polled_data,
                 to_log=TO_LOG,
                 log_level=logging.ERROR
             )
             raise PreventUpdate
 
-        if not ctx.triggered:
-            raise PreventUpdate
-
-        if not elements_initialized:
+        if not ctx.triggered or not elements_initialized:
             raise PreventUpdate
 
-        triggered_id = ctx.triggered_id
+        devices_index = CONFIG_STORE.index()
 
-        if isinstance(triggered_id, dict) and triggered_id['type'] == 'power_button':   # Button Click / Manual Entry
-            devices_cach_data = cached_device_data
-            target_device = get_device(
-                devices=naari_settings['devices'],
-                device_id=triggered_id['device_id']
-            )
-        elif triggered_id == 'data_app_load_check':     # Initial Loads
-            devices_cach_data = cached_device_data
-            target_device = None
-        elif triggered_id == 'device_catch_data':       # For Poll-Intervals
-            devices_cach_data = polled_data
-            target_device = None
-        else:
-            raise PreventUpdate
-
-        # UI order for power buttons (pattern-matched ALL group)
-        # NOTE: ctx.inputs_list[2] corresponds to Input({'type': 'power_button'}, 'n_clicks')
-        power_inputs_group = ctx.inputs_list[2]
-        ui_devices_order = [
-            ui_device['id'].get('device_id', 0) for ui_device in power_inputs_group
-            if isinstance(ui_device['id'], dict)
-            and ui_device['id'].get('type') == 'power_button'
-        ]
-
-        # Filtering only active running. Needed from page reload or initial App startup.
+        # Safely extract on/off state of active devices
         # Note: Interval Polling devices will have only active data from active set devices
-        active_ui_devices  = [
-            data for data in devices_cach_data
-            if is_device_active(
-                device_id=data.get('device_id'),
-                devices=naari_settings.get('devices')
-            )
-        ]
-
-        # Safely extract on/off state
         # {device_id: True/False/None}
         indicator_status = {
             entry.get('device_id'): (
                 entry.get('data', {}).get('state', {}).get('on')
                 if isinstance(entry.get('data'), dict) else None
             )
-            for entry in active_ui_devices
+            for entry in polled_data
+            if devices_index.is_active(entry.get('device_id'))
         }
 
-        # If a button was clicked, toggle that device and update the map
-        if target_device and poll_interval:
-            target_id = target_device['id']
-            if indicator_status[target_id] is not None:
-                new_state = not indicator_status[target_id]
-                try:
-                    send_device_power_update(
-                        status_update=new_state,
-                        device_info=target_device,
-                        ui_settings=naari_settings['ui_settings']
-                    )
-                    indicator_status[target_id] = new_state
-                except PayloadRetryError as err:
-                    # Keep previous state (color) and log rich context
-                    LogManager.print_message(
-                        "Power toggle failed after %s attempts (url=%s): %s",
-                        getattr(err, "attempts", "n/a"),
-                        getattr(err, "url", "n/a"),
-                        getattr(err, "last_exception", err),
-                        to_log=TO_LOG,
-                        log_level=logging.ERROR
-                    )
-                    # TODO: add trigger indicating what device had an error?
-                    print(err)
+        # Map in exact UI order; None when state missing
+        power_states = [indicator_status.get(item['id'].get('device_id')) for item in ctx.outputs_list]
 
-                except Exception:       # pylint: disable=broad-exception-caught
-                    # Truly unexpected—log & keep previous state
-                    LogManager.print_message(
-                        "Unexpected error toggling device %s",
-                        target_id,
-                        to_log=TO_LOG,
-                        log_level=logging.ERROR
-                    )
-                    # leave state_map[target_id] unchanged
-                reset_poll_interval = True  # Resets polling intervals after push event
+        return changed_only(power_states, current_power_states)
 
-        # Map in exact UI order; safe fallback when state missing/None
-        power_buttons_color = [BUTTON_INDICATOR.get(indicator_status[device_id], 'secondary') for device_id in ui_devices_order ]
 
-        return power_buttons_color, reset_poll_interval
+    @app.callback(
+        Output({'type': 'power_on', 'device_id': MATCH}, 'data', allow_duplicate=True),
+        Input({'type': 'power_button', 'device_id': MATCH}, 'n_clicks'),
+        [
+            State({'type': 'power_on', 'device_id': MATCH}, 'data'),
+            State('elements_initialized', 'data')
+        ],
+        prevent_initial_call=True,
+    )
+    def device_power_toggle(button_click, shown_power_state, elements_initialized):
+        """
+            Toggles the power of the clicked device and stores the state it confirmed.
+            Runs per device: a click only waits on its own device.
+        """
+        if not button_click or not elements_initialized or not isinstance(ctx.triggered_id, dict):
+            raise PreventUpdate
 
+        target_id = ctx.triggered_id['device_id']
+        target_device = CONFIG_STORE.index().device(target_id)
+        if target_device is None:
+            raise PreventUpdate
 
-#---------- Helper Functions------------------------#
+        # Server cache holds state confirmed by earlier clicks, the browser store only has the last poll
+        latest_state = DEVICE_STATE_CACHE.get_state(target_device['address'])
+        is_on = latest_state.get('on') if latest_state is not None else shown_power_state
+        if is_on is None:
+            raise PreventUpdate     # state unknown (device down), nothing to toggle
+
+        new_state = not is_on
+        try:
+            ui_settings = CONFIG_STORE.settings()
+            response = wait_result(
+                submit_device_update(payload={"on": new_state}, device_info=target_device, ui_settings=ui_settings),
+                target_device['address'],
+                ui_settings
+            )
+            # Color reflects what the device confirmed, not what was asked for
+            state = confirmed_state(response)
+            return state.get('on') if state else new_state
+        except PayloadRetryError as err:
+            # Keep previous state (color) and log rich context
+            LogManager.print_message(
+                "Power toggle failed after %s attempts (url=%s): %s",
+                getattr(err, "attempts", "n/a"),
+                getattr(err, "url", "n/a"),
+                getattr(err, "last_exception", err),
+                to_log=TO_LOG,
+                log_level=logging.ERROR
+            )
+            # TODO: add trigger indicating what device had an error?
 
-# TODO: move to Util? using in config as well
-def device_preset_list(device_presets):
-    """ Requires results from Polling Presets off devices"""
-    #presets = [presets.get('data', None) for presets in device_preset if presets['ip'] == ip_name][0]
-    presets = device_presets.get('data', None)
-    if not presets:
-        return []
-    preset_sorted = {
-        int(k): v
-        for k, v in sorted(
-            ((k, val.get('n', None)) for k, val in presets.items()),
-            key=lambda item: (item[1] is None, str(item[1]).lower())
-        )
-    }
-    return [f"{key}: {value}" for key, value in preset_sorted.items()]
+        except CommandQueueFull as err:
+            # Device is backed up with earlier commands; keep previous state
+            LogManager.print_message(
+                "Power toggle skipped: %s",
+                err,
+                to_log=TO_LOG,
+                log_level=logging.WARNING
+            )
 
+        except CommandTimeout as err:
+            # Still queued / in flight: show the state as pending, the next poll picks up the outcome
+            LogManager.print_message(
+                "Power toggle not confirmed yet: %s",
+                err,
+                to_log=TO_LOG,
+                log_level=logging.WARNING
+            )
+            return None
+
+        except Exception:       # pylint: disable=broad-exception-caught
+            # Truly unexpected—log & keep previous state
+            LogManager.print_message(
+                "Unexpected error toggling device %s",
+                target_id,
+                to_log=TO_LOG,
+                log_level=logging.ERROR
+            )
+        return is_on if is_on != shown_power_state else no_update
 
-def poll_interval_trigger(elapsed_interval: int, naari_config: NaariSettingsConfig) -> bool:
+
+    # Power button color follows the device's `power_on` store (browser side)
+    app.clientside_callback(
+        ClientsideFunction(namespace='naari', function_name='power_button_color'),
+        Output({'type': 'power_button', 'device_id': MATCH}, 'color'),
+        Input({'type': 'power_on', 'device_id': MATCH}, 'data'),
+        prevent_initial_call=True
+    )
+
+
+#---------- Helper Functions------------------------#
+
+def poll_interval_trigger(elapsed_interval: int, settings: Settings, device_count: int) -> bool:
     """
         Determine whether a poll event should trigger based on elapsed time,
         base polling rate, and number of devices.
     """
 
     #if elapsed_interval > 0:
-    # safely pull ui_settings
-    ui_settings = naari_config.get("ui_settings", {})
-
-    polling_rate = ui_settings.get("polling_rate",3).get("value", 3)
-    max_time = ui_settings.get("max_time", 3600)
-    min_time = ui_settings.get("min_time", 60)
+    polling_rate = settings.polling_rate
+    max_time = settings.setting("max_time", 3600)        # optional, not part of the schema
+    min_time = settings.setting("min_time", 60)
 
-    device_count = len(naari_config.get("devices", []))
     elapsed_time = polling_rate * elapsed_interval
 
     # staged growth thresholds (seconds : multiplier)
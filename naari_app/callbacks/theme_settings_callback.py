@@ -10,16 +10,13 @@ configuration interface — no live device commands are issued.
 """
 
 import dash.exceptions
-from dash import Input, Output, State, html, ALL, ctx, MATCH
+from dash import Input, Output, State, ALL, ctx, MATCH, ClientsideFunction, Patch
 
-from naari_app.callbacks.status_callbacks import device_preset_list
 from naari_app.modals.theme_settings_tab import theme_card
 from naari_app.util.config_builder import NaariSettingsConfig
-
-
-# TODO: move this into master call class?
-COLLAPSE_OPEN_SYMBOL = html.I(className="bi bi-caret-left-fill fs-5")
-COLLAPSE_CLOSE_SYMBOL = html.I(className="bi bi-caret-down-fill fs-5")
+from naari_app.util.config_store import CONFIG_STORE
+from naari_app.util.preset_cache import PRESET_CACHE
+from naari_app.util.util_functions import stack_index
 
 
 def theme_settings_callback(app):
@@ -32,73 +29,63 @@ def theme_settings_callback(app):
             - Enabling or disabling theme name editing
             - Adding or removing theme cards from the stack
     """
-    @app.callback(
+    # Toggle a theme card collapse and its caret (odd clicks = closed).
+    app.clientside_callback(
+        ClientsideFunction(namespace='naari', function_name='theme_collapse'),
         [
-            Output({'type': 'theme_collapse_element', 'theme_id': ALL}, 'is_open'),
-            Output({'type': 'theme_card_collapse_button', 'theme_id': ALL}, 'children'),
-            Output({'type': 'theme_device_preset_selection', 'theme_id': ALL, 'device_id': ALL}, 'options'),
-            Output({'type': 'theme_device_preset_selection', 'theme_id': ALL, 'device_id': ALL}, 'value')
+            Output({'type': 'theme_collapse_element', 'theme_id': MATCH}, 'is_open'),
+            Output({'type': 'theme_card_collapse_button', 'theme_id': MATCH}, 'children')
         ],
-        Input({'type': 'theme_card_collapse_button', 'theme_id': ALL}, 'n_clicks'),
+        Input({'type': 'theme_card_collapse_button', 'theme_id': MATCH}, 'n_clicks')
+    )
+
+    @app.callback(
         [
-            State('devices_catch_presets', 'data'),
-            State('naari_settings', 'data')
-        ]
+            Output({'type': 'theme_device_preset_selection', 'theme_id': MATCH, 'device_id': ALL}, 'options'),
+            Output({'type': 'theme_device_preset_selection', 'theme_id': MATCH, 'device_id': ALL}, 'value')
+        ],
+        Input({'type': 'theme_card_collapse_button', 'theme_id': MATCH}, 'n_clicks')
     )
-    def theme_device_preset_viewable(pressed_collapse_buttons_value, cach_devices_preset, naari_settings):
-        """ Toggle theme card collapses and populate per‑device preset dropdowns for each theme. """
-        if not ctx.triggered:
+    def theme_device_preset_viewable(collapse_clicks):
+        """
+            Populate the per-device preset dropdowns of the theme card being opened.
+            Only that card is touched, and the option lists are the memoized ones from the preset cache.
+        """
+        if not ctx.triggered or not isinstance(ctx.triggered_id, dict):
             raise dash.exceptions.PreventUpdate
 
-        # Snapshot of current UI state to align mappings with the active layout
-        widget_layout = ctx.inputs_list[0]
-
-        collapse_clicks_mapping = {element['id']['theme_id']: element['value'] for element in widget_layout}
-
-        current_config_devices_list = [device['id'] for device in naari_settings['devices']]
-
-        device_current_presets_mapping = {preset_set['device_id']: device_preset_list(preset_set) for preset_set in cach_devices_preset if preset_set['device_id'] in current_config_devices_list}
-
-        dropdown_options_mapping = {element['id']['theme_id']: device_current_presets_mapping for element in widget_layout}
-
-        is_open_list = [not bool(value % 2) for value in collapse_clicks_mapping .values()]     # pylint suggestion.
-        button_children_list  = [COLLAPSE_CLOSE_SYMBOL if value % 2 else COLLAPSE_OPEN_SYMBOL for value in collapse_clicks_mapping .values()]
+        # Closing (odd clicks) leaves the dropdowns as they are
+        if (collapse_clicks or 0) % 2:
+            raise dash.exceptions.PreventUpdate
 
-        # Lists needs to be flatten in order for Dash to output.
-        dropdowns_options_flatten = [
-            presets
-            for device_presets in dropdown_options_mapping.values()
-            for presets in device_presets.values()
-        ]
+        theme_id = ctx.triggered_id['theme_id']
+        devices_index = CONFIG_STORE.index()
 
-        dropdown_values_mapping = compute_dropdown_values_mapping(dropdown_options_mapping, naari_settings)
+        # Snapshot of current UI state to align options with the rows of this card
+        dropdown_options = {}
+        for element in ctx.outputs_list[0]:
+            device = devices_index.device(element['id']['device_id'])
+            dropdown_options[element['id']['device_id']] = PRESET_CACHE.options(device['address']) if device else []
 
-        # Flatten values to mirror the same theme/device order used for options:
-        dropdown_values = [
-            dropdown_values_mapping[theme_id].get(device_id, "")
-            for theme_id, device_map in dropdown_options_mapping.items()
-            for device_id in device_map.keys()
-        ]
+        dropdown_values = compute_dropdown_values_mapping({theme_id: dropdown_options}, CONFIG_STORE.get())[theme_id]
 
         # Handle inactive/down devices: keep existing selection if no options present.
         #   Prevents blanks from being saved by accident.
-        for index, selections in enumerate(dropdowns_options_flatten):
-            if len(selections) == 0:
-                dropdowns_options_flatten[index] = [dropdown_values[index]] if len(dropdown_values[index]) else ""
+        options_out, values_out = [], []
+        for device_id, options in dropdown_options.items():
+            value = dropdown_values.get(device_id, "")
+            options_out.append(options if options else ([value] if value else []))
+            values_out.append(value)
 
-        # TODO: Have this as a log inorder to populate list values in the background?
-        return is_open_list, button_children_list, dropdowns_options_flatten, dropdown_values
+        return options_out, values_out
 
 
-    @app.callback(
+    # Makes the theme name field editable if the edit toggle is on, otherwise keeps it read-only.
+    app.clientside_callback(
+        ClientsideFunction(namespace='naari', function_name='update_theme_name'),
         Output({'type': 'theme_name_input', 'theme_id': MATCH}, 'readonly'),
         Input({'type': 'theme_name_edit', 'theme_id': MATCH}, 'value')
     )
-    def update_theme_name(title_switch):
-        """ Makes the theme name field editable if the edit toggle is on, otherwise keeps it read-only. """
-        if title_switch:
-            return False
-        return True
 
     @app.callback(
         Output('theme_cards_stack', 'children', allow_duplicate=True),
@@ -106,23 +93,25 @@ def theme_settings_callback(app):
             Input('theme_add_button', 'n_clicks'),
             Input({'type': 'theme_delete', 'theme_id': ALL}, 'n_clicks')
         ],
-        [
-            State('theme_cards_stack', 'children'),
-            # Doesn't matter what to use as long as it has 'theme_id'
-            Input({'type': 'theme_delete', 'theme_id': ALL}, 'id'),
-            State('naari_settings', 'data'),
-        ],
+        # Card ids in stack order (the stack holds only theme cards), the stack itself is never sent over
+        State({'type': 'theme_card', 'theme_id': ALL, 'theme_card_added': ALL}, 'id'),
     )
-    def add_remove_theme_card(add_mode_click, remove_mode_clicks, current_children_set, removed_widgets, naari_settings):
-        """Add a new theme card or remove an existing one in the Theme Settings stack."""
+    def add_remove_theme_card(add_mode_click, remove_mode_clicks, card_ids):    # pylint: disable=unused-argument
+        """
+            Add a new theme card or remove an existing one in the Theme Settings stack.
+            Returns a `Patch` (append / delete at index) so only the changed card travels.
+        """
         if not ctx.triggered:
             raise dash.exceptions.PreventUpdate
 
+        naari_settings = CONFIG_STORE.get()
+
         triggered = ctx.triggered_id
+        stack_patch = Patch()
 
         if triggered == 'theme_add_button' and add_mode_click:          # pylint: disable=no-else-return
-            existing_theme_ids = (widget['theme_id'] for widget in removed_widgets )
-            next_id = (max(existing_theme_ids) + 1) if existing_theme_ids else 1        # pylint: disable=using-constant-test
+            existing_theme_ids = [card_id['theme_id'] for card_id in card_ids]
+            next_id = (max(existing_theme_ids) + 1) if existing_theme_ids else 1
 
             default_presets_for_system_devices = [
                 {
@@ -146,27 +135,17 @@ def theme_settings_callback(app):
                 init_load=False
             )
 
-            # Allows for a safe appendage of card to stack layout.
-            render_set = current_children_set + [new_card]
-
-            return render_set
+            stack_patch.append(new_card)
+            return stack_patch
 
         elif isinstance(triggered, dict) and triggered['type'] == 'theme_delete':        # pylint: disable=no-else-return
-            theme_to_remove = triggered['theme_id']
-
-            updated_children = []
-            for child in current_children_set:
-                if (
-                        isinstance(child, dict) and
-                        'props' in child and
-                        child['props'].get('id', {}).get('type') == 'theme_card' and
-                        child['props'].get('id', {}).get('theme_id') == theme_to_remove
-                ):
-                    continue  # Skip this card (i.e., remove it)
-                updated_children.append(child)
-
-            return updated_children
-        return current_children_set
+            removed_index = stack_index(card_ids, 'theme_id', triggered['theme_id'])
+            if removed_index is None:
+                raise dash.exceptions.PreventUpdate
+
+            del stack_patch[removed_index]
+            return stack_patch
+        raise dash.exceptions.PreventUpdate
 
 #-------------------------------------Helper Functions----------------------------------------------#
 
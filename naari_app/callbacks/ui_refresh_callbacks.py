@@ -5,15 +5,27 @@ This includes the following functionalities:
     - Rendering/updating layout content
     - Updating theme-related dropdowns or containers
     - Reflecting changes made in the Config Modal when updated
+
+After the first render, a new config version is applied as a diff against the version the UI was rendered from:
+only the device cards and modal cards that changed are patched in, everything else keeps its client-side state.
 """
 
 from __future__ import annotations
 
-from dash import Input, Output
+from difflib import SequenceMatcher
+
+from dash import Input, Output, State, ALL, Patch, no_update
+from dash.exceptions import PreventUpdate
 
-from naari_app.ui_parts.main_content import main_content
+from naari_app.ui_parts.main_content import main_content, device_card, filter_devices, page_count, page_devices
 from naari_app.modals.config_modal import config_modal
-from naari_app.util.config_builder import NaariSettingsConfig
+from naari_app.modals.device_tab import device_card as device_settings_card
+from naari_app.modals.theme_settings_tab import theme_card
+from naari_app.modals.general_settings_tab import general_settings_rows
+from naari_app.util.config_builder import DeviceConfig, NaariSettingsConfig
+from naari_app.util.config_store import CONFIG_STORE, ConfigToken
+from naari_app.util.config_watcher import ConfigDiff, diff_configs
+from naari_app.util.render_cache import RENDER_CACHE
 
 
 def layout_refresh_callbacks(app):
@@ -30,15 +42,185 @@ def layout_refresh_callbacks(app):
             Output('room-theme-mode', 'options'),
             Output('app_main_content', 'children'),
             Output('config_modal_container', 'children'),
-            Output('init_brightness_chain_trigger', 'data')
+            Output('rendered_config', 'data'),
+            Output('ui_patch_request', 'data')
         ],
         Input('naari_settings', 'data'),
+        State('rendered_config', 'data')
     )
-    def ui_updated(naari_settings: NaariSettingsConfig):
+    def ui_updated(_config_token: ConfigToken, rendered_hash: str | None):
         """
-           Rebuild UI sections when `naari_settings` changes. Normally after Config Save.
+           Rebuild UI sections when the config version token in `naari_settings` changes. Normally after Config Save.
+           First render (or a rendered version no longer known): full sections from the render cache.
+           Otherwise hands the old/new versions to `ui_patch`, which only touches what changed.
         """
+        naari_settings = CONFIG_STORE.get()
+        content_hash = CONFIG_STORE.token()['hash']
+        if rendered_hash == content_hash:
+            raise PreventUpdate
+
         themes = naari_settings.get('themes', [])
         theme_options = [{'label': theme['name'], 'value': theme['id']} for theme in themes if themes]
 
-        return theme_options, main_content(naari_settings.get('devices', [])), config_modal(naari_settings), True
+        if rendered_hash is None or CONFIG_STORE.config_for(rendered_hash) is None:
+            return (
+                theme_options,
+                RENDER_CACHE.render('main_content', lambda: main_content(CONFIG_STORE.get().get('devices', []))),
+                RENDER_CACHE.render('config_modal', config_modal),
+                content_hash,
+                no_update
+            )
+
+        return theme_options, no_update, no_update, content_hash, {"old": rendered_hash, "new": content_hash}
+
+
+    @app.callback(
+        [
+            Output('main_content_stack', 'children', allow_duplicate=True),
+            Output('device_page', 'max_value', allow_duplicate=True),
+            Output('device_page', 'active_page', allow_duplicate=True),
+            Output('devices_stack', 'children', allow_duplicate=True),
+            Output('theme_cards_stack', 'children', allow_duplicate=True),
+            Output('general_settings_stack', 'children', allow_duplicate=True),
+            Output('config_tabs_loaded', 'data', allow_duplicate=True),
+            Output('data_app_load_check', 'data', allow_duplicate=True)
+        ],
+        Input('ui_patch_request', 'data'),
+        [
+            State('device_filter', 'value'),
+            State('device_page', 'active_page'),
+            State('config_tabs_loaded', 'data'),
+            State({'type': 'device_card_settings', 'device_id': ALL, 'device_added': ALL}, 'id'),
+            State({'type': 'theme_card', 'theme_id': ALL, 'theme_card_added': ALL}, 'id'),
+            State('elements_initialized', 'data')
+        ],
+        prevent_initial_call=True
+    )
+    def ui_patch(patch_request, query, active_page, loaded_tabs, device_card_ids, theme_card_ids, elements_initialized):     # pylint: disable=too-many-arguments, too-many-positional-arguments
+        """
+            Apply a config change to the rendered UI as `Patch` operations:
+                - device cards of the shown page: insert / delete / replace only the cards that differ
+                - modal tabs already built: replace changed cards, drop removed ones, add new ones
+            Re-signals the page load when device cards were (re)mounted, so they get their presets and states.
+        """
+        old_config = CONFIG_STORE.config_for((patch_request or {}).get('old'))
+        new_config = CONFIG_STORE.config_for((patch_request or {}).get('new'))
+        if old_config is None or new_config is None:
+            raise PreventUpdate
+
+        diff = diff_configs(old_config, new_config)
+        # (device cards patch, page count, active page)
+        page_patch = _main_content_patch(old_config, new_config, query, active_page)
+        # (devices, themes, general stack patches, tabs still built)
+        modal_tabs = _modal_patches(list(loaded_tabs or []), device_card_ids, theme_card_ids, new_config, diff)
+
+        cards_mounted = page_patch[0] is not no_update and elements_initialized
+        return (*page_patch, *modal_tabs, True if cards_mounted else no_update)
+
+
+#---------------------- Helper Functions ---------------------------------------------------------#
+
+def _main_content_patch(old_config: NaariSettingsConfig, new_config: NaariSettingsConfig, query, active_page):
+    """ (device cards patch, page count, active page) for the page shown, before and after the change. """
+    old_devices = filter_devices(old_config.get('devices', []), query)
+    new_devices = filter_devices(new_config.get('devices', []), query)
+    total = page_count(len(new_devices))
+    if (active_page or 1) > total:
+        # Page no longer exists: moving the pagination re-renders through `device_list_view`
+        return no_update, total, total
+    return _page_patch(page_devices(old_devices, active_page), page_devices(new_devices, active_page)), total, no_update
+
+
+def _modal_patches(loaded_tabs: list[str], device_card_ids: list[dict], theme_card_ids: list[dict],
+                   new_config: NaariSettingsConfig, diff: ConfigDiff):
+    """ (devices, themes, general) stack patches for the modal tabs already built, and the tabs still built. """
+    devices_patch = _devices_tab_patch(device_card_ids, new_config, diff) if 'devices' in loaded_tabs else no_update
+
+    themes_patch = no_update
+    if 'themes' in loaded_tabs:
+        if diff.added_devices or diff.removed_devices or diff.changed_devices:
+            # Every theme card has a row per device: rebuilt on next view instead
+            themes_patch = []
+            loaded_tabs.remove('themes')
+        else:
+            themes_patch = _themes_tab_patch(theme_card_ids, new_config, diff)
+
+    general_patch = no_update
+    if 'general' in loaded_tabs and diff.ui_settings_changed:
+        general_patch = general_settings_rows(new_config['ui_settings'])
+    return devices_patch, themes_patch, general_patch, loaded_tabs
+
+
+def _card_key(device: DeviceConfig) -> tuple[int, str]:
+    """ What a main content device card is rendered from. """
+    return device['id'], device.get('instance_name', '')
+
+
+def _page_patch(old_page: list[DeviceConfig], new_page: list[DeviceConfig]):
+    """ Patch turning the rendered page of device cards into the new one (no_update if nothing differs). """
+    opcodes = SequenceMatcher(
+        None, [_card_key(device) for device in old_page], [_card_key(device) for device in new_page], autojunk=False
+    ).get_opcodes()
+    if all(tag == 'equal' for tag, *_ in opcodes):
+        return no_update
+
+    page_patch = Patch()
+    # Last block first, so the indexes of the blocks before it stay valid
+    for tag, old_start, old_end, new_start, new_end in reversed(opcodes):
+        if tag == 'equal':
+            continue
+        if tag == 'replace' and old_end - old_start == new_end - new_start:
+            for offset, device in enumerate(new_page[new_start:new_end]):
+                page_patch[old_start + offset] = device_card(device)
+            continue
+        for index in reversed(range(old_start, old_end)):
+            del page_patch[index]
+        for offset, device in enumerate(new_page[new_start:new_end]):
+            page_patch.insert(old_start + offset, device_card(device))
+    return page_patch
+
+
+def _tab_patch(card_ids: list[dict], keys: tuple[str, str], entries: dict[int, dict], changed: frozenset, build):
+    """
+        Patch over a modal stack (card ids in stack order): removed entries deleted, changed or still
+        flagged as added cards replaced (they are saved now), entries without a card appended.
+        `keys` are the card id's (entry id key, added flag key).
+    """
+    key, added_key = keys
+    stack_patch = Patch()
+    touched = False
+    for index in reversed(range(len(card_ids))):
+        card_id = card_ids[index]
+        entry = entries.get(card_id[key])
+        if entry is None:
+            del stack_patch[index]
+            touched = True
+        elif card_id[key] in changed or card_id.get(added_key) is False:
+            stack_patch[index] = build(entry)
+            touched = True
+
+    shown = {card_id[key] for card_id in card_ids}
+    for entry_id, entry in entries.items():
+        if entry_id not in shown:
+            stack_patch.append(build(entry))
+            touched = True
+    return stack_patch if touched else no_update
+
+
+def _devices_tab_patch(card_ids: list[dict], new_config: NaariSettingsConfig, diff: ConfigDiff):
+    return _tab_patch(
+        card_ids, ('device_id', 'device_added'),
+        {device['id']: device for device in new_config.get('devices', [])},
+        diff.changed_devices,
+        lambda device: device_settings_card(device_info=device, init_loaded=True)
+    )
+
+
+def _themes_tab_patch(card_ids: list[dict], new_config: NaariSettingsConfig, diff: ConfigDiff):
+    devices = new_config.get('devices', [])
+    return _tab_patch(
+        card_ids, ('theme_id', 'theme_card_added'),
+        {theme['id']: theme for theme in new_config.get('themes', [])},
+        diff.changed_themes,
+        lambda theme: theme_card(theme_info=theme, devices=devices, readonly=False, init_load=True)
+    )
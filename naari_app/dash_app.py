@@ -25,7 +25,10 @@ from naari_logging.naari_logger import LogManager
 logger = LogManager()
 logger.setup_file_logging()
 
-from naari_app.util.util_functions import naari_config_load
+from naari_app.util.config_builder import ConfigValidationError
+from naari_app.util.config_store import CONFIG_STORE
+from naari_app.util.config_watcher import CONFIG_WATCHER
+from naari_app.util.render_cache import RENDER_CACHE
 
 from naari_app.ui_parts.navbar import navbar
 from naari_app.ui_parts.sidebar import sidebar
@@ -68,7 +71,7 @@ def app_layout():
         A Dash Bootstrap Container containing the entire app layout.
     """
 
-    naari_settings = naari_config_load()
+    naari_settings = CONFIG_STORE.get()
 
     return dbc.Container(
         id = "app-container",
@@ -78,11 +81,13 @@ def app_layout():
                 children=[
                     dcc.Location(id='url', refresh=False),
                     # converting interval from sec -> ms
-                    dcc.Interval(id='poll_interval', interval=(naari_settings['ui_settings']['polling_rate']['value'] * 1000), n_intervals=0, disabled=True),
+                    dcc.Interval(id='poll_interval', interval=(CONFIG_STORE.settings().polling_rate * 1000), n_intervals=0, disabled=True),
                     dcc.Store("reset_poll_interval", data=False, storage_type='session'),
 
                     # Hidden stores (default shapes matter for downstream callbacks)
-                    dcc.Store(id='naari_settings', data=naari_settings, storage_type='session'),
+                    dcc.Store(id='naari_settings', data=CONFIG_STORE.token(), storage_type='session'),   # config version token
+                    dcc.Store(id='rendered_config', data=None),     # config hash the shown UI was built from
+                    dcc.Store(id='ui_patch_request', data=None),    # {"old", "new"} hashes, UI patched by diff
                     dcc.Store(id ='initial_device_catch_data', data=None, storage_type='session'),
                     dcc.Store(id='device_catch_data', data=None, storage_type='session'),
                     dcc.Store(id='devices_catch_presets', data=None, storage_type='session'),
@@ -90,17 +95,14 @@ def app_layout():
                     # For Initial Calls, Chains, and preventions
                     dcc.Store(id='elements_initialized', data=None, storage_type='session'),
                     dcc.Store(id='data_app_load_check', data=False, storage_type='session'),
-                    dcc.Store(id='init_brightness_chain_trigger', data=None, storage_type='session'),
                     html.Div(id='brightness_chain_trigger', n_clicks=0),
 
-                    dcc.Store(id='auto_mode', data=False),  # Initial_Auto_Mode
-
                     refresh_popup()
                 ]
             ),
             html.Div(
                 id='config_modal_container',
-                children=config_modal(naari_settings)
+                children=RENDER_CACHE.render('config_modal', config_modal)
             ),
             html.Div(navbar()),
             dbc.Row(children=[
@@ -127,6 +129,7 @@ def dash_app():
         name="WLEDController",
         update_title='WLED Controller',
         prevent_initial_callbacks="initial_duplicate",
+        assets_folder=os.path.join(os.path.dirname(__file__), 'assets'),    # clientside callbacks (naari_clientside.js)
         external_stylesheets=[
             dbc.themes.DARKLY,
             "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/bootstrap-icons.css"
@@ -170,6 +173,8 @@ def dash_app():
     device_settings_callback(app)
     general_settings_callback(app)
 
+    # Config edits made outside the app (on disk / in the database) are applied without a restart
+    CONFIG_WATCHER.start()
 
     # Segment bellow is currently the only way to prevent and setup a global prevent 'Initial Call' due to using dynamic widgets and callbacks
     @app.callback(
@@ -188,6 +193,14 @@ if __name__ == '__main__':
     try:
         the_app = dash_app()
         the_app.run(debug=DEBUG, host=HOST, port=PORT, threaded=True, use_reloader=RELOADER)
+    except ConfigValidationError as err:
+        logger.print_message(
+            "Config %s can't be used, fix it and restart >> %s",
+            CONFIG_STORE.file_path, err,
+            to_log=TO_LOG,
+            log_level=logging.CRITICAL
+        )
+        sys.exit(1)         # logger shut down by `finally`
     except Exception as err:        # pylint: disable=broad-exception-caught
 
         logger.print_message(
@@ -1,47 +1,78 @@
-""" Configuration modals: container and tabs for NAARI settings. """
+"""
+Configuration modals: container and tabs for NAARI settings.
+
+The modal is rendered as a skeleton: each tab holds its container with an empty stack.
+A tab's cards/rows are built the first time the tab is shown (`config_tab_content`) and kept
+for the rest of the session (`config_tabs_loaded` lists the tabs already filled in).
+"""
 
 import dash_bootstrap_components as dbc
+from dash import dcc
+
+from naari_app.util.config_builder import NaariSettingsConfig
 
-from naari_app.util.config_builder import NaariSettingsConfig, UISettings
+from naari_app.modals.general_settings_tab import general_settings_container, general_settings_rows
+from naari_app.modals.device_tab import device_tab_container, device_cards
+from naari_app.modals.theme_settings_tab import theme_tab_container, theme_cards
 
-from naari_app.modals.general_settings_tab import general_settings_container
-from naari_app.modals.device_tab import device_tab_container
-from naari_app.modals.theme_settings_tab import theme_tab_container
+__all__ = [
+    'CONFIG_TABS',
+    'config_modal',
+    'config_tab_content'
+]
 
-__all__ = ['config_modal']
+# tab_id -> stack filled in on first view
+CONFIG_TABS = {
+    'themes': 'theme_cards_stack',
+    'devices': 'devices_stack',
+    'general': 'general_settings_stack'
+}
 
 
-def _theme_tab(naari_settings: NaariSettingsConfig) -> dbc.Tab:
+def _theme_tab() -> dbc.Tab:
     """ Holds the different Themes widgets for the Model Config UI """
     return dbc.Tab(
         id = 'theme_tab',
+        tab_id='themes',
         label="Theme Modes",
-        children=theme_tab_container(
-            theme_list=naari_settings['themes'],
-            devices=naari_settings['devices']
-        )
+        children=theme_tab_container(theme_list=[], devices=[])
     )
 
-def _device_tab(naari_settings: NaariSettingsConfig):
+def _device_tab():
     """ Holds the Devices For the ego system with in the Model Config UI """
     return dbc.Tab(
         id='_device_mode_tab',
+        tab_id='devices',
         label='Devices Settings',
-        children=device_tab_container(naari_settings['devices'])
+        children=device_tab_container([])
     )
 
 
-def _general_settings_tab(naari_settings: UISettings) -> dbc.Tab:
+def _general_settings_tab() -> dbc.Tab:
     """ Holds the the different settings of the backend of NAARI. """
     return dbc.Tab(
         id='_other_tab',
+        tab_id='general',
         label='App General Settings',
-        children=general_settings_container(naari_settings)
+        children=general_settings_container({})
     )
 
 
-def config_modal(config_settings: NaariSettingsConfig) -> dbc.Modal:
-    """ Tab container that stores the different components/sections of the NAARI viewable configuration"""
+def config_tab_content(tab_id: str, config_settings: NaariSettingsConfig) -> list:
+    """ Cards/rows of one tab for the given config. """
+    match tab_id:
+        case 'themes':
+            return theme_cards(config_settings['themes'], config_settings['devices'])
+        case 'devices':
+            return device_cards(config_settings['devices'])
+        case 'general':
+            return general_settings_rows(config_settings['ui_settings'])
+        case _:
+            raise ValueError(f"Unknown config tab: {tab_id}")
+
+
+def config_modal() -> dbc.Modal:
+    """ Tab container that stores the different components/sections of the NAARI viewable configuration (tabs empty until viewed). """
     def _save_button():
         """ Modal UI element associated with saving current entries in the modal. """
         return dbc.Button(
@@ -68,11 +99,16 @@ def config_modal(config_settings: NaariSettingsConfig) -> dbc.Modal:
         children=[
             dbc.ModalHeader(dbc.ModalTitle("N.A.A.R.I Configer"), close_button=False),
             dbc.ModalBody([
-                dbc.Tabs([
-                    _theme_tab(config_settings),
-                    _device_tab(config_settings),
-                    _general_settings_tab(config_settings['ui_settings'])
-                ])
+                dbc.Tabs(
+                    id='config_modal_tabs',
+                    active_tab='themes',
+                    children=[
+                        _theme_tab(),
+                        _device_tab(),
+                        _general_settings_tab()
+                    ]
+                ),
+                dcc.Store(id='config_tabs_loaded', data=[])     # tab ids already built
             ]),
             dbc.ModalFooter(
                 children=[
@@ -7,6 +7,7 @@ from naari_app.util.config_builder import DeviceConfig
 
 __all__ = [
     'device_card',
+    'device_cards',
     'device_tab_container'
 ]
 
@@ -190,6 +191,11 @@ def device_card(device_info: DeviceConfig, init_loaded: bool) -> dbc.Card:
     )
 
 
+def device_cards(devices: list[DeviceConfig]) -> list[dbc.Card]:
+    """ Device Cards dictated by the config file. """
+    return [device_card(device, True) for device in devices]
+
+
 def device_tab_container(devices: list[DeviceConfig]) -> dbc.Container:
     """ HOlds the Device Cards dictated by the config file. """
     return dbc.Container(
@@ -200,7 +206,7 @@ def device_tab_container(devices: list[DeviceConfig]) -> dbc.Container:
             dbc.Stack(
                 id='devices_stack',
                 gap=3,
-                children=[ *[device_card(devices, True) for devices in devices] ]
+                children=device_cards(devices)
             ),
             dbc.Row([], class_name='my-2'),
             html.Div(
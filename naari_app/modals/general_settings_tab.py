@@ -5,7 +5,10 @@ from dash import dcc
 
 from naari_app.util.config_builder import UISettings
 
-__all__=['general_settings_container']
+__all__=[
+    'general_settings_rows',
+    'general_settings_container'
+]
 
 def _label_add_units(label_name) -> str:
     match label_name:
@@ -19,6 +22,8 @@ def _label_add_units(label_name) -> str:
             units = " (sec)"
         case "request_timeout":
             units = " (sec)"
+        case "rate_limit":
+            units = " (req/sec)"
         case _:
             units = ""
 
@@ -87,6 +92,11 @@ def _general_settings(setting_name: str, data: dict) -> dbc.Row:
     )
 
 
+def general_settings_rows(naari_settings: UISettings) -> list[dbc.Row]:
+    """ Setting rows dictated by the config file. """
+    return [_general_settings(setting_name=key, data=value) for key, value in naari_settings.items()]
+
+
 def general_settings_container(naari_settings: UISettings) -> dbc.Container:
     """ HOlds the general setting widgets dictated by the config file. """
     return dbc.Container(
@@ -96,13 +106,11 @@ def general_settings_container(naari_settings: UISettings) -> dbc.Container:
         children=[
             dbc.Row([], class_name='my-3'),
             dbc.Stack(
+                id='general_settings_stack',
                 direction="vertical",
                 gap=3,
                 class_name='d-flex justify-content-center',
-                children= [
-                    *[_general_settings(setting_name=key, data=value) for key, value in naari_settings.items()]
-                ]
-
+                children=general_settings_rows(naari_settings)
             )
 
         ]
@@ -7,6 +7,7 @@ from naari_app.util.config_builder import DeviceConfig, ThemeSelectionConfig, De
 
 __all__ = [
     'theme_card',
+    'theme_cards',
     'theme_tab_container'
 ]
 
@@ -151,6 +152,11 @@ def theme_card(theme_info: ThemeSelectionConfig, devices: list[DeviceConfig], re
     )
 
 
+def theme_cards(theme_list: list[ThemeSelectionConfig], devices: list[DeviceConfig]) -> list[dbc.Card]:
+    """ Theme Cards dictated by the config file (themes × devices widgets). """
+    return [theme_card(theme_info=theme, devices=devices, readonly=False, init_load=True) for theme in theme_list]
+
+
 def theme_tab_container(theme_list: list[ThemeSelectionConfig], devices: list[DeviceConfig]) -> dbc.Container:
     """ HOlds the Theme Cards dictated by the config file. """
     return dbc.Container(
@@ -161,9 +167,7 @@ def theme_tab_container(theme_list: list[ThemeSelectionConfig], devices: list[De
             dbc.Stack(
                 id='theme_cards_stack',
                 gap=3,
-                children=[
-                    *[theme_card(theme_info=theme, devices=devices, readonly=False, init_load=True) for theme in theme_list]
-                ]
+                children=theme_cards(theme_list, devices)
             ),
             dbc.Row([], class_name='my-2'),
             html.Div(
@@ -1,10 +1,14 @@
 """ Modular contains active device Widgets and Elements that is displayed on the bulk/front end of the Application. """
 
+import math
+
 import dash_bootstrap_components as dbc
 from dash import html, dcc
 
 from naari_app.util.config_builder import DeviceConfig
 
+DEVICES_PER_PAGE = 12      # device cards mounted at once
+
 # Notes for color usage:
 # - Primary   -> Active / Working
 # - Secondary -> Inactive / Not functional
@@ -150,20 +154,78 @@ def device_card(device: DeviceConfig) -> dbc.Card:
     )
 
 
+def filter_devices(naari_system_devices: list[DeviceConfig], query: str | None = None) -> list[DeviceConfig]:
+    """ Active devices whose name or address contains `query` (case-insensitive). """
+    query = (query or "").strip().lower()
+    return [
+        device for device in naari_system_devices
+        if device.get('active', False)
+        and (not query or query in device.get('instance_name', '').lower() or query in device.get('address', '').lower())
+    ]
+
+
+def page_count(device_count: int) -> int:
+    """ Number of device pages (at least one). """
+    return max(1, math.ceil(device_count / DEVICES_PER_PAGE))
+
+
+def page_devices(devices: list[DeviceConfig], page: int | None = 1) -> list[DeviceConfig]:
+    """ Devices of a single page (1-based, clamped to the available pages). """
+    page = min(max(page or 1, 1), page_count(len(devices)))
+    start = (page - 1) * DEVICES_PER_PAGE
+    return devices[start:start + DEVICES_PER_PAGE]
+
+
+def device_page(devices: list[DeviceConfig], page: int | None = 1) -> list[dbc.Card]:
+    """ Cards of a single page (1-based); only these are mounted, so `ALL` callbacks only see them. """
+    return [device_card(device) for device in page_devices(devices, page)]
+
+
+def _device_list_controls(page_total: int) -> dbc.Row:
+    """ Filter/search bar and page selection above the device cards. """
+    return dbc.Row(
+        class_name='my-2 g-2 align-items-center',
+        children=[
+            dbc.Col(
+                xs=12,
+                md=6,
+                children=dbc.Input(
+                    id='device_filter',
+                    type='search',
+                    placeholder='Filter devices by name or address',
+                    debounce=True,
+                    value=""
+                )
+            ),
+            dbc.Col(
+                xs=12,
+                md=6,
+                class_name='d-flex justify-content-md-end',
+                children=dbc.Pagination(
+                    id='device_page',
+                    max_value=page_total,
+                    active_page=1,
+                    fully_expanded=False,
+                    class_name='m-0'
+                )
+            )
+        ]
+    )
+
+
 def main_content(naari_system_devices: list[DeviceConfig]) -> dbc.Container:
-    """ Assemble the main content: one card per device (layout only; data via callbacks). """
+    """ Assemble the main content: filter bar, pagination and the first page of device cards (layout only; data via callbacks). """
+    devices = filter_devices(naari_system_devices)
     return dbc.Container(
         id ='main_content_container',
         fluid=True,
         children=[
-            dbc.Row([], class_name='my-2'),
+            _device_list_controls(page_count(len(devices))),
             dbc.Stack(
                 id='main_content_stack',
                 class_name='',
                 gap=4,
-                children=[
-                    *[device_card(device) for device in naari_system_devices if device.get('active', False)]
-                ]
+                children=device_page(devices, 1)
             )
         ]
-    )
\ No newline at end of file
+    )
@@ -17,6 +17,7 @@ __all__=['sidebar']
 # - Primary   -> Active / Working
 # - Secondary -> Inactive / Not functional
 # - Danger    -> Danger / Critical
+# - Warning   -> Mixed (Master Power fan-out, only some devices on)
 
 #----------------Button Functions--------------------#
 
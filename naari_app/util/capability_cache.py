@@ -0,0 +1,145 @@
+"""
+Modular contains the firmware capability cache (effect and palette names) shared by the whole fleet.
+
+`/json/eff` and `/json/pal` are multi-KB and only change with the firmware build, so they are
+fetched once per build (`info.ver`, `info.vid`) from any device running it, kept on disk,
+and reused for every device on that build across sessions.
+
+For now the cache is only populated (from the poller); nothing in the UI reads effect or palette names yet.
+"""
+
+from threading import Lock
+from typing import Any, Iterable
+import json
+import os
+import logging
+import time
+
+from dotenv import load_dotenv
+
+from naari_logging.naari_logger import LogManager
+from naari_app.util.config_writer import atomic_write
+
+__all__ = [
+    'CapabilityCache',
+    'CAPABILITY_CACHE',
+    'firmware_key'
+]
+
+MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+CAPABILITY_PATH = os.path.join(MAINDIR, "naari_capabilities.json")
+
+load_dotenv(os.path.join(MAINDIR, ".env"))
+TO_LOG = int(os.getenv("LOGGING", "0")) == 1
+
+
+def firmware_key(polled_entry: dict[str, Any]) -> str | None:
+    """ "<ver>|<vid>" of a polled `/json` entry, None when the device info is missing. """
+    info = (polled_entry or {}).get('data', {}).get('info', {})
+    if not info.get('ver') or info.get('vid') is None:
+        return None
+    return f"{info['ver']}|{info['vid']}"
+
+
+class CapabilityCache:
+    """
+        Thread-safe, disk backed store of {"<ver>|<vid>": {"effects": [...], "palettes": [...], "fetched": ts}}.
+        The file is read lazily on first use and rewritten whenever a new build is added.
+    """
+    def __init__(self, file_path: str = CAPABILITY_PATH):
+        self._lock = Lock()
+        self.file_path = file_path
+        self._builds: dict[str, dict[str, Any]] | None = None
+        self._fetching: dict[str, str] = {}       # build key -> address it is being fetched from
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        """ Reads the cache file once. Caller holds the lock. """
+        if self._builds is None:
+            try:
+                with open(self.file_path, 'r', encoding='utf-8') as file:
+                    builds = json.load(file)
+                self._builds = builds if isinstance(builds, dict) else {}
+            except FileNotFoundError:
+                self._builds = {}
+            except (OSError, json.JSONDecodeError) as e:
+                LogManager.print_message(
+                    "[capability_cache] Ignoring unreadable cache %s: %s",
+                    self.file_path, e,
+                    to_log=TO_LOG,
+                    log_level=logging.WARNING
+                )
+                self._builds = {}
+        return self._builds
+
+    def _persist(self) -> None:
+        """ Writes the cache file (atomic replace). Caller holds the lock. """
+        try:
+            atomic_write(self.file_path, json.dumps(self._builds, ensure_ascii=False).encode('utf-8'))
+        except OSError as e:
+            LogManager.print_message(
+                "[capability_cache] Failed to save %s: %s",
+                self.file_path, e,
+                to_log=TO_LOG,
+                log_level=logging.ERROR
+            )
+
+    def get(self, key: str | None) -> dict[str, Any] | None:
+        """ Capabilities of a firmware build, None if not cached yet. """
+        if key is None:
+            return None
+        with self._lock:
+            return self._load().get(key)
+
+    def for_device(self, polled_entry: dict[str, Any]) -> dict[str, Any] | None:
+        """ Capabilities of the build a polled device runs. """
+        return self.get(firmware_key(polled_entry))
+
+    def supports(self, polled_entry: dict[str, Any], effect: str | None = None, palette: str | None = None) -> bool:
+        """ Feature detection from cached names, no device round-trip. False while the build is unknown. """
+        capabilities = self.for_device(polled_entry)
+        if capabilities is None:
+            return False
+        return ((effect is None or effect in capabilities.get('effects', []))
+                and (palette is None or palette in capabilities.get('palettes', [])))
+
+    def claim_missing(self, polled_data: Iterable[dict[str, Any]]) -> dict[str, str]:
+        """
+            Builds seen in a poll that are neither cached nor already being fetched.
+            Returns {key: address of one device running it} and marks them as being fetched.
+        """
+        claimed = {}
+        with self._lock:
+            builds = self._load()
+            for entry in polled_data or []:
+                key = firmware_key(entry)
+                if key and key not in builds and key not in self._fetching and key not in claimed:
+                    claimed[key] = entry.get('ip')
+            self._fetching.update(claimed)
+        return claimed
+
+    def store(self, key: str, effects: list[str], palettes: list[str], address: str | None = None) -> bool:
+        """
+            Saves a fetched build and persists the cache.
+            With `address`, the result is dropped (False) when that device's claim was released meanwhile.
+        """
+        with self._lock:
+            if address is not None and self._fetching.get(key) != address:
+                return False
+            self._load()[key] = {"effects": list(effects), "palettes": list(palettes), "fetched": time.time()}
+            self._fetching.pop(key, None)
+            self._persist()
+        return True
+
+    def release(self, key: str) -> None:
+        """ A fetch failed; let the next poll claim the build again. """
+        with self._lock:
+            self._fetching.pop(key, None)
+
+    def forget(self, address: str) -> None:
+        """ Release the builds being fetched from a device (e.g. removed from config); another device may claim them. """
+        with self._lock:
+            for key in [key for key, fetching_from in self._fetching.items() if fetching_from == address]:
+                del self._fetching[key]
+
+
+CAPABILITY_CACHE = CapabilityCache()
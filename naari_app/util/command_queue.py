@@ -0,0 +1,388 @@
+"""
+Modular contains the per-device command queue used for every 'POST' sent to the WLED devices.
+
+Callbacks run on arbitrary Flask threads. Routing all commands through one ordered queue per device ensures:
+    - Commands reach a device in the order they were submitted
+    - Only one command is in flight per device at a time (ESP controllers have a tiny connection budget)
+    - A pending command is dropped when a later command of the same kind arrives (supersession)
+    - A bounded queue depth, so a stuck device pushes back instead of piling up work
+    - Bounded waits: a caller gives up on a command after its own retry budget (the command itself keeps going)
+    - Commands that would change nothing on the device (per the cached device state) are not sent
+    - Background polls/preset refreshes of a device give way while it has commands (see io_governor)
+"""
+
+from collections import deque
+from concurrent.futures import Future, CancelledError, TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from threading import Lock, Thread
+from typing import Any, Callable
+import asyncio
+import json
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+import requests
+
+from naari_logging.naari_logger import LogManager
+from naari_app.util.config_builder import DeviceConfig
+from naari_app.util.config_model import Settings
+from naari_app.util.send_payload import (send_device_update, send_payload, confirmed_state, PayloadRetryError,
+                                         REQUEST_TIMEOUT, RETRIES, RETRY_BACKOFF)
+from naari_app.util.device_state_cache import DEVICE_STATE_CACHE
+from naari_app.util.io_governor import DEVICE_IO_GOVERNOR
+
+__all__ = [
+    'CommandQueueFull',
+    'CommandTimeout',
+    'DeviceCommandQueue',
+    'COMMAND_QUEUE',
+    'command_kind',
+    'is_noop_command',
+    'submit_device_update',
+    'submit_payload',
+    'result_timeout',
+    'wait_result',
+    'log_command_failure',
+    'fan_out_power'
+]
+
+MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+load_dotenv(os.path.join(MAINDIR, ".env"))
+TO_LOG = int(os.getenv("LOGGING", "0")) == 1
+
+MAX_QUEUE_DEPTH = 8         # Pending (not in flight) commands allowed per device
+STATE_TRUST_SECONDS = 15    # How old a cached device state may be and still be used to skip a command
+
+# Keys that only steer how a command is delivered, not what it changes
+_DELIVERY_KEYS = frozenset({"udpn", "v"})
+
+
+class CommandQueueFull(RuntimeError):
+    """Raised when a device already has the maximum number of pending commands."""
+    def __init__(self, address: str, depth: int):
+        super().__init__(f"Command queue for {address} is full ({depth} pending)")
+        self.address = address
+        self.depth = depth
+
+
+class CommandTimeout(RuntimeError):
+    """Raised when waiting on a queued command gives up (too slow, or its device was dropped from the queue)."""
+    def __init__(self, address: str, waited: float | None = None):
+        reason = f"no answer within {waited:.1f}s" if waited is not None else "command cancelled"
+        super().__init__(f"Command for {address}: {reason}")
+        self.address = address
+        self.waited = waited
+
+
+@dataclass
+class _Command:
+    """ Single queued POST. `futures` grows when later commands supersede this one. """
+    kind: frozenset
+    payload: dict[str, Any]
+    sender: Callable[[dict[str, Any]], requests.Response]
+    futures: list[Future] = field(default_factory=list)
+
+
+@dataclass
+class _DeviceLane:
+    """ Pending commands of one device plus the worker draining them. """
+    address: str
+    pending: deque = field(default_factory=deque)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    worker: Future | None = None
+    in_flight: frozenset = frozenset()
+    busy: bool = False
+    closed: bool = False        # device left the config, the worker exits once its in-flight command is done
+
+    def report_load(self) -> None:
+        """ Tells the I/O governor how many commands this device has. Caller holds the queue lock. """
+        if self.closed:
+            return
+        DEVICE_IO_GOVERNOR.set_command_load(self.address, len(self.pending) + self.busy)
+
+
+def command_kind(payload: dict[str, Any]) -> frozenset:
+    """ What a command changes on the device, e.g. {"bri"} or {"ps"}. Used to decide supersession. """
+    return frozenset(payload) - _DELIVERY_KEYS
+
+
+def is_noop_command(payload: dict[str, Any], state: dict[str, Any] | None) -> bool:
+    """
+    True when applying `payload` to a device in `state` would change nothing.
+
+    Only power (`on`), brightness (`bri`) and preset (`ps`) are compared; any other key is assumed to change something.
+    A preset counts as applied only while the device is on, since loading it again may turn the device on.
+    """
+    kind = command_kind(payload)
+    if not state or not kind or not kind <= {"on", "bri", "ps"}:
+        return False
+    if "ps" in kind and not state.get("on"):
+        return False
+    return all(state.get(key) == payload[key] for key in kind)
+
+
+def _cached_response(state: dict[str, Any]) -> requests.Response:
+    """ Response standing in for a skipped command, shaped like WLED's answer to a `"v": true` POST. """
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(state).encode("utf-8")       # pylint: disable=protected-access
+    return response
+
+
+class DeviceCommandQueue:
+    """
+        One ordered async queue per device address, drained on a dedicated background event loop.
+
+        `submit` is thread-safe and returns a `concurrent.futures.Future` resolving to the device response,
+        so synchronous callbacks can either wait for the confirmed state or fire and forget.
+    """
+    def __init__(self, max_depth: int = MAX_QUEUE_DEPTH):
+        self.max_depth = max_depth
+        self._lock = Lock()
+        self._lanes: dict[str, _DeviceLane] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """ Lazily starts the background loop all device workers run on. Caller holds the lock. """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            Thread(target=self._loop.run_forever, name="naari-command-queue", daemon=True).start()
+        return self._loop
+
+    def submit(self, address: str, payload: dict[str, Any], sender: Callable[[dict[str, Any]], requests.Response]) -> Future:
+        """
+        Queue a command for a device.
+
+        Parameters:
+            address: Device IP/DNS address, the queue key.
+            payload: JSON body of the command.
+            sender: Blocking function performing the POST for a given payload.
+
+        Returns:
+            Future resolving to the `requests.Response` (or raising the sender's exception).
+
+        Raises:
+            CommandQueueFull: If the device already has `max_depth` pending commands.
+        """
+        future = Future()
+        kind = command_kind(payload)
+
+        with self._lock:
+            loop = self._ensure_loop()
+            lane = self._lanes.get(address)
+            if lane is None:
+                lane = self._lanes[address] = _DeviceLane(address=address)
+                lane.worker = asyncio.run_coroutine_threadsafe(self._drain(lane), loop)
+
+            # A later command of the same kind makes the pending one pointless.
+            # Its callers get the outcome of the command that replaced it.
+            superseded = next((command for command in lane.pending if command.kind == kind), None)
+            if superseded is not None:
+                lane.pending.remove(superseded)
+
+            # Diffing: the cached state is only trusted when nothing queued or in flight touches the same keys
+            touched = lane.in_flight.union(*(command.kind for command in lane.pending))
+            cached_state = self._trusted_state(address)
+            if not kind & touched and is_noop_command(payload, cached_state):
+                skipped = _cached_response(cached_state)
+                for waiting in (superseded.futures if superseded else []) + [future]:
+                    waiting.set_result(skipped)
+                lane.report_load()
+                return future
+
+            if superseded is None and len(lane.pending) >= self.max_depth:
+                raise CommandQueueFull(address, len(lane.pending))
+
+            command = _Command(kind=kind, payload=payload, sender=sender, futures=[future])
+            if superseded is not None:
+                command.futures = superseded.futures + command.futures
+            lane.pending.append(command)
+            lane.report_load()
+
+        loop.call_soon_threadsafe(lane.wakeup.set)
+        return future
+
+    async def _drain(self, lane: _DeviceLane) -> None:
+        """ Worker of a single device: sends pending commands one at a time, in order. """
+        while not lane.closed:
+            await lane.wakeup.wait()
+            lane.wakeup.clear()
+            while True:
+                with self._lock:
+                    if lane.closed or not lane.pending:
+                        break
+                    command = lane.pending.popleft()
+                    lane.in_flight = command.kind
+                    lane.busy = True
+
+                try:
+                    response = await asyncio.to_thread(command.sender, command.payload)
+                except Exception as err:        # pylint: disable=broad-exception-caught
+                    for future in command.futures:
+                        if not future.done():
+                            future.set_exception(err)
+                else:
+                    for future in command.futures:
+                        if not future.done():
+                            future.set_result(response)
+                finally:
+                    with self._lock:
+                        lane.in_flight = frozenset()
+                        lane.busy = False
+                        lane.report_load()
+
+    @staticmethod
+    def _trusted_state(address: str) -> dict[str, Any] | None:
+        """ Cached device state, if recent enough to decide a command is a no-op. """
+        age = DEVICE_STATE_CACHE.age(address)
+        if age is None or age > STATE_TRUST_SECONDS:
+            return None
+        return DEVICE_STATE_CACHE.get_state(address)
+
+    def forget(self, address: str) -> None:
+        """
+            Drop the lane of a device (e.g. removed from config): pending commands are cancelled,
+            a command already in flight finishes, then its worker exits.
+        """
+        with self._lock:
+            lane = self._lanes.pop(address, None)
+            if lane is None:
+                return
+            lane.closed = True
+            cancelled = [future for command in lane.pending for future in command.futures]
+            lane.pending.clear()
+            loop = self._loop
+
+        for future in cancelled:
+            future.cancel()
+        if loop is not None:
+            loop.call_soon_threadsafe(lane.wakeup.set)
+
+    def pending_count(self, address: str) -> int:
+        """ Number of commands waiting (not in flight) for a device. """
+        with self._lock:
+            lane = self._lanes.get(address)
+            return len(lane.pending) if lane else 0
+
+
+COMMAND_QUEUE = DeviceCommandQueue()
+
+
+def submit_device_update(payload: dict[str, Any], device_info: DeviceConfig, ui_settings: Settings,
+                         body: bytes | None = None) -> Future:
+    """
+    Queue a `send_device_update` (single device, UDP sync suppressed) for the given device.
+    `body` is the pre-serialized request body (`device_update_body(payload)`), if the caller has one.
+    """
+    return COMMAND_QUEUE.submit(
+        address=device_info['address'],
+        payload=payload,
+        sender=lambda json_body: send_device_update(json_body, device_info, ui_settings, body=body)
+    )
+
+
+def submit_payload(device_ip: str, json_body: dict[str, Any]) -> Future:
+    """ Queue a raw `send_payload` (e.g. Master Sync device commands meant to propagate). """
+    return COMMAND_QUEUE.submit(
+        address=device_ip,
+        payload=json_body,
+        sender=lambda body: send_payload(device_ip, body)
+    )
+
+
+def result_timeout(ui_settings: Settings) -> float:
+    """
+        How long a caller waits on one command: its own attempts all timing out plus the backoff between them.
+        Not sized for a full queue, so a request thread never outlives a (gunicorn) worker timeout on a dead device.
+    """
+    timeout = ui_settings.request_timeout if ui_settings.request_timeout > 0 else REQUEST_TIMEOUT
+    retries = ui_settings.retries if ui_settings.retries > 0 else RETRIES
+    backoff = ui_settings.retry_backoff if ui_settings.retry_backoff > 0 else RETRY_BACKOFF
+    return timeout * (retries + 1) + sum(backoff * (2 ** attempt) for attempt in range(1, retries + 1))
+
+
+def wait_result(future: Future, address: str, ui_settings: Settings, deadline: float | None = None) -> requests.Response:
+    """
+    Wait (bounded by `result_timeout`, or until the monotonic `deadline`) for a submitted command.
+    A command given up on stays queued and finishes in the background; its failure is logged.
+
+    Raises:
+        CommandTimeout: If the command did not finish in time or was cancelled (device removed).
+        Whatever the sender raised, e.g. PayloadRetryError.
+    """
+    waited = result_timeout(ui_settings) if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        return future.result(timeout=waited)
+    except FutureTimeout:
+        future.add_done_callback(log_command_failure)
+        raise CommandTimeout(address, waited)       # pylint: disable=raise-missing-from
+    except CancelledError:
+        raise CommandTimeout(address)               # pylint: disable=raise-missing-from
+
+
+def log_command_failure(future: Future) -> None:
+    """ Done-callback for fire-and-forget submissions; logs failures instead of dropping them silently. """
+    if future.cancelled():
+        return
+    err = future.exception()
+    if err is None:
+        return
+    LogManager.print_message(
+        "Queued device command failed: %s",
+        getattr(err, 'last_exception', err),
+        to_log=TO_LOG,
+        log_level=logging.ERROR
+    )
+
+
+def fan_out_power(power_on: bool, devices: list[DeviceConfig], ui_settings: Settings) -> dict[str, dict[str, Any] | None]:
+    """
+    Switch every given device on/off concurrently and return what each device confirmed.
+
+    Each device gets a single POST through its own queue. `"nn"` keeps the device from broadcasting
+    the change over UDP sync, since every device is addressed directly anyway.
+
+    Returns:
+        {address: confirmed state or None when the device failed/was backed up}
+    """
+    pending = {}
+    for device in devices:
+        try:
+            pending[device['address']] = submit_payload(
+                device_ip=device['address'],
+                json_body={"on": power_on, "udpn": {"nn": True}, "v": True}
+            )
+        except CommandQueueFull as err:
+            LogManager.print_message(
+                "Fan-out power skipped: %s",
+                err,
+                to_log=TO_LOG,
+                log_level=logging.WARNING
+            )
+            pending[device['address']] = None
+
+    # Devices answer concurrently: one shared wait budget for all of them
+    deadline = time.monotonic() + result_timeout(ui_settings)
+    results = {}
+    for address, sent in pending.items():
+        try:
+            results[address] = confirmed_state(wait_result(sent, address, ui_settings, deadline)) if sent else None
+        except CommandTimeout as err:
+            LogManager.print_message(
+                "Fan-out power to %s not confirmed: %s",
+                address, err,
+                to_log=TO_LOG,
+                log_level=logging.WARNING
+            )
+            results[address] = None
+        except PayloadRetryError as err:
+            LogManager.print_message(
+                "Fan-out power to %s failed: %s",
+                address, getattr(err, 'last_exception', err),
+                to_log=TO_LOG,
+                log_level=logging.ERROR
+            )
+            results[address] = None
+    return results
@@ -0,0 +1,135 @@
+"""
+Modular contains the adaptive (AIMD) concurrency controllers used for fleet wide GETs.
+
+One controller per request path (`/json` polls and `/presets.json` refreshes have different latencies).
+Each round takes a `ConcurrencyRound` with the controller's current limit, records its own requests on it
+and hands it back when done, so overlapping rounds don't mix their results:
+    - Healthy round (no timeouts, low error rate, latency near the path's baseline) that was held back
+      by the current limit (more requests than slots) -> limit + 1
+    - Any timeout -> limit cut in half
+The `max_concurrency` UI setting is the ceiling of every controller, so the user keeps the final say.
+"""
+
+from threading import Lock
+import math
+
+__all__ = [
+    'ConcurrencyRound',
+    'AdaptiveConcurrency',
+    'PathConcurrency',
+    'ADAPTIVE_CONCURRENCY'
+]
+
+# Hard coded default values. Here if nothing in config_file to reference.
+MAX_CONCURRENCY = 10        # Ceiling when the setting is missing/invalid
+DECREASE_FACTOR = 0.5       # Multiplicative decrease on timeouts
+MAX_ERROR_RATE = 0.1        # Share of failed requests a round may have and still count as healthy
+LATENCY_TOLERANCE = 2.0     # Round latency may be this many times the baseline and still count as healthy
+BASELINE_WEIGHT = 0.2       # EWMA weight of a healthy round's latency in the baseline
+
+
+def _valid_ceiling(ceiling) -> int:
+    return int(ceiling) if isinstance(ceiling, (int, float)) and ceiling >= 1 else MAX_CONCURRENCY
+
+
+class ConcurrencyRound:
+    """ Results of one round's requests. Recorded from the round's own event loop only. """
+    def __init__(self, limit: int, size: int):
+        self.limit = limit          # in-flight limit the round ran with
+        self.size = size            # requests (devices) in the round
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.timeouts = 0
+
+    def record(self, latency: float | None = None, error: bool = False, timeout: bool = False) -> None:
+        """ Report one finished request: its latency on success, or that it errored / timed out. """
+        if timeout:
+            self.timeouts += 1
+        elif error:
+            self.errors += 1
+        elif latency is not None:
+            self.latencies.append(latency)
+
+    @property
+    def capped(self) -> bool:
+        """ True when requests had to wait for a slot, i.e. the limit held the round back. """
+        return self.size > self.limit
+
+
+class AdaptiveConcurrency:
+    """ Thread-safe AIMD limit of one request path, shared by every round regardless of which event loop runs it. """
+    def __init__(self, ceiling: int = MAX_CONCURRENCY):
+        self._lock = Lock()
+        self.ceiling = ceiling
+        self._limit = max(1, ceiling // 2)     # Start in the middle, let the rounds find the sweet spot
+        self._baseline: float | None = None
+
+    @property
+    def limit(self) -> int:
+        """ Current in-flight limit for the next round. """
+        with self._lock:
+            return self._limit
+
+    def configure(self, ceiling: int) -> None:
+        """ Apply the `max_concurrency` setting as ceiling. Invalid values fall back to the default. """
+        ceiling = _valid_ceiling(ceiling)
+        with self._lock:
+            self.ceiling = ceiling
+            self._limit = min(self._limit, ceiling)
+
+    def start_round(self, size: int) -> ConcurrencyRound:
+        """ New round of `size` requests at the current limit. """
+        with self._lock:
+            return ConcurrencyRound(self._limit, size)
+
+    def end_round(self, finished: ConcurrencyRound) -> int:
+        """ Adjust the limit from a finished round. Returns the new limit. """
+        with self._lock:
+            latencies, errors, timeouts = finished.latencies, finished.errors, finished.timeouts
+            total = len(latencies) + errors + timeouts
+            if not total:
+                return self._limit
+
+            if timeouts:
+                self._limit = max(1, math.floor(self._limit * DECREASE_FACTOR))
+                return self._limit
+
+            round_latency = sorted(latencies)[len(latencies) // 2] if latencies else None
+            healthy = errors / total <= MAX_ERROR_RATE and (
+                round_latency is None or self._baseline is None or round_latency <= self._baseline * LATENCY_TOLERANCE
+            )
+            if healthy:
+                if round_latency is not None:
+                    self._baseline = round_latency if self._baseline is None else (
+                        (1 - BASELINE_WEIGHT) * self._baseline + BASELINE_WEIGHT * round_latency
+                    )
+                # Only a round held back by the current limit shows that more slots would be used
+                if finished.capped and finished.limit >= self._limit:
+                    self._limit = min(self.ceiling, self._limit + 1)
+            return self._limit
+
+
+class PathConcurrency:
+    """ One `AdaptiveConcurrency` per request path, all sharing the `max_concurrency` ceiling. """
+    def __init__(self, ceiling: int = MAX_CONCURRENCY):
+        self._lock = Lock()
+        self.ceiling = ceiling
+        self._controllers: dict[str, AdaptiveConcurrency] = {}
+
+    def controller(self, path: str) -> AdaptiveConcurrency:
+        """ Controller of a request path, created on first use. """
+        with self._lock:
+            if path not in self._controllers:
+                self._controllers[path] = AdaptiveConcurrency(self.ceiling)
+            return self._controllers[path]
+
+    def configure(self, ceiling: int) -> None:
+        """ Apply the `max_concurrency` setting as ceiling of every path. """
+        with self._lock:
+            self.ceiling = _valid_ceiling(ceiling)
+            controllers = list(self._controllers.values())
+        for controller in controllers:
+            controller.configure(self.ceiling)
+
+
+ADAPTIVE_CONCURRENCY = PathConcurrency()
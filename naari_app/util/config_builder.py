@@ -4,9 +4,12 @@ Modulare provides schema design for the Config File used by N.A.R.I
 As well as  builders and Validations
 """
 
-from typing import TypedDict
+from typing import Any, Callable, TypedDict, Union, get_args, get_origin, get_type_hints, is_typeddict
+import types
+import copy
 import json
-import os
+
+from naari_app.util.config_writer import atomic_write
 
 
 #-------------------------------------- Schema---------------------------------------------------------#
@@ -39,6 +42,9 @@ class UISettings(TypedDict):
     retry_backoff: UISettingsInput          # (float) Time set added to specific Timeout time in (sec)
     request_timeout: UISettingsInput        # (int) TIme set to end connection to possible dead or hang device
     ui_theme:  UISettingsInput
+    power_fan_out: UISettingsInput          # (bool) Master Power sends to every active device instead of the Master Sync device
+    rate_limit: UISettingsInput             # (float) Sustained requests per second allowed per device (polls + commands)
+    rate_burst: UISettingsInput             # (int) Requests a device may take back to back after being idle
 
 
 class DevicePreset(TypedDict):
@@ -107,6 +113,18 @@ def make_empty_config(app_name: str = "WLED Controller") -> NaariSettingsConfig:
             "ui_theme": {
                 "value": 0,
                 "type": "bool"
+            },
+            "power_fan_out": {
+                "value": 0,
+                "type": "bool"
+            },
+            "rate_limit": {
+                "value": 4.0,
+                "type": "float"
+            },
+            "rate_burst": {
+                "value": 6,
+                "type": "int"
             }
         },
         "themes": [],
@@ -130,7 +148,264 @@ def write_empty_config(path: str) -> NaariSettingsConfig:
         OSError: if the directory or file cannot be written.
     """
     config = make_empty_config()
-    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=4, ensure_ascii=False)
+    atomic_write(path, json.dumps(config, indent=4, ensure_ascii=False).encode('utf-8'))
     return config
+
+
+#-------------------------- Validation -------------------------------#
+
+class ConfigValidationError(ValueError):
+    """Raised when a config does not match the `NaariSettingsConfig` schema."""
+    def __init__(self, errors: list[str]):
+        super().__init__("Invalid config:\n  " + "\n  ".join(errors))
+        self.errors = errors
+
+
+# Checkers take (value, path, errors) and return the normalized value; problems are appended to `errors`
+Checker = Callable[[Any, str, list], Any]
+
+_SETTING_TYPES = {"int": int, "float": float, "bool": bool, "str": str}
+
+
+def _type_name(value: Any) -> str:
+    return "null" if value is None else type(value).__name__
+
+
+def _describe(value: Any) -> str:
+    return "null" if value is None else f"{type(value).__name__} {value!r}"
+
+
+def _check_int(value: Any, path: str, errors: list) -> Any:
+    if isinstance(value, bool):
+        errors.append(f"{path}: expected int, got bool")
+    elif isinstance(value, int):
+        return value
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+    elif isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value)
+    else:
+        errors.append(f"{path}: expected int, got {_describe(value)}")
+    return value
+
+
+def _check_float(value: Any, path: str, errors: list) -> Any:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    errors.append(f"{path}: expected float, got {_describe(value)}")
+    return value
+
+
+def _check_bool(value: Any, path: str, errors: list) -> Any:
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("true", "false", "0", "1"):
+        return value.strip().lower() in ("true", "1")
+    errors.append(f"{path}: expected bool, got {_describe(value)}")
+    return value
+
+
+def _check_str(value: Any, path: str, errors: list) -> Any:
+    if not isinstance(value, str):
+        errors.append(f"{path}: expected str, got {_describe(value)}")
+    return value
+
+
+def _check_scalar(value: Any, path: str, errors: list) -> Any:
+    if value is None or isinstance(value, (dict, list)):
+        errors.append(f"{path}: expected str, int, float or bool, got {_type_name(value)}")
+    return value
+
+
+_SCALAR_CHECKERS: dict[type, Checker] = {int: _check_int, float: _check_float, bool: _check_bool, str: _check_str}
+
+# Normalization: values used when a key is missing (or null), instead of reporting it
+_FIELD_DEFAULTS: dict[tuple[type, str], Callable[[], Any]] = {
+    (DevicePreset, 'device_address'): lambda: "",       # Filled from the device list after validation
+    (DevicePreset, 'preset_name'): lambda: "",          # Cleared dropdown -> no preset
+}
+_MISSING_DEFAULTS: dict[type, Callable[[str], Any]] = {
+    UISettings: lambda key: copy.deepcopy(make_empty_config()['ui_settings'][key]),     # settings added in newer versions
+}
+
+
+def _coerce_setting(value: dict, path: str, errors: list) -> dict:
+    """ A UI setting's value must match its declared `type`. Stored bools stay 0/1 like the config files. """
+    expected = _SETTING_TYPES.get(value.get('type'))
+    if expected is None:
+        errors.append(f"{path}.type: expected one of {sorted(_SETTING_TYPES)}, got {value.get('type')!r}")
+        return value
+    coerced = _SCALAR_CHECKERS[expected](value.get('value'), f"{path}.value", errors)
+    return {**value, 'value': int(coerced) if expected is bool and isinstance(coerced, bool) else coerced}
+
+
+_POST_CHECKS: dict[type, Checker] = {
+    UISettingsInput: _coerce_setting,
+}
+
+
+def _compile_typeddict(schema: type) -> Checker:
+    fields = {key: _compile(hint) for key, hint in get_type_hints(schema).items()}
+    post_check = _POST_CHECKS.get(schema)
+    missing_default = _MISSING_DEFAULTS.get(schema)
+
+    def check(value: Any, path: str, errors: list) -> Any:
+        if not isinstance(value, dict):
+            errors.append(f"{path}: expected object, got {_type_name(value)}")
+            return value
+        normalized = dict(value)        # unknown keys are kept as is
+        for key, field_check in fields.items():
+            field_default = _FIELD_DEFAULTS.get((schema, key))
+            if value.get(key) is None and field_default is not None:
+                normalized[key] = field_default()
+            elif key not in value:
+                if missing_default is not None:
+                    normalized[key] = missing_default(key)
+                else:
+                    errors.append(f"{path}.{key}: missing")
+            else:
+                normalized[key] = field_check(value[key], f"{path}.{key}", errors)
+        return post_check(normalized, path, errors) if post_check else normalized
+    return check
+
+
+def _compile_list(item_hint: Any) -> Checker:
+    item_check = _compile(item_hint)
+
+    def check(value: Any, path: str, errors: list) -> Any:
+        if not isinstance(value, list):
+            errors.append(f"{path}: expected list, got {_type_name(value)}")
+            return value
+        return [item_check(item, f"{path}[{i}]", errors) for i, item in enumerate(value)]
+    return check
+
+
+def _compile(hint: Any) -> Checker:
+    """ Builds a checker from a type hint of the schema above. """
+    if is_typeddict(hint):
+        return _compile_typeddict(hint)
+    origin = get_origin(hint)
+    if origin is list:
+        return _compile_list(get_args(hint)[0])
+    if origin in (Union, types.UnionType):
+        return _check_scalar
+    if hint in _SCALAR_CHECKERS:
+        return _SCALAR_CHECKERS[hint]
+    raise TypeError(f"No config checker for type hint {hint!r}")
+
+
+_CHECK_CONFIG = _compile(NaariSettingsConfig)
+
+
+def _fill_missing_ids(config: Any) -> Any:
+    """
+        Entries without an id (null / missing, e.g. copied from an older example file) get the next free one,
+        theme presets without a `device_id` are matched to a device by address. Returns a copy.
+    """
+    if not isinstance(config, dict):
+        return config
+    config = dict(config)
+
+    for section in ("devices", "themes"):
+        entries = config.get(section)
+        if not isinstance(entries, list):
+            continue
+        taken = [entry.get('id') for entry in entries if isinstance(entry, dict)
+                 and isinstance(entry.get('id'), int) and not isinstance(entry.get('id'), bool)]
+        next_id = max(taken, default=0) + 1
+        filled = []
+        for entry in entries:
+            if isinstance(entry, dict) and entry.get('id') is None:
+                entry = {**entry, 'id': next_id}
+                next_id += 1
+            filled.append(entry)
+        config[section] = filled
+
+    ids_by_address = {device.get('address'): device['id'] for device in config.get('devices') or []
+                      if isinstance(device, dict) and device.get('address') and isinstance(device['id'], int)}
+    if isinstance(config.get('themes'), list):
+        config['themes'] = [
+            {**theme, 'presets': [
+                {**preset, 'device_id': ids_by_address[preset.get('device_address')]}
+                if isinstance(preset, dict) and preset.get('device_id') is None
+                and preset.get('device_address') in ids_by_address else preset
+                for preset in theme['presets']
+            ]} if isinstance(theme, dict) and isinstance(theme.get('presets'), list) else theme
+            for theme in config['themes']
+        ]
+    return config
+
+
+def _check_unique_ids(section: str, entries: list, errors: list) -> None:
+    seen = set()
+    for i, entry in enumerate(entries):
+        entry_id = entry.get('id') if isinstance(entry, dict) else None
+        if entry_id in seen:
+            errors.append(f"{section}[{i}].id: duplicate id {entry_id}")
+        seen.add(entry_id)
+
+
+def _check_single_master(devices: list, errors: list) -> None:
+    masters = [device.get('id') for device in devices if isinstance(device, dict) and device.get('master_sync')]
+    if len(masters) > 1:
+        errors.append(f"devices: only one master_sync device allowed, got ids {masters}")
+
+
+def _check_theme_presets(themes: list, device_ids: set, errors: list) -> None:
+    """ Every preset of a theme points at a configured device, at most one preset per device. """
+    for i, theme in enumerate(themes):
+        seen = set()
+        for j, preset in enumerate(theme.get('presets', []) if isinstance(theme, dict) else []):
+            device_id = preset.get('device_id') if isinstance(preset, dict) else None
+            if device_id not in device_ids:
+                errors.append(f"themes[{i}].presets[{j}].device_id: unknown device {device_id}")
+            elif device_id in seen:
+                errors.append(f"themes[{i}].presets[{j}].device_id: duplicate preset for device {device_id}")
+            seen.add(device_id)
+
+
+def _fill_preset_addresses(themes: list, devices: list) -> None:
+    addresses = {device.get('id'): device.get('address') for device in devices if isinstance(device, dict)}
+    for theme in themes:
+        for preset in theme.get('presets', []) if isinstance(theme, dict) else []:
+            if isinstance(preset, dict) and not preset.get('device_address'):
+                preset['device_address'] = addresses.get(preset.get('device_id'), "")
+
+
+def _check_references(config: NaariSettingsConfig, errors: list) -> None:
+    """ Rules across sections: unique ids, a single master device, theme presets pointing at devices (one per device). """
+    devices = config.get('devices') if isinstance(config.get('devices'), list) else []
+    themes = config.get('themes') if isinstance(config.get('themes'), list) else []
+
+    _check_unique_ids("devices", devices, errors)
+    _check_unique_ids("themes", themes, errors)
+    _check_single_master(devices, errors)
+    _check_theme_presets(themes, {device.get('id') for device in devices if isinstance(device, dict)}, errors)
+    _fill_preset_addresses(themes, devices)
+
+
+def validate_config(config: Any) -> NaariSettingsConfig:
+    """
+    Validate a config against `NaariSettingsConfig` and return a normalized copy:
+        - numbers / bools given as strings (form inputs) are converted
+        - devices / themes without an id get a free one, theme presets without a device id get it by address
+        - UI settings missing from older files get their defaults
+        - theme presets get their device address from the device list
+
+    Raises:
+        ConfigValidationError: Listing every problem found (path: reason).
+    """
+    errors: list[str] = []
+    normalized = _CHECK_CONFIG(_fill_missing_ids(config), "config", errors)
+    if not errors:
+        _check_references(normalized, errors)
+    if errors:
+        raise ConfigValidationError(errors)
+    return normalized
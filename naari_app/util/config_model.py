@@ -0,0 +1,59 @@
+"""
+Modular contains the typed in-process view of the UI settings.
+
+The config file keeps its JSON schema (`UISettings`, every setting wrapped as {"value", "type"}).
+Devices and themes are read straight from the validated config (see `ConfigStore.index()`), only the settings
+are decoded once per config version into a slotted, frozen dataclass:
+    - settings are plain typed attributes (`settings.polling_rate` is an int, `settings.ui_theme` a bool)
+    - settings outside the schema stay reachable through `setting(name)`
+"""
+
+from dataclasses import dataclass, fields
+from types import MappingProxyType
+from typing import Any, Mapping
+
+from naari_app.util.config_builder import UISettings
+
+__all__ = [
+    'Settings'
+]
+
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+
+@dataclass(slots=True, frozen=True)
+class Settings:     # pylint: disable=too-many-instance-attributes
+    """ UI settings (`UISettings`) with the {"value", "type"} wrappers resolved to typed values. """
+    app_name: str
+    polling_rate: int
+    connect_timeout: int
+    read_timeout: int
+    max_concurrency: int
+    retries: int
+    retry_backoff: float
+    request_timeout: int
+    ui_theme: bool
+    power_fan_out: bool
+    rate_limit: float
+    rate_burst: int
+    extra: Mapping[str, Any] = _EMPTY          # settings outside the schema, still wrapped
+
+    @classmethod
+    def from_ui_settings(cls, ui_settings: UISettings) -> 'Settings':
+        """ Typed settings from validated `ui_settings` (bools are stored as 0/1 in the file). """
+        values = {}
+        for name in _SETTING_NAMES:
+            setting = ui_settings[name]
+            values[name] = bool(setting['value']) if setting['type'] == 'bool' else setting['value']
+        extra = {name: setting for name, setting in ui_settings.items() if name not in _SETTING_NAMES}
+        return cls(**values, extra=MappingProxyType(extra) if extra else _EMPTY)
+
+    def setting(self, name: str, default: Any = None) -> Any:
+        """ Value of any setting by name, including ones outside the schema. """
+        if name in _SETTING_NAMES:
+            return getattr(self, name)
+        wrapped = self.extra.get(name)
+        return wrapped.get('value', default) if isinstance(wrapped, dict) else default
+
+
+_SETTING_NAMES = tuple(field.name for field in fields(Settings) if field.name != 'extra')
@@ -0,0 +1,318 @@
+"""
+Modular contains the optional SQLite storage backend for the config (and device state history).
+
+Enabled with `CONFIG_BACKEND=sqlite` in `.env`; the JSON file stays the default.
+    - Indexed tables for devices, themes, theme presets and UI settings, WAL journal
+    - Saves are incremental: only rows that differ from the last known snapshot are written
+    - A `revision` counter lets the config store detect changes with a single indexed read
+    - One-shot migration from `naari_config.json` the first time the database is opened
+"""
+
+from threading import Lock
+from typing import Any, Iterable
+import sqlite3
+import json
+import os
+import logging
+import time
+
+from dotenv import load_dotenv
+
+from naari_logging.naari_logger import LogManager
+from naari_app.util.config_builder import NaariSettingsConfig, ConfigValidationError, validate_config
+
+__all__ = [
+    'SQLiteConfigBackend',
+    'SQLITE_BACKEND',
+    'CONFIG_BACKEND'
+]
+
+MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+CONFIG_DB_PATH = os.path.join(MAINDIR, "naari_config.db")
+JSON_CONFIG_PATH = os.path.join(MAINDIR, "naari_config.json")
+
+load_dotenv(os.path.join(MAINDIR, ".env"))
+TO_LOG = int(os.getenv("LOGGING", "0")) == 1
+CONFIG_BACKEND = os.getenv("CONFIG_BACKEND", "json").strip().lower()
+
+STATE_HISTORY_DAYS = 30         # state history rows older than this are pruned
+_PRUNE_EVERY = 3600.0           # seconds between prune passes
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    instance_name TEXT NOT NULL,
+    master_sync INTEGER NOT NULL,
+    active INTEGER NOT NULL,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS devices_address ON devices (address);
+CREATE TABLE IF NOT EXISTS themes (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS theme_presets (
+    theme_id INTEGER NOT NULL,
+    device_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    device_address TEXT NOT NULL,
+    preset_name TEXT NOT NULL,
+    PRIMARY KEY (theme_id, device_id)
+);
+CREATE INDEX IF NOT EXISTS theme_presets_device ON theme_presets (device_id);
+CREATE TABLE IF NOT EXISTS ui_settings (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    type TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    address TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    power_on INTEGER,
+    brightness INTEGER,
+    preset INTEGER
+);
+CREATE INDEX IF NOT EXISTS state_history_address ON state_history (address, recorded_at);
+"""
+
+_DEVICE_KEYS = ('id', 'address', 'instance_name', 'master_sync', 'active')
+
+
+#---- Helper Functions ----#
+def _device_row(position: int, device: dict) -> tuple:
+    extra = {key: value for key, value in device.items() if key not in _DEVICE_KEYS}
+    return (device['id'], position, device['address'], device['instance_name'],
+            int(device['master_sync']), int(device['active']), json.dumps(extra, sort_keys=True))
+
+
+def _config_rows(config: NaariSettingsConfig) -> dict[str, dict[Any, tuple]]:
+    """ Config -> {table: {primary key: row}} used to diff against the stored snapshot. """
+    return {
+        "devices": {
+            device['id']: _device_row(position, device)
+            for position, device in enumerate(config['devices'])
+        },
+        "themes": {
+            theme['id']: (theme['id'], position, theme['name'])
+            for position, theme in enumerate(config['themes'])
+        },
+        "theme_presets": {
+            (theme['id'], preset['device_id']): (theme['id'], preset['device_id'], position,
+                                                 preset['device_address'], preset['preset_name'])
+            for theme in config['themes']
+            for position, preset in enumerate(theme['presets'])
+        },
+        "ui_settings": {
+            name: (name, position, json.dumps(setting['value']), setting['type'])
+            for position, (name, setting) in enumerate(config['ui_settings'].items())
+        },
+    }
+
+
+_UPSERTS = {
+    "devices": "INSERT OR REPLACE INTO devices (id, position, address, instance_name, master_sync, active, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "themes": "INSERT OR REPLACE INTO themes (id, position, name) VALUES (?, ?, ?)",
+    "theme_presets": "INSERT OR REPLACE INTO theme_presets (theme_id, device_id, position, device_address, preset_name) VALUES (?, ?, ?, ?, ?)",
+    "ui_settings": "INSERT OR REPLACE INTO ui_settings (name, position, value, type) VALUES (?, ?, ?, ?)",
+}
+_DELETES = {
+    "devices": "DELETE FROM devices WHERE id = ?",
+    "themes": "DELETE FROM themes WHERE id = ?",
+    "theme_presets": "DELETE FROM theme_presets WHERE theme_id = ? AND device_id = ?",
+    "ui_settings": "DELETE FROM ui_settings WHERE name = ?",
+}
+
+
+class SQLiteConfigBackend:     # pylint: disable=too-many-instance-attributes
+    """ Thread-safe SQLite config storage (one shared connection, serialized by a lock). """
+    def __init__(self, db_path: str = CONFIG_DB_PATH, json_path: str = JSON_CONFIG_PATH):
+        self._lock = Lock()
+        self.db_path = db_path
+        self.json_path = json_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._snapshot: dict[str, dict[Any, tuple]] | None = None
+        self._snapshot_revision: int | None = None
+        self._last_states: dict[str, tuple] = {}
+        self._last_prune = 0.0
+
+    def revision(self) -> int:
+        """ Counter bumped by every committed save (cheap change detection for the config store). """
+        with self._lock:
+            return self._revision()
+
+    def _revision(self) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+        return int(row[0]) if row else 0
+
+    def is_empty(self) -> bool:
+        """ True until a config has been saved (or migrated) into the database. """
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM meta WHERE key = 'revision'").fetchone() is None
+
+    def load(self) -> NaariSettingsConfig:
+        """ Assemble the config from the tables (same shape as the JSON file). """
+        with self._lock:
+            return self._load()
+
+    def _load(self) -> NaariSettingsConfig:
+        """ Caller holds the lock. """
+        devices = []
+        for device_id, address, instance_name, master_sync, active, extra in self._conn.execute(
+                "SELECT id, address, instance_name, master_sync, active, extra FROM devices ORDER BY position"):
+            devices.append({
+                "id": device_id,
+                "address": address,
+                "instance_name": instance_name,
+                "master_sync": bool(master_sync),
+                "active": bool(active),
+                **json.loads(extra)
+            })
+
+        presets: dict[int, list[dict]] = {}
+        for theme_id, device_id, device_address, preset_name in self._conn.execute(
+                "SELECT theme_id, device_id, device_address, preset_name FROM theme_presets ORDER BY theme_id, position"):
+            presets.setdefault(theme_id, []).append(
+                {"device_id": device_id, "device_address": device_address, "preset_name": preset_name}
+            )
+        themes = [
+            {"id": theme_id, "name": name, "presets": presets.get(theme_id, [])}
+            for theme_id, name in self._conn.execute("SELECT id, name FROM themes ORDER BY position")
+        ]
+
+        ui_settings = {
+            name: {"value": json.loads(value), "type": setting_type}
+            for name, value, setting_type in self._conn.execute(
+                "SELECT name, value, type FROM ui_settings ORDER BY position")
+        }
+
+        config = {"devices": devices, "ui_settings": ui_settings, "themes": themes}
+        self._snapshot, self._snapshot_revision = _config_rows(config), self._revision()
+        return config
+
+    def save(self, config: NaariSettingsConfig) -> int:
+        """
+        Write only the rows that changed since the last load/save, in one transaction.
+        Returns the number of rows written or deleted.
+        """
+        with self._lock:
+            if self._snapshot is None or self._snapshot_revision != self._revision():
+                self._load()            # someone else wrote in between, diff against what is stored now
+
+            new_rows = _config_rows(config)
+            changes = 0
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table, rows in new_rows.items():
+                    old_rows = self._snapshot[table]
+                    changed = [row for key, row in rows.items() if old_rows.get(key) != row]
+                    removed = [key if isinstance(key, tuple) else (key,) for key in old_rows.keys() - rows.keys()]
+                    if changed:
+                        self._conn.executemany(_UPSERTS[table], changed)
+                    if removed:
+                        self._conn.executemany(_DELETES[table], removed)
+                    changes += len(changed) + len(removed)
+                revision = self._revision() + (1 if changes or self._snapshot_revision == 0 else 0)
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('revision', ?)", (str(revision),))
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._snapshot, self._snapshot_revision = new_rows, revision
+            return changes
+
+    def migrate_from_json(self) -> bool:
+        """
+        One-shot import of the JSON config into an empty database. Returns True if it ran.
+
+        Raises:
+            ConfigValidationError: If the JSON file is unreadable or invalid. The database stays empty
+                (and the file untouched), so the migration runs again once the file is fixed.
+        """
+        if not self.is_empty() or not os.path.exists(self.json_path):
+            return False
+        try:
+            with open(self.json_path, 'r', encoding='utf-8') as file:
+                config = validate_config(json.load(file))
+        except (OSError, json.JSONDecodeError, ConfigValidationError) as e:
+            LogManager.print_message(
+                "[config_sqlite] Migration of %s into %s failed, fix the file and restart: %s",
+                self.json_path, self.db_path, e,
+                to_log=TO_LOG,
+                log_level=logging.ERROR
+            )
+            if isinstance(e, ConfigValidationError):
+                raise
+            raise ConfigValidationError([f"{self.json_path}: {e}"]) from e
+        self._snapshot = {table: {} for table in _UPSERTS}
+        self._snapshot_revision = 0
+        rows = self.save(config)
+        LogManager.print_message(
+            "[config_sqlite] Migrated %s into %s (%s rows)",
+            self.json_path, self.db_path, rows,
+            to_log=TO_LOG,
+            log_level=logging.INFO
+        )
+        return True
+
+    def record_states(self, polled_data: Iterable[dict[str, Any]]) -> None:
+        """ Append a history row for each device whose power / brightness / preset changed since last recorded. """
+        now = time.time()
+        rows = []
+        with self._lock:
+            for entry in polled_data or []:
+                state = (entry.get('data') or {}).get('state')
+                address = entry.get('ip')
+                if not address or not isinstance(state, dict) or entry.get('deferred'):
+                    continue
+                values = (state.get('on'), state.get('bri'), state.get('ps'))
+                if self._last_states.get(address) != values:
+                    self._last_states[address] = values
+                    rows.append((address, now, *values))
+            if not rows and now - self._last_prune < _PRUNE_EVERY:
+                return
+            try:
+                self._conn.execute("BEGIN")
+                if rows:
+                    self._conn.executemany(
+                        "INSERT INTO state_history (address, recorded_at, power_on, brightness, preset) VALUES (?, ?, ?, ?, ?)",
+                        rows
+                    )
+                if now - self._last_prune >= _PRUNE_EVERY:
+                    self._conn.execute("DELETE FROM state_history WHERE recorded_at < ?",
+                                       (now - STATE_HISTORY_DAYS * 86400,))
+                    self._last_prune = now
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                LogManager.print_message(
+                    "[config_sqlite] State history not recorded: %s",
+                    e,
+                    to_log=TO_LOG,
+                    log_level=logging.WARNING
+                )
+
+    def state_history(self, address: str, since: float = 0.0) -> list[dict[str, Any]]:
+        """ Recorded changes of a device, oldest first. """
+        with self._lock:
+            return [
+                {"recorded_at": recorded_at, "on": None if power_on is None else bool(power_on), "bri": brightness, "ps": preset}
+                for recorded_at, power_on, brightness, preset in self._conn.execute(
+                    "SELECT recorded_at, power_on, brightness, preset FROM state_history "
+                    "WHERE address = ? AND recorded_at >= ? ORDER BY recorded_at", (address, since))
+            ]
+
+
+SQLITE_BACKEND = SQLiteConfigBackend() if CONFIG_BACKEND == "sqlite" else None
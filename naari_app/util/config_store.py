@@ -0,0 +1,247 @@
+"""
+Modular contains the process-wide config store: `naari_config.json` parsed once and kept indexed in memory.
+
+The file is only re-read when its mtime/size change, and only re-parsed when its content hash changes.
+With the SQLite backend the database `revision` counter plays the part of the file stat
+(read at most every REVISION_INTERVAL seconds; saves through the store update it directly).
+Lookups (device by id / address, theme by id, master device) are dict based,
+and `settings()` gives the typed UI `Settings` of the current version.
+
+Each distinct config content gets a version; the browser only keeps the version token
+({"version": n, "hash": "..."}) in the `naari_settings` store and callbacks read the config from here.
+The last few versions stay reachable by hash (`config_for`), so the UI can diff against what it rendered.
+
+Once a config is loaded, a reload that fails (truncated write, invalid edit) is logged and the last good
+config keeps being served; the file on disk is left as is until it is fixed.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import TypedDict
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from dotenv import load_dotenv
+
+from naari_logging.naari_logger import LogManager
+
+from naari_app.util.config_builder import (DeviceConfig, NaariSettingsConfig, ThemeSelectionConfig,
+                                           ConfigValidationError, validate_config)
+from naari_app.util.util_functions import MAINDIR, CONFIG_PATH, naari_config_load, save_configer, serialize_config
+from naari_app.util.config_writer import CONFIG_WRITER
+from naari_app.util.config_sqlite import SQLITE_BACKEND
+from naari_app.util.config_model import Settings
+
+__all__ = [
+    'ConfigToken',
+    'DeviceIndex',
+    'ConfigStore',
+    'CONFIG_STORE'
+]
+
+
+load_dotenv(os.path.join(MAINDIR, ".env"))
+TO_LOG = int(os.getenv("LOGGING", "0")) == 1
+
+CONFIG_HISTORY = 8      # past config versions kept for diffing
+REVISION_INTERVAL = 1.0     # seconds between SQLite revision reads
+RELOAD_ERRORS = (json.JSONDecodeError, ConfigValidationError, ValueError, OSError, sqlite3.Error)
+
+
+class ConfigToken(TypedDict):
+    """ What the browser keeps of the config (`naari_settings` store). """
+    version: int            # bumped every time the config content changes (per process)
+    hash: str               # content hash, stable across restarts
+
+
+class DeviceIndex:
+    """ O(1) lookups over a list of devices (and themes) from a config. """
+    def __init__(self, devices: list[DeviceConfig], themes: list[ThemeSelectionConfig] | None = None):
+        self.devices = list(devices or [])
+        self.by_id = {device['id']: device for device in self.devices}
+        self.by_address = {device['address']: device for device in self.devices}
+        self.themes = {theme['id']: theme for theme in themes or []}
+        self.master = next((device for device in self.devices if device.get('master_sync')), None)
+
+    def device(self, device_id: int) -> DeviceConfig | None:
+        """ Device config by id. """
+        return self.by_id.get(device_id)
+
+    def device_by_address(self, address: str) -> DeviceConfig | None:
+        """ Device config by its configured address. """
+        return self.by_address.get(address)
+
+    def is_active(self, device_id: int) -> bool:
+        """ Determines if provided device_id is active. """
+        device = self.by_id.get(device_id)
+        return bool(device and device['active'])
+
+    def theme(self, theme_id: int) -> ThemeSelectionConfig | None:
+        """ Theme config by id. """
+        return self.themes.get(theme_id)
+
+    def addresses(self, get_inactive: bool = True) -> list[str]:
+        """ Device addresses in config order. """
+        return [device['address'] for device in self.devices if get_inactive or device['active']]
+
+
+class ConfigStore:     # pylint: disable=too-many-instance-attributes
+    """
+        Thread-safe holder of the parsed config and its `DeviceIndex`.
+
+        `get()` costs one `os.stat` while the file is unchanged. The returned config is shared,
+        treat it as read-only (build a new dict and `save()` it to change the config).
+    """
+    def __init__(self, file_path: str = CONFIG_PATH):
+        self._lock = Lock()
+        self.file_path = file_path
+        self._config: NaariSettingsConfig | None = None
+        self._index = DeviceIndex([])
+        self._settings: Settings | None = None
+        self._stat: tuple[int, int] | int | None = None     # file (mtime, size), or SQLite revision
+        self._checked_at = 0.0                   # monotonic time of the last SQLite revision read
+        self._digest: str | None = None          # hash of the file bytes (disk change detection)
+        self._content_digest: str | None = None  # hash of the normalized config (token)
+        self._version = 0
+        self._history: OrderedDict[str, NaariSettingsConfig] = OrderedDict()   # content hash -> config
+
+    def _file_stat(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _file_digest(self) -> str | None:
+        try:
+            with open(self.file_path, 'rb') as file:
+                return hashlib.sha256(file.read()).hexdigest()
+        except OSError:
+            return None
+
+    def _set(self, config: NaariSettingsConfig, content_digest: str) -> None:
+        """ Caller holds the lock. """
+        if content_digest != self._content_digest:
+            self._version += 1
+            self._content_digest = content_digest
+        self._config = config
+        self._index = DeviceIndex(config.get('devices', []), config.get('themes', []))
+        self._settings = Settings.from_ui_settings(config['ui_settings'])
+
+        self._history[content_digest] = config
+        self._history.move_to_end(content_digest)
+        while len(self._history) > CONFIG_HISTORY:
+            self._history.popitem(last=False)
+
+    def _load(self) -> None:
+        """
+            (Re)load the config into the store. Caller holds the lock.
+            The first load may fall back to a base config; a failed reload keeps the current one.
+        """
+        if self._config is None:
+            config = naari_config_load(self.file_path)
+        else:
+            try:
+                config = naari_config_load(self.file_path, initial=False)
+            except RELOAD_ERRORS as e:
+                LogManager.print_message(
+                    "[config_store] Reload of %s failed, keeping config version %s: %s",
+                    self.file_path, self._version, e,
+                    to_log=TO_LOG,
+                    log_level=logging.ERROR
+                )
+                return
+        self._set(config, hashlib.sha256(serialize_config(config)).hexdigest())
+
+    def _refresh(self) -> None:
+        """ Reload from disk when the file changed. Caller holds the lock. """
+        if SQLITE_BACKEND is not None:
+            now = time.monotonic()
+            if self._config is not None and now - self._checked_at < REVISION_INTERVAL:
+                return
+            self._checked_at = now
+            if self._config is None or SQLITE_BACKEND.revision() != self._stat:
+                self._load()
+                self._stat = SQLITE_BACKEND.revision()
+            return
+
+        if self._config is not None and CONFIG_WRITER.has_pending(self.file_path):
+            return      # memory is ahead of the file until the background write lands
+
+        stat = self._file_stat()
+        if self._config is not None and stat == self._stat:
+            return      # unchanged (or still missing, already reported)
+
+        # Stat taken before reading, so a write landing mid-reload is picked up on the next call
+        digest = self._file_digest()
+        if self._config is None or digest is None or digest != self._digest:
+            self._load()
+        self._stat, self._digest = stat, digest
+
+    def get(self) -> NaariSettingsConfig:
+        """ Current config, re-read only if the file changed on disk. """
+        with self._lock:
+            self._refresh()
+            return self._config
+
+    def token(self) -> ConfigToken:
+        """ Version token of the current config. """
+        with self._lock:
+            self._refresh()
+            return {"version": self._version, "hash": self._content_digest}
+
+    def is_current(self, token: ConfigToken | None) -> bool:
+        """ True when a browser token refers to the current config content. """
+        return isinstance(token, dict) and token.get('hash') == self.token()['hash']
+
+    def config_for(self, content_hash: str | None) -> NaariSettingsConfig | None:
+        """ A recent config version by its token hash (None once it fell out of the history). """
+        with self._lock:
+            self._refresh()
+            return self._history.get(content_hash)
+
+    def settings(self) -> Settings:
+        """ Typed UI settings of the current config (`settings().polling_rate`). """
+        with self._lock:
+            self._refresh()
+            return self._settings
+
+    def index(self) -> DeviceIndex:
+        """ Lookups for the current config. """
+        with self._lock:
+            self._refresh()
+            return self._index
+
+    def save(self, config: NaariSettingsConfig, defer: bool = True) -> bool:
+        """
+            Validate the config, make it current and persist it without re-reading it.
+            By default the write is queued on the background writer, so the caller does not wait on the disk;
+            the store recognises its own write by content hash once it lands.
+
+            Returns:
+                False when the content is unchanged (nothing written, version kept), True otherwise.
+
+            Raises:
+                ConfigValidationError: If the config does not match the schema (store and file unchanged).
+        """
+        config = validate_config(config)
+        content_digest = hashlib.sha256(serialize_config(config)).hexdigest()
+        with self._lock:
+            self._refresh()
+            if content_digest == self._content_digest:
+                return False
+            payload = save_configer(config, self.file_path, defer=defer)
+            self._set(config, content_digest)
+            self._digest = hashlib.sha256(payload).hexdigest()
+            if SQLITE_BACKEND is not None:
+                self._stat = SQLITE_BACKEND.revision()
+            elif not defer:
+                self._stat = self._file_stat()
+        return True
+
+
+CONFIG_STORE = ConfigStore()
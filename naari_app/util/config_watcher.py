@@ -0,0 +1,221 @@
+"""
+Modular contains the config watcher: picks up config changes made outside the app (e.g. Ansible editing
+`naari_config.json`) without a restart, and applies only what changed.
+
+    - Uses inotify on the config folder when `inotify_simple` is installed (Linux), polls otherwise
+      (and always with the SQLite backend, whose revision counter is cheap to read).
+    - Every new config version is diffed against the previous one:
+        removed devices lose their caches (state, presets, DNS, rate limit, I/O governor), command lane
+        and any capability fetch running against them,
+        added devices get their status and presets fetched, themes are recompiled.
+    - The poller sees the new device list on its next tick (it reads `CONFIG_STORE.index()`), and
+      pushes the new config token to the browser so the UI follows.
+Saves made through the UI go through the same diff, so removing a device in the modal also cleans up after it.
+"""
+
+from dataclasses import dataclass
+from threading import Event, Lock, Thread
+import os
+import logging
+
+from dotenv import load_dotenv
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags     # optional, Linux only
+except ImportError:
+    INotify = None
+
+from naari_logging.naari_logger import LogManager
+from naari_app.util.config_builder import NaariSettingsConfig
+from naari_app.util.config_store import CONFIG_STORE, ConfigStore
+from naari_app.util.config_sqlite import SQLITE_BACKEND
+from naari_app.util.device_state_cache import DEVICE_STATE_CACHE
+from naari_app.util.preset_cache import PRESET_CACHE
+from naari_app.util.dns_cache import DNS_CACHE
+from naari_app.util.rate_limiter import DEVICE_RATE_LIMITER
+from naari_app.util.io_governor import DEVICE_IO_GOVERNOR
+from naari_app.util.command_queue import COMMAND_QUEUE
+from naari_app.util.capability_cache import CAPABILITY_CACHE
+from naari_app.util.theme_plans import THEME_PLANS
+from naari_app.util.initial_load import update_initial_load
+
+__all__ = [
+    'ConfigDiff',
+    'diff_configs',
+    'ConfigWatcher',
+    'CONFIG_WATCHER'
+]
+
+MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+load_dotenv(os.path.join(MAINDIR, ".env"))
+TO_LOG = int(os.getenv("LOGGING", "0")) == 1
+
+WATCH_INTERVAL = 2.0        # seconds between checks without inotify (and inotify read timeout)
+
+
+@dataclass(frozen=True)
+class ConfigDiff:
+    """ What changed between two config versions. Addresses for devices, ids for themes. """
+    added_devices: frozenset[str] = frozenset()
+    removed_devices: frozenset[str] = frozenset()
+    changed_devices: frozenset[int] = frozenset()       # same id, different settings (name, sync, active)
+    changed_themes: frozenset[int] = frozenset()        # added, removed or edited
+    ui_settings_changed: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.added_devices or self.removed_devices or self.changed_devices
+                    or self.changed_themes or self.ui_settings_changed)
+
+
+def diff_configs(old: NaariSettingsConfig | None, new: NaariSettingsConfig) -> ConfigDiff:
+    """ Structural diff of two configs. """
+    old = old or {}
+    old_devices = {device['id']: device for device in old.get('devices', [])}
+    new_devices = {device['id']: device for device in new.get('devices', [])}
+    old_addresses = {device['address'] for device in old_devices.values()}
+    new_addresses = {device['address'] for device in new_devices.values()}
+
+    old_themes = {theme['id']: theme for theme in old.get('themes', [])}
+    new_themes = {theme['id']: theme for theme in new.get('themes', [])}
+
+    return ConfigDiff(
+        added_devices=frozenset(new_addresses - old_addresses),
+        removed_devices=frozenset(old_addresses - new_addresses),
+        changed_devices=frozenset(
+            device_id for device_id, device in new_devices.items()
+            if device_id in old_devices and old_devices[device_id] != device
+        ),
+        changed_themes=frozenset(
+            theme_id for theme_id in old_themes.keys() | new_themes.keys()
+            if old_themes.get(theme_id) != new_themes.get(theme_id)
+        ),
+        ui_settings_changed=old.get('ui_settings') != new.get('ui_settings')
+    )
+
+
+def _listing(items) -> str:
+    return ", ".join(str(item) for item in sorted(items)) or "-"
+
+
+class ConfigWatcher:
+    """ Background thread applying config changes as they land. """
+    def __init__(self, store: ConfigStore = CONFIG_STORE, interval: float = WATCH_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Thread | None = None
+        self._config: NaariSettingsConfig | None = None
+        self._hash: str | None = None
+
+    def start(self) -> None:
+        """ Start watching (once per process). """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._config, self._hash = self.store.get(), self.store.token()['hash']
+            self._thread = Thread(target=self._run, name="naari-config-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """ Stop the watcher thread. """
+        self._stop.set()
+
+    def _run(self) -> None:
+        notifier = self._inotify()
+        last_stat = self._stat()
+        while not self._stop.is_set():
+            if notifier is not None:
+                name = os.path.basename(self.store.file_path)
+                events = notifier.read(timeout=int(self.interval * 1000))
+                if events and not any(event.name == name for event in events):
+                    continue
+            else:
+                self._stop.wait(self.interval)
+                # Polling can't tell a finished edit from one in progress: wait until the file stops changing
+                stat = self._stat()
+                if stat != last_stat:
+                    last_stat = stat
+                    continue
+            try:
+                self.check()
+            except Exception as e:      # pylint: disable=broad-exception-caught
+                # Half-written or invalid edit: keep serving the current config, try again on the next change
+                LogManager.print_message(
+                    "[config_watcher] Config change not applied: %s",
+                    e,
+                    to_log=TO_LOG,
+                    log_level=logging.ERROR
+                )
+
+    def _stat(self) -> tuple[int, int] | None:
+        if SQLITE_BACKEND is not None:
+            return None
+        try:
+            stat = os.stat(self.store.file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _inotify(self):
+        """ inotify on the config folder (atomic saves replace the file, so the file itself can't be watched). """
+        if INotify is None or SQLITE_BACKEND is not None:
+            return None
+        try:
+            notifier = INotify()
+            notifier.add_watch(
+                os.path.dirname(os.path.abspath(self.store.file_path)),
+                inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE
+            )
+            return notifier
+        except OSError as e:
+            LogManager.print_message(
+                "[config_watcher] inotify unavailable, polling instead: %s",
+                e,
+                to_log=TO_LOG,
+                log_level=logging.WARNING
+            )
+            return None
+
+    def check(self) -> ConfigDiff | None:
+        """ Apply the changes since the last check. Returns the diff, None when the config did not change. """
+        config = self.store.get()
+        content_hash = self.store.token()['hash']
+        with self._lock:
+            if content_hash == self._hash:
+                return None
+            previous, self._config, self._hash = self._config, config, content_hash
+
+        diff = diff_configs(previous, config)
+        if diff:
+            self.apply(diff)
+        return diff
+
+    @staticmethod
+    def apply(diff: ConfigDiff) -> None:
+        """ Evict removed devices, fetch added ones, recompile themes. """
+        for address in diff.removed_devices:
+            DEVICE_STATE_CACHE.forget(address)
+            PRESET_CACHE.forget(address)
+            DNS_CACHE.forget(address)
+            DEVICE_RATE_LIMITER.forget(address)
+            COMMAND_QUEUE.forget(address)
+            DEVICE_IO_GOVERNOR.forget(address)
+            CAPABILITY_CACHE.forget(address)
+
+        if diff.added_devices or diff.removed_devices:
+            update_initial_load(added=diff.added_devices, removed=diff.removed_devices)
+
+        if diff.changed_themes or diff.added_devices or diff.removed_devices or diff.changed_devices:
+            THEME_PLANS.plans()
+
+        LogManager.print_message(
+            "[config_watcher] Config reloaded: devices added %s, removed %s, changed %s; themes changed %s%s",
+            _listing(diff.added_devices), _listing(diff.removed_devices), _listing(diff.changed_devices),
+            _listing(diff.changed_themes), "; ui settings changed" if diff.ui_settings_changed else "",
+            to_log=TO_LOG,
+            log_level=logging.INFO
+        )
+
+
+CONFIG_WATCHER = ConfigWatcher()
@@ -0,0 +1,169 @@
+"""
+Modular contains the atomic, debounced writer used to persist the config file.
+
+    - Atomic: data goes to a temp file in the same folder, is fsync'd, then renamed over the target.
+      A crash mid-write leaves either the old or the new file, never a truncated one.
+    - Debounced: saves landing within DEBOUNCE_SECONDS are coalesced into one write by a background
+      timer, and content identical to the last write is skipped (SD-card wear on the Pi).
+    - A deferred write that fails stays pending and is retried every RETRY_SECONDS; the error is kept
+      (`last_error`) so the next save can write synchronously and report it.
+Anything still pending is flushed at interpreter exit.
+"""
+
+from threading import Lock, Timer
+import atexit
+import hashlib
+import tempfile
+import os
+import logging
+
+from dotenv import load_dotenv
+
+from naari_logging.naari_logger import LogManager
+
+__all__ = [
+    'atomic_write',
+    'ConfigWriter',
+    'CONFIG_WRITER'
+]
+
+MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+load_dotenv(os.path.join(MAINDIR, ".env"))
+TO_LOG = int(os.getenv("LOGGING", "0")) == 1
+
+DEBOUNCE_SECONDS = 1.0      # window in which successive saves become one disk write
+RETRY_SECONDS = 5.0         # delay before retrying a failed background write
+
+
+def atomic_write(file_path: str, payload: bytes) -> None:
+    """
+    Replace `file_path` with `payload` atomically (temp file + fsync + rename).
+
+    Raises:
+        OSError: If the file cannot be written. The original file is left untouched.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=f".{os.path.basename(file_path)}.",
+                                     suffix=".tmp", delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+        try:
+            tmp_file.write(payload)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        except OSError:
+            tmp_file.close()
+            os.unlink(tmp_path)
+            raise
+    try:
+        os.replace(tmp_path, file_path)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+
+    # Persist the rename itself (not supported on every platform, e.g. Windows)
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+class ConfigWriter:     # pylint: disable=too-many-instance-attributes
+    """ Coalesces file writes per path and performs them on a background timer. """
+    def __init__(self, delay: float = DEBOUNCE_SECONDS, retry_delay: float = RETRY_SECONDS):
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self.delay = delay
+        self.retry_delay = retry_delay
+        self._pending: dict[str, bytes] = {}
+        self._writing: set[str] = set()           # paths taken off `_pending` whose write has not finished
+        self._written: dict[str, str] = {}        # path -> digest of the last payload on disk
+        self._errors: dict[str, OSError] = {}     # path -> error of its last failed write
+        self._timer: Timer | None = None
+
+    def _start_timer(self, delay: float) -> None:
+        """ Caller holds the lock. """
+        if self._timer is None:
+            self._timer = Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def schedule(self, file_path: str, payload: bytes) -> None:
+        """ Queue `payload` for `file_path`; a newer payload for the same path replaces it. """
+        with self._lock:
+            self._pending[file_path] = payload
+            self._start_timer(self.delay)
+
+    def write_now(self, file_path: str, payload: bytes) -> None:
+        """
+            Synchronous atomic write, replacing anything pending for the path once it succeeded.
+
+            Raises:
+                OSError: If the file cannot be written (a pending payload stays queued).
+        """
+        with self._flush_lock:
+            self._write(file_path, payload)
+            with self._lock:
+                self._pending.pop(file_path, None)
+
+    def _write(self, file_path: str, payload: bytes) -> None:
+        """ Caller holds the flush lock. Records the outcome in `_errors` and re-raises a failure. """
+        digest = hashlib.sha256(payload).hexdigest()
+        if self._written.get(file_path) == digest and os.path.exists(file_path):
+            return
+        try:
+            atomic_write(file_path, payload)
+        except OSError as e:
+            LogManager.print_message(
+                "[config_writer] Failed to write %s: %s",
+                file_path, e,
+                to_log=TO_LOG,
+                log_level=logging.ERROR
+            )
+            with self._lock:
+                self._errors[file_path] = e
+            raise
+        self._written[file_path] = digest
+        with self._lock:
+            self._errors.pop(file_path, None)
+
+    def flush(self) -> None:
+        """ Write everything pending now (timer callback, and at exit). Failed writes are queued again for a retry. """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._writing.update(pending)
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            for file_path, payload in pending.items():
+                try:
+                    self._write(file_path, payload)
+                except OSError:
+                    with self._lock:
+                        # A newer payload queued meanwhile supersedes the failed one
+                        self._pending.setdefault(file_path, payload)
+                        self._start_timer(self.retry_delay)
+                finally:
+                    with self._lock:
+                        self._writing.discard(file_path)
+
+    def has_pending(self, file_path: str) -> bool:
+        """ True while a write for the path is queued, being written or waiting on a retry. """
+        with self._lock:
+            return file_path in self._pending or file_path in self._writing
+
+    def last_error(self, file_path: str) -> OSError | None:
+        """ Error of the last write of the path, None once a write succeeded. """
+        with self._lock:
+            return self._errors.get(file_path)
+
+
+CONFIG_WRITER = ConfigWriter()
+atexit.register(CONFIG_WRITER.flush)
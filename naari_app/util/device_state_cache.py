@@ -0,0 +1,88 @@
+""" Modular holds the process-wide cache of the last known state of each WLED device. """
+
+from threading import Lock
+import copy
+import time
+from typing import Any
+
+__all__ = [
+    'DeviceStateCache',
+    'DEVICE_STATE_CACHE'
+]
+
+
+class DeviceStateCache:
+    """
+        Thread-safe store of the latest known `/json` entry per device address.
+
+        Entries keep the same shape as the polled data ({"ip": ..., "data": {...}}) and are fed from two places:
+            - Interval polling (`poll_all_devices`)
+            - The confirmed state WLED returns when a POST is sent with `"v": true` (write-through)
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._updated: dict[str, float] = {}
+
+    def update_state(self, address: str, state: dict[str, Any]) -> None:
+        """ Write-through of a confirmed `state` object returned by the device. """
+        if not address or not isinstance(state, dict):
+            return
+        with self._lock:
+            entry = self._entries.setdefault(address, {"ip": address, "data": {}})
+            entry['data'] = {**entry.get('data', {}), 'state': copy.deepcopy(state)}
+            self._updated[address] = time.monotonic()
+
+    def update_from_poll(self, polled_data: list[dict[str, Any]], started_at: float) -> list[dict[str, Any]]:
+        """
+            Store successful poll entries and return the polled list with fresher cached states applied.
+
+            A poll that started before a command was confirmed may carry the pre-command state.
+            In that case the confirmed state is kept and handed back in place of the stale one.
+        """
+        merged = []
+        with self._lock:
+            for entry in polled_data or []:
+                address = entry.get('ip')
+                # Deferred (rate limited) entries are echoes of this cache, not fresh data
+                if 'data' not in entry or not address or entry.get('deferred'):
+                    merged.append(entry)
+                    continue
+
+                if self._updated.get(address, 0) > started_at:
+                    cached_state = self._entries[address]['data'].get('state')
+                    entry = {**entry, 'data': {**entry['data'], 'state': copy.deepcopy(cached_state)}}
+                else:
+                    self._entries[address] = copy.deepcopy(entry)
+                    self._updated[address] = time.monotonic()
+                merged.append(entry)
+        return merged
+
+    def get_state(self, address: str) -> dict[str, Any] | None:
+        """ Return a copy of the last known `state` object of a device, None if never seen. """
+        with self._lock:
+            entry = self._entries.get(address)
+            if not entry or 'state' not in entry.get('data', {}):
+                return None
+            return copy.deepcopy(entry['data']['state'])
+
+    def get_entry(self, address: str) -> dict[str, Any] | None:
+        """ Return a copy of the full cached `/json` entry of a device. """
+        with self._lock:
+            entry = self._entries.get(address)
+            return copy.deepcopy(entry) if entry else None
+
+    def age(self, address: str) -> float | None:
+        """ Seconds since the device entry was last refreshed, None if never seen. """
+        with self._lock:
+            updated = self._updated.get(address)
+        return None if updated is None else time.monotonic() - updated
+
+    def forget(self, address: str) -> None:
+        """ Drop everything known about a device (e.g. removed from config). """
+        with self._lock:
+            self._entries.pop(address, None)
+            self._updated.pop(address, None)
+
+
+DEVICE_STATE_CACHE = DeviceStateCache()
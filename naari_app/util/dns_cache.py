@@ -0,0 +1,187 @@
+"""
+Modular contains the resolver cache for devices configured by DNS name (e.g. `wled-kitchen.local`).
+
+mDNS / .local lookups on a Pi can take 100ms+ or time out, and both the poller (httpx) and
+commands (requests) would otherwise re-resolve on every new connection.
+    - Resolved addresses are kept for DNS_TTL, failures for NEGATIVE_TTL (negative caching)
+    - Expired entries are still served while a background refresh runs (stale-while-refresh)
+    - Known devices are resolved in the background when the config loads, off the request path
+IP addresses pass straight through. Results keep the configured address as the device key;
+only the URL that goes on the wire carries the resolved IP.
+"""
+
+from threading import Lock, Thread
+from typing import Iterable
+from urllib.parse import urlsplit
+import ipaddress
+import asyncio
+import socket
+import os
+import logging
+import time
+
+from dotenv import load_dotenv
+
+from naari_logging.naari_logger import LogManager
+
+__all__ = [
+    'UnresolvedHost',
+    'DNSCache',
+    'DNS_CACHE'
+]
+
+MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+load_dotenv(os.path.join(MAINDIR, ".env"))
+TO_LOG = int(os.getenv("LOGGING", "0")) == 1
+
+DNS_TTL = 300.0             # seconds a resolved address is fresh
+NEGATIVE_TTL = 30.0         # seconds a failed lookup is remembered before trying again
+
+
+class UnresolvedHost(RuntimeError):
+    """Raised when a device hostname could not be resolved (or recently failed to)."""
+    def __init__(self, host: str):
+        super().__init__(f"Could not resolve device host {host}")
+        self.host = host
+
+
+def _split_address(address: str) -> tuple[str, int | None]:
+    """ Config address (host[:port]) -> (host, port). """
+    parts = urlsplit(f"//{address}")
+    return parts.hostname or address, parts.port
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+class DNSCache:
+    """ Thread-safe hostname -> IP cache, shared by the poller and the command path. """
+    def __init__(self, ttl: float = DNS_TTL, negative_ttl: float = NEGATIVE_TTL):
+        self._lock = Lock()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: dict[str, tuple[str | None, float]] = {}    # host -> (ip or None, expires_at)
+        self._host_locks: dict[str, Lock] = {}
+        self._refreshing: set[str] = set()
+
+    def _lookup(self, host: str) -> str | None:
+        """ Blocking system lookup (mDNS included via nss). Prefers IPv4, None on failure. """
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError, OSError) as e:
+            LogManager.print_message(
+                "DNS lookup failed for %s: %s",
+                host, e,
+                to_log=TO_LOG,
+                log_level=logging.WARNING
+            )
+            return None
+        ipv4 = [info[4][0] for info in infos if info[0] == socket.AF_INET]
+        return ipv4[0] if ipv4 else (infos[0][4][0] if infos else None)
+
+    def _store(self, host: str, ip: str | None) -> str | None:
+        """ Saves a lookup result. A failed refresh keeps a previously known IP instead of dropping it. """
+        with self._lock:
+            if ip is None:
+                previous = self._entries.get(host, (None, 0))[0]
+                self._entries[host] = (previous, time.monotonic() + self.negative_ttl)
+                return previous
+            self._entries[host] = (ip, time.monotonic() + self.ttl)
+            return ip
+
+    def _refresh(self, host: str) -> None:
+        try:
+            self._store(host, self._lookup(host))
+        finally:
+            with self._lock:
+                self._refreshing.discard(host)
+
+    def _refresh_in_background(self, host: str) -> None:
+        with self._lock:
+            if host in self._refreshing:
+                return
+            self._refreshing.add(host)
+        Thread(target=self._refresh, args=(host,), name=f"dns-refresh-{host}", daemon=True).start()
+
+    def _resolve_host(self, host: str) -> str:
+        with self._lock:
+            ip, expires_at = self._entries.get(host, (None, None))
+        if expires_at is not None:
+            if ip is not None:
+                if time.monotonic() >= expires_at:
+                    self._refresh_in_background(host)
+                return ip
+            if time.monotonic() < expires_at:
+                raise UnresolvedHost(host)
+
+        # Cold miss (or expired failure): one lookup per host, concurrent callers wait for it
+        with self._lock:
+            host_lock = self._host_locks.setdefault(host, Lock())
+        with host_lock:
+            with self._lock:
+                ip, expires_at = self._entries.get(host, (None, 0))
+            if expires_at <= time.monotonic():
+                ip = self._store(host, self._lookup(host))
+        if ip is None:
+            raise UnresolvedHost(host)
+        return ip
+
+    def resolve(self, address: str) -> str:
+        """
+        Configured device address -> address to put on the wire (host swapped for its IP, port kept).
+        Only blocks on a cold miss.
+
+        Raises:
+            UnresolvedHost: If the host does not resolve (cached for NEGATIVE_TTL).
+        """
+        host, port = _split_address(address)
+        if _is_ip(host):
+            return address
+        ip = self._resolve_host(host)
+        ip = f"[{ip}]" if ":" in ip else ip
+        return f"{ip}:{port}" if port else ip
+
+    async def resolve_async(self, address: str) -> str:
+        """ `resolve` for event loops; a cold miss is looked up in a worker thread. """
+        host, _ = _split_address(address)
+        with self._lock:
+            ip, expires_at = self._entries.get(host, (None, 0))
+        # Served from cache (stale IPs included, refreshed in the background) without blocking the loop
+        if _is_ip(host) or ip is not None or expires_at > time.monotonic():
+            return self.resolve(address)
+        return await asyncio.to_thread(self.resolve, address)
+
+    def prewarm(self, addresses: Iterable[str]) -> None:
+        """ Resolve device hostnames in the background (e.g. at config load). """
+        for address in addresses or []:
+            host, _ = _split_address(address)
+            if host and not _is_ip(host):
+                with self._lock:
+                    known = host in self._entries
+                if not known:
+                    self._refresh_in_background(host)
+
+    def mark_stale(self, address: str) -> None:
+        """ Connection to a device failed: keep serving the IP but re-resolve it in the background (DHCP moves). """
+        host, _ = _split_address(address)
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is None or entry[0] is None:
+                return
+            self._entries[host] = (entry[0], 0.0)
+        self._refresh_in_background(host)
+
+    def forget(self, address: str) -> None:
+        """ Drop a cached host (e.g. device removed from config). """
+        host, _ = _split_address(address)
+        with self._lock:
+            self._entries.pop(host, None)
+            self._host_locks.pop(host, None)
+
+
+DNS_CACHE = DNSCache()
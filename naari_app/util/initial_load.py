@@ -1,9 +1,13 @@
 import asyncio
 from threading import Lock
+from typing import Iterable
 import time
 
 from naari_app.util.config_builder import DeviceConfig
-from naari_app.util.wled_device_status import get_devices_ip, run_status, get_presets
+from naari_app.util.util_functions import get_devices_ip
+from naari_app.util.wled_device_status import run_status, get_presets
+from naari_app.util.device_state_cache import DEVICE_STATE_CACHE
+from naari_app.util.config_store import CONFIG_STORE
 
 _load_lock = Lock()
 
@@ -21,7 +25,8 @@ def get_initial_load(naari_devices: list[DeviceConfig]):
             devices_ip = get_devices_ip(naari_devices)
 
             try:
-                INITIAL_DEVICES = asyncio.run(run_status(devices_ip))
+                started_at = time.monotonic()
+                INITIAL_DEVICES = DEVICE_STATE_CACHE.update_from_poll(asyncio.run(run_status(devices_ip)), started_at)
                 time.sleep(.5)   # throttles loading to allow for devices load into environment
                 INITIAL_PRESETS = asyncio.run(get_presets(devices_ip))
             except:
@@ -29,3 +34,46 @@ def get_initial_load(naari_devices: list[DeviceConfig]):
                 INITIAL_PRESETS = {}
 
     return INITIAL_DEVICES, INITIAL_PRESETS
+
+
+def update_initial_load(added: Iterable[str], removed: Iterable[str]) -> None:
+    """
+        Apply a config change to the cached initial load: drop removed device addresses, fetch added ones.
+        Fetching happens outside the lock; the results are merged in afterwards for the devices still configured.
+    """
+    global INITIAL_DEVICES, INITIAL_PRESETS
+    added, removed = list(added), set(removed)
+
+    with _load_lock:
+        if INITIAL_DEVICES is None or INITIAL_PRESETS is None:
+            return      # nothing loaded yet, the first page load fetches the current config
+        if not isinstance(INITIAL_DEVICES, list) or not isinstance(INITIAL_PRESETS, list):
+            # Earlier load failed, start over on the next page load
+            INITIAL_DEVICES = INITIAL_PRESETS = None
+            return
+
+        gone = removed.union(added)     # re-added addresses are fetched again
+        INITIAL_DEVICES = [device for device in INITIAL_DEVICES if device.get('ip') not in gone]
+        INITIAL_PRESETS = [preset for preset in INITIAL_PRESETS if preset.get('ip') not in gone]
+        if not added:
+            return
+
+    try:
+        started_at = time.monotonic()
+        fetched_devices = DEVICE_STATE_CACHE.update_from_poll(asyncio.run(run_status(added)), started_at)
+        fetched_presets = asyncio.run(get_presets(added))
+    except Exception:       # pylint: disable=broad-exception-caught
+        fetched_devices = fetched_presets = None
+
+    # A later change may have removed (or re-added) some of them while fetching
+    configured = set(added).intersection(CONFIG_STORE.index().addresses())
+    with _load_lock:
+        if not isinstance(INITIAL_DEVICES, list) or not isinstance(INITIAL_PRESETS, list):
+            return      # reset meanwhile, the next page load fetches everything
+        if fetched_devices is None:
+            INITIAL_DEVICES = INITIAL_PRESETS = None
+            return
+        INITIAL_DEVICES = ([device for device in INITIAL_DEVICES if device.get('ip') not in configured]
+                           + [device for device in fetched_devices if device.get('ip') in configured])
+        INITIAL_PRESETS = ([preset for preset in INITIAL_PRESETS if preset.get('ip') not in configured]
+                           + [preset for preset in fetched_presets if preset.get('ip') in configured])
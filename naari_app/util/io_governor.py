@@ -0,0 +1,138 @@
+"""
+Modular contains the device I/O governor: priority lanes for everything sent to a single WLED device.
+
+Lanes (highest first):
+    1) COMMAND          -> interactive user commands (power, brightness, presets)
+    2) PRESET_REFRESH   -> /presets.json fetches
+    3) POLL             -> periodic /json status polls
+
+While a device has commands queued or in flight, lower lanes give way:
+    - Polls are skipped and in-flight polls are cancelled (the poller reuses the last known state)
+    - Preset refreshes wait for the commands to finish, and restart if a command interrupts them
+"""
+
+from dataclasses import dataclass
+from enum import IntEnum
+from threading import Lock
+from typing import Any, Awaitable
+import asyncio
+import time
+
+__all__ = [
+    'Priority',
+    'DevicePreempted',
+    'DeviceIOGovernor',
+    'DEVICE_IO_GOVERNOR'
+]
+
+PRESET_REFRESH_MAX_WAIT = 5.0       # seconds a preset refresh waits for a busy device before going anyway
+_WAIT_STEP = 0.05                   # seconds between busy checks
+
+
+class Priority(IntEnum):
+    """ Device I/O lanes, lower value wins. """
+    COMMAND = 0
+    PRESET_REFRESH = 1
+    POLL = 2
+
+
+class DevicePreempted(RuntimeError):
+    """Raised when lower priority device I/O gives way to a user command."""
+    def __init__(self, address: str, priority: Priority):
+        super().__init__(f"{priority.name.lower()} request to {address} preempted by a command")
+        self.address = address
+        self.priority = priority
+
+
+@dataclass(eq=False)
+class _Ticket:
+    """ A running lower priority request that can be told to stop. """
+    priority: Priority
+    loop: asyncio.AbstractEventLoop
+    preempt: asyncio.Event
+
+
+class DeviceIOGovernor:
+    """
+        Thread-safe, loop agnostic coordinator between the command queue and background reads.
+
+        The command queue reports how many commands each device has (`set_command_load`),
+        background reads run through `run` and are preempted when that load goes above zero.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._command_load: dict[str, int] = {}
+        self._tickets: dict[str, set[_Ticket]] = {}
+
+    def set_command_load(self, address: str, load: int) -> None:
+        """ Number of commands queued + in flight for a device. Anything above zero preempts lower lanes. """
+        with self._lock:
+            if load > 0:
+                self._command_load[address] = load
+                tickets = list(self._tickets.get(address, ()))
+            else:
+                self._command_load.pop(address, None)
+                tickets = []
+
+        for ticket in tickets:
+            ticket.loop.call_soon_threadsafe(ticket.preempt.set)
+
+    def is_busy(self, address: str) -> bool:
+        """ True while a device has commands queued or in flight. """
+        with self._lock:
+            return address in self._command_load
+
+    async def _wait_turn(self, address: str, priority: Priority) -> None:
+        """ Polls do not wait for a busy device, preset refreshes wait (bounded). """
+        if not self.is_busy(address):
+            return
+        if priority >= Priority.POLL:
+            raise DevicePreempted(address, priority)
+
+        deadline = time.monotonic() + PRESET_REFRESH_MAX_WAIT
+        while self.is_busy(address) and time.monotonic() < deadline:
+            await asyncio.sleep(_WAIT_STEP)
+
+    async def run(self, address: str, priority: Priority, request: Awaitable[Any]) -> Any:
+        """
+        Run a background request for a device in the given lane.
+
+        Raises:
+            DevicePreempted: If a command for the device was already active (polls)
+                or arrived while the request was in flight. The request is cancelled.
+        """
+        try:
+            await self._wait_turn(address, priority)
+        except DevicePreempted:
+            if asyncio.iscoroutine(request):
+                request.close()     # never started, avoids the "never awaited" warning
+            raise
+
+        ticket = _Ticket(priority=priority, loop=asyncio.get_running_loop(), preempt=asyncio.Event())
+        with self._lock:
+            self._tickets.setdefault(address, set()).add(ticket)
+            # A command may have landed between the turn check and registering
+            if priority >= Priority.POLL and address in self._command_load:
+                ticket.preempt.set()
+
+        work = asyncio.ensure_future(request)
+        preempted = asyncio.ensure_future(ticket.preempt.wait())
+        try:
+            await asyncio.wait({work, preempted}, return_when=asyncio.FIRST_COMPLETED)
+            if work.done():
+                return work.result()
+            raise DevicePreempted(address, priority)
+        finally:
+            work.cancel()
+            preempted.cancel()
+            with self._lock:
+                self._tickets.get(address, set()).discard(ticket)
+
+    def forget(self, address: str) -> None:
+        """ Drop everything tracked for a device (e.g. removed from config). """
+        with self._lock:
+            self._command_load.pop(address, None)
+            self._tickets.pop(address, None)
+
+
+DEVICE_IO_GOVERNOR = DeviceIOGovernor()
@@ -0,0 +1,110 @@
+"""
+Modular contains the server-side cache of device presets (`/presets.json` of every device).
+
+Filled by every preset fetch (initial load, refresh button). Each device keeps a digest of its preset content
+and the cache a `version` that only moves when some device's presets actually changed, so anything
+derived from presets (theme plans, dropdown options) can be rebuilt only when needed.
+
+Dropdown option lists ("id: name", sorted by name) are built once per preset digest and shared by every
+dropdown showing that device (main content and each theme card in the config modal).
+"""
+
+from threading import Lock
+from typing import Any, Iterable
+import hashlib
+import json
+
+__all__ = [
+    'preset_options',
+    'device_preset_list',
+    'PresetCache',
+    'PRESET_CACHE'
+]
+
+
+MAX_OPTION_LISTS = 256     # option lists kept (one per distinct preset content)
+
+
+def _digest(presets: dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(presets, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def preset_options(presets: dict[str, Any] | None) -> list[str]:
+    """ Dropdown options of a device's presets: "id: name", sorted by name (unnamed last). """
+    if not presets:
+        return []
+    preset_sorted = sorted(
+        ((int(key), value.get('n', None)) for key, value in presets.items()),
+        key=lambda item: (item[1] is None, str(item[1]).lower())
+    )
+    return [f"{key}: {value}" for key, value in preset_sorted]
+
+
+def device_preset_list(device_presets: dict[str, Any]) -> list[str]:
+    """ Requires results from Polling Presets off devices ({ip, data, ...}). """
+    return preset_options(device_presets.get('data', None))
+
+
+class PresetCache:
+    """ Thread-safe address -> presets mapping. Failed fetches keep the last known presets. """
+    def __init__(self):
+        self._lock = Lock()
+        self._presets: dict[str, dict[str, Any]] = {}
+        self._digests: dict[str, str] = {}
+        self._options: dict[str, list[str]] = {}      # preset digest -> dropdown options
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        """ Bumped whenever the presets of any device change. """
+        with self._lock:
+            return self._version
+
+    def update(self, fetched: Iterable[dict[str, Any]]) -> None:
+        """ Store a `get_presets` result ([{ip, data}|{ip, error...}]). """
+        with self._lock:
+            for entry in fetched or []:
+                presets = entry.get('data')
+                address = entry.get('ip')
+                if not address or not isinstance(presets, dict) or entry.get('deferred'):
+                    continue
+                digest = _digest(presets)
+                if self._digests.get(address) != digest:
+                    self._presets[address] = presets
+                    self._digests[address] = digest
+                    self._version += 1
+
+    def presets(self, address: str) -> dict[str, Any] | None:
+        """ Last known presets of a device ({"<id>": {"n": name, "bri": ...}}), None if never fetched. """
+        with self._lock:
+            return self._presets.get(address)
+
+    def digest(self, address: str) -> str | None:
+        """ Content hash of a device's presets. """
+        with self._lock:
+            return self._digests.get(address)
+
+    def options(self, address: str) -> list[str]:
+        """
+            Dropdown options of a device, built once per preset content (devices with identical presets share the list).
+            The list is shared: treat it as read-only.
+        """
+        with self._lock:
+            digest = self._digests.get(address)
+            if digest is None:
+                return []
+            if digest not in self._options:
+                if len(self._options) >= MAX_OPTION_LISTS:
+                    self._options.clear()      # presets of removed/edited devices, rebuilt on demand
+                self._options[digest] = preset_options(self._presets[address])
+            return self._options[digest]
+
+    def forget(self, address: str) -> None:
+        """ Drop a device (e.g. removed from the config). """
+        with self._lock:
+            if self._presets.pop(address, None) is not None:
+                self._digests.pop(address, None)
+                self._version += 1
+
+
+PRESET_CACHE = PresetCache()
@@ -0,0 +1,117 @@
+"""
+Modular contains the per-device token bucket rate limiter shared by polling and device commands.
+
+ESP8266 based WLED controllers start dropping connections at a few requests per second.
+Every GET (poll) and POST (command) attempt takes a token from the device's bucket:
+    - Polls are deferred when the bucket is empty
+    - Commands wait for the next token (they stay queued in the device command queue)
+"""
+
+from threading import Lock
+from urllib.parse import urlsplit
+import asyncio
+import time
+
+__all__ = [
+    'TokenBucket',
+    'DeviceRateLimiter',
+    'DEVICE_RATE_LIMITER',
+    'url_device_key'
+]
+
+# Hard coded default values. Here if nothing in config_file to reference.
+RATE_LIMIT = 4.0        # Sustained requests per second per device
+RATE_BURST = 6          # Requests a device may take back to back after being idle
+
+
+class TokenBucket:
+    """ Thread-safe token bucket. Loop agnostic, so it can be shared by sync threads and any event loop. """
+    def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_BURST):
+        self._lock = Lock()
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+
+    def _refill(self) -> None:
+        """ Adds tokens earned since the last call. Caller holds the lock. """
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def reconfigure(self, rate: float, burst: int) -> None:
+        """ Apply new limits, keeping the tokens already earned (capped to the new burst). """
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.burst = burst
+            self._tokens = min(self._tokens, burst)
+
+    def try_acquire(self, reserve: int = 0) -> bool:
+        """
+            Take a token if one is available right now.
+            `reserve` tokens are left untouched for higher priority callers (capped so a token can still be taken).
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1 + min(reserve, self.burst - 1):
+                self._tokens -= 1
+                return True
+            return False
+
+    def wait_time(self) -> float:
+        """ Seconds until the next token is available (0 if one is available now). """
+        with self._lock:
+            self._refill()
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def acquire_blocking(self) -> None:
+        """ Block the calling thread until a token is taken. """
+        while not self.try_acquire():
+            time.sleep(self.wait_time())
+
+    async def acquire(self) -> None:
+        """ Wait (without blocking the event loop) until a token is taken. """
+        while not self.try_acquire():
+            await asyncio.sleep(self.wait_time())
+
+
+class DeviceRateLimiter:
+    """ Registry of one `TokenBucket` per device address, all sharing the configured limits. """
+    def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_BURST):
+        self._lock = Lock()
+        self._buckets: dict[str, TokenBucket] = {}
+        self.rate = rate
+        self.burst = burst
+
+    def configure(self, rate: float, burst: int) -> None:
+        """ Update limits for every device. Invalid values (<= 0) fall back to the defaults. """
+        rate = rate if isinstance(rate, (int, float)) and rate > 0 else RATE_LIMIT
+        burst = int(burst) if isinstance(burst, (int, float)) and burst >= 1 else RATE_BURST
+        with self._lock:
+            if (rate, burst) == (self.rate, self.burst):
+                return
+            self.rate, self.burst = rate, burst
+            for bucket in self._buckets.values():
+                bucket.reconfigure(rate, burst)
+
+    def bucket(self, address: str) -> TokenBucket:
+        """ Bucket of a device, created on first use. """
+        with self._lock:
+            bucket = self._buckets.get(address)
+            if bucket is None:
+                bucket = self._buckets[address] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def forget(self, address: str) -> None:
+        """ Drop a device bucket (e.g. removed from config). """
+        with self._lock:
+            self._buckets.pop(address, None)
+
+
+DEVICE_RATE_LIMITER = DeviceRateLimiter()
+
+
+def url_device_key(url: str) -> str:
+    """ Bucket key for a device URL; the address exactly as written in the config (host[:port]). """
+    return urlsplit(url).netloc
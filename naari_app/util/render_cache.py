@@ -0,0 +1,70 @@
+"""
+Modular contains the render cache of config-derived layout sections (main content, config modal).
+
+Building these sections walks every device and theme (the theme tab is themes × devices components) and the
+result only depends on the config. Each section is built once per config version and kept serialized
+(plain JSON-ready dicts, as Dash sends them), so page loads and no-op saves hand back the same tree
+without constructing a single component.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable
+import json
+
+from plotly.io.json import to_json_plotly
+
+from naari_app.util.config_store import CONFIG_STORE, ConfigStore
+
+__all__ = [
+    'RenderCache',
+    'RENDER_CACHE'
+]
+
+MAX_RENDERS = 16        # (section, config version) entries kept; old versions fall out first
+
+
+def serialize_component(component: Any) -> Any:
+    """ Component tree -> the JSON-ready structure Dash renders (what a `children` State carries). """
+    return json.loads(to_json_plotly(component))
+
+
+class RenderCache:
+    """ Thread-safe (section, config hash) -> serialized component tree. """
+    def __init__(self, store: ConfigStore = CONFIG_STORE, max_renders: int = MAX_RENDERS):
+        self.store = store
+        self.max_renders = max_renders
+        self._lock = Lock()
+        self._renders: OrderedDict[tuple[str, str], Any] = OrderedDict()
+
+    def render(self, section: str, build: Callable[[], Any]) -> Any:
+        """
+            Serialized `build()` for the current config version; `build` runs only on a miss.
+            `build` must only depend on the config (read through `CONFIG_STORE`).
+        """
+        key = (section, self.store.token()['hash'])
+        with self._lock:
+            if key in self._renders:
+                self._renders.move_to_end(key)
+                return self._renders[key]
+
+        rendered = serialize_component(build())
+
+        # Config changed while building: hand the result out, but don't file it under the old version
+        if self.store.token()['hash'] != key[1]:
+            return rendered
+
+        with self._lock:
+            self._renders[key] = rendered
+            self._renders.move_to_end(key)
+            while len(self._renders) > self.max_renders:
+                self._renders.popitem(last=False)
+        return rendered
+
+    def clear(self) -> None:
+        """ Drop every render (e.g. after a layout code change in a dev session). """
+        with self._lock:
+            self._renders.clear()
+
+
+RENDER_CACHE = RenderCache()
@@ -1,22 +1,31 @@
 """ Modular contains 'POST' JSON API calls to the WLED devices. """
 
 import time
+import json
 from typing import Any, Dict
 import os
 import logging
 
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
 
 from naari_logging.naari_logger import LogManager
-from naari_app.util.config_builder import DeviceConfig, UISettings
+from naari_app.util.config_builder import DeviceConfig
+from naari_app.util.config_model import Settings
+from naari_app.util.device_state_cache import DEVICE_STATE_CACHE
+from naari_app.util.rate_limiter import DEVICE_RATE_LIMITER, url_device_key
+from naari_app.util.dns_cache import DNS_CACHE, UnresolvedHost
 
 __all__ =[
     'send_payload',
     'send_device_update',
+    'device_update_json',
+    'device_update_body',
     'send_device_power_update',
     'brightness_adjustment',
-    'send_preset'
+    'send_preset',
+    'confirmed_state'
 ]
 
 MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ",,"))
@@ -28,6 +37,12 @@ TO_LOG = int(os.getenv("LOGGING", "0")) == 1
 REQUEST_TIMEOUT = 2         # Timeout default so a dead device or device in general doesn't hang up the app
 RETRIES = 2
 RETRY_BACKOFF = 0.25        # slows down retry in seconds
+POOL_SIZE = 32              # Keep-alive connections kept per device host
+
+# Shared session so repeated POSTs (and fleet fan-outs) reuse keep-alive connections
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+_JSON_HEADERS = {"Content-Type": "application/json"}
 
 
 class PayloadRetryError(RuntimeError):
@@ -39,23 +54,34 @@ class PayloadRetryError(RuntimeError):
         self.last_exception = last_exception
 
 
-def _post_with_retries(url: str, json_body: Dict[str, Any], timeout: int = REQUEST_TIMEOUT, retries: int = RETRIES,     # pylint: disable=inconsistent-return-statements
-    backoff: float = RETRY_BACKOFF) -> requests.Response:
+def _post_with_retries(url: str, json_body: Dict[str, Any], timeout: int = REQUEST_TIMEOUT, retries: int = RETRIES,     # pylint: disable=inconsistent-return-statements, too-many-arguments, too-many-positional-arguments
+    backoff: float = RETRY_BACKOFF, device_key: str | None = None, body: bytes | None = None) -> requests.Response:
     """
     POST with small retry/backoff. Retries only on RequestException.
+    Every attempt (retries included) waits for a token from the device's rate limit bucket
+    (`device_key`, the configured address, defaults to the URL host).
+    `body`, when given, is `json_body` already serialized and is sent as is.
 
     Raises PayloadRetryError if all attempts fail due to network/timeout errors.
     """
     #last_exc: Optional[Exception] = None
+    device_key = device_key or url_device_key(url)
+    bucket = DEVICE_RATE_LIMITER.bucket(device_key)
     for attempt in range(1, retries + 1, 1):      # starting at 1
+        bucket.acquire_blocking()
         try:
-            request_data = requests.post(
-                url,
-                json=json_body,
-                timeout=timeout
-            )
+            if body is not None:
+                request_data = _SESSION.post(url, data=body, headers=_JSON_HEADERS, timeout=timeout)
+            else:
+                request_data = _SESSION.post(
+                    url,
+                    json=json_body,
+                    timeout=timeout
+                )
             return request_data  # leave status handling to caller
         except requests.RequestException as e:
+            if isinstance(e, requests.ConnectionError):
+                DNS_CACHE.mark_stale(device_key)     # device may have moved (DHCP), re-resolve in the background
             if attempt == retries:
                 LogManager.print_message(
                     "[send_payload] POST failed after %s attempts: %s",
@@ -67,7 +93,8 @@ def _post_with_retries(url: str, json_body: Dict[str, Any], timeout: int = REQUE
             time.sleep(backoff * (2 ** attempt))
 
 
-def send_payload(device_ip: str, json_body: Dict[str, Any], timeout: int = REQUEST_TIMEOUT, retries: int = RETRIES, backoff: float = RETRY_BACKOFF) -> requests.Response:
+def send_payload(device_ip: str, json_body: Dict[str, Any], timeout: int = REQUEST_TIMEOUT, retries: int = RETRIES, backoff: float = RETRY_BACKOFF,     # pylint: disable=too-many-arguments, too-many-positional-arguments
+                 body: bytes | None = None) -> requests.Response:
 
     """
     A POST JSON payload to a device's /json/state endpoint
@@ -78,6 +105,7 @@ def send_payload(device_ip: str, json_body: Dict[str, Any], timeout: int = REQUE
         timeout: sets time in seconds on when to trigger POST timeout.
         retries: sets number of attempts request.POST will retry request.
         backoff: sets offset time to add in between retries.
+        body: `json_body` pre-serialized (e.g. from a compiled theme plan), skips encoding per request.
 
     Returns:
         requests.Response (200, 400, 500)
@@ -86,17 +114,69 @@ def send_payload(device_ip: str, json_body: Dict[str, Any], timeout: int = REQUE
         PayloadRetryError: If all retry attempts fail due to RequestException.
 
     """
-    url = f"http://{device_ip}/json/state"
-    return _post_with_retries(
+    try:
+        url = f"http://{DNS_CACHE.resolve(device_ip)}/json/state"
+    except UnresolvedHost as e:
+        LogManager.print_message(
+            "[send_payload] POST to %s not sent: %s",
+            device_ip, e,
+            to_log=TO_LOG,
+            log_level=logging.ERROR
+        )
+        raise PayloadRetryError(f"http://{device_ip}/json/state", 0, e) from e
+
+    response = _post_with_retries(
         url,
         json_body,
         timeout,
         retries,
-        backoff
+        backoff,
+        device_key=device_ip,
+        body=body
     )
 
+    # Write-through: with "v": true WLED answers with the full resulting state.
+    if json_body.get('v'):
+        state = confirmed_state(response)
+        if state is not None:
+            DEVICE_STATE_CACHE.update_state(device_ip, state)
 
-def send_device_update(payload: Dict[str, Any], device_info: DeviceConfig, payload_settings: UISettings) -> requests.Response:
+    return response
+
+
+def confirmed_state(response: requests.Response | None) -> dict[str, Any] | None:
+    """
+    Extract the device state returned by a POST that was sent with `"v": true`.
+
+    Returns:
+        The WLED `state` object, or None if the response is missing, failed, or not a state object.
+    """
+    if response is None or response.status_code != 200:
+        return None
+    try:
+        state = response.json()
+    except ValueError:
+        return None
+    # A plain {"success": true} means the device ignored "v"
+    if not isinstance(state, dict) or 'on' not in state:
+        return None
+    return state
+
+
+def device_update_json(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """ JSON body `send_device_update` sends for a payload. """
+    # Desyncs device even if not master. Ensure only one device gets updated
+    # "v" asks WLED to answer with the resulting state (write-through to the state cache)
+    return {**payload, "udpn": {"send": False}, "v": True}
+
+
+def device_update_body(payload: Dict[str, Any]) -> bytes:
+    """ `device_update_json` serialized, for callers that send the same update repeatedly. """
+    return json.dumps(device_update_json(payload), separators=(',', ':')).encode('utf-8')
+
+
+def send_device_update(payload: Dict[str, Any], device_info: DeviceConfig, payload_settings: Settings,
+                       body: bytes | None = None) -> requests.Response:
     """
     Send a device update with temporary UDP notification suppression.
 
@@ -106,43 +186,45 @@ def send_device_update(payload: Dict[str, Any], device_info: DeviceConfig, paylo
     device_info : DeviceConfig
         Device configuration, must include the target IP address and optional
         master_sync flag.
-    payload_settings : UISettings
+    payload_settings : Settings
         UI-level request settings such as request timeout, retry count,
         and retry backoff.
+    body : bytes, optional
+        `device_update_body(payload)` computed ahead of time.
 
     Returns:
         requests.Response (200, 400, 500)
     """
-    # Desyncs device even if not master. Ensure only one device gets updated
-    json_body = {**payload, "udpn": {"send": False}}
+    json_body = device_update_json(payload)
 
-    # Zero set to force safe defaults to hard coded values.
-    timeout = payload_settings.get('request_timeout', 0)
-    retries = payload_settings.get('retries', 0)
-    backoff = payload_settings.get('retry_backoff', 0)
+    # Zero or less falls back to the safe hard coded defaults.
+    timeout = payload_settings.request_timeout if payload_settings.request_timeout > 0 else REQUEST_TIMEOUT
+    retries = payload_settings.retries if payload_settings.retries > 0 else RETRIES
+    backoff = payload_settings.retry_backoff if payload_settings.retry_backoff > 0 else RETRY_BACKOFF
 
     response = send_payload(
         device_ip=device_info.get('address') ,
         json_body=json_body,
-        timeout=timeout if isinstance(timeout, int) and timeout > 0 else REQUEST_TIMEOUT,
-        retries=retries if isinstance(retries, int) and retries > 0 else RETRIES,
-        backoff=backoff if isinstance(backoff, float) and backoff > 0 else RETRY_BACKOFF
+        timeout=timeout,
+        retries=retries,
+        backoff=backoff,
+        body=body
     )
 
     if device_info.get('master_sync', False):
         time.sleep(1)   # Allow Master device to complete the change before re-enabling sync
         response = send_payload(
             device_ip=device_info.get('address'),
-            json_body={"udpn": {"send": True}},
-            timeout=timeout if isinstance(timeout, int) and timeout > 0 else REQUEST_TIMEOUT,
-            retries=retries if isinstance(retries, int) and retries > 0 else RETRIES,
-            backoff=backoff if isinstance(backoff, float) and backoff > 0 else RETRY_BACKOFF
+            json_body={"udpn": {"send": True}, "v": True},
+            timeout=timeout,
+            retries=retries,
+            backoff=backoff
         )
 
     return response
 
 
-def send_device_power_update(status_update: bool, device_info: DeviceConfig, ui_settings: UISettings ) -> requests.Response:
+def send_device_power_update(status_update: bool, device_info: DeviceConfig, ui_settings: Settings ) -> requests.Response:
     """ Turns device power on/off. """
     return send_device_update(
         {"on": status_update},
@@ -151,7 +233,7 @@ def send_device_power_update(status_update: bool, device_info: DeviceConfig, ui_
     )
 
 
-def brightness_adjustment(change_value: int, device_info: DeviceConfig, ui_settings: UISettings ) -> requests.Response:
+def brightness_adjustment(change_value: int, device_info: DeviceConfig, ui_settings: Settings ) -> requests.Response:
     """ Set device brightness to value set (0-255). """
     return send_device_update(
         {"bri": change_value},
@@ -160,7 +242,7 @@ def brightness_adjustment(change_value: int, device_info: DeviceConfig, ui_setti
     )
 
 
-def send_preset(preset_value: int, device_info: DeviceConfig, ui_settings: UISettings ) -> requests.Response:
+def send_preset(preset_value: int, device_info: DeviceConfig, ui_settings: Settings ) -> requests.Response:
     """ Load a given Preset by index number supplied. """
     return send_device_update(
         {"ps": preset_value},
@@ -0,0 +1,159 @@
+"""
+Modular contains the compiled execution plans used to apply a room theme.
+
+A `ThemeSelectionConfig` stores presets as dropdown strings ("4: Warm-White") per device id.
+Compiling resolves each entry once into a `ThemeStep` (device, preset id, expected brightness and the
+pre-serialized POST body), so applying a theme is a dispatch over ready steps.
+
+Plans are recompiled only when the config content or the cached device presets change.
+Entries that cannot be applied (device missing, preset gone or renamed on the device) are flagged as stale
+and logged at compile time.
+"""
+
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any
+import os
+import logging
+
+from dotenv import load_dotenv
+
+from naari_logging.naari_logger import LogManager
+from naari_app.util.config_builder import DeviceConfig, ThemeSelectionConfig
+from naari_app.util.config_store import CONFIG_STORE, DeviceIndex
+from naari_app.util.preset_cache import PRESET_CACHE
+from naari_app.util.send_payload import device_update_body
+
+__all__ = [
+    'ThemeStep',
+    'ThemePlan',
+    'compile_theme',
+    'ThemePlanCache',
+    'THEME_PLANS',
+    'parse_preset_option'
+]
+
+MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+load_dotenv(os.path.join(MAINDIR, ".env"))
+TO_LOG = int(os.getenv("LOGGING", "0")) == 1
+
+
+def parse_preset_option(option: str | None) -> tuple[int, str] | None:
+    """ Dropdown value "4: Warm-White" -> (4, "Warm-White"). None when empty or not in that form. """
+    if not option:
+        return None
+    preset_id, _, name = str(option).partition(":")
+    try:
+        return int(preset_id.strip()), name.strip()
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class ThemeStep:
+    """ One device of a theme, resolved and ready to send. """
+    device: DeviceConfig
+    preset_id: int
+    option: str                 # dropdown value, as shown in the preset selection
+    brightness: int | None      # brightness stored with the preset on the device (None if presets unknown)
+    payload: dict[str, Any]
+    body: bytes                 # `payload` as the device update body, serialized once
+
+    @property
+    def device_id(self) -> int:
+        """ Config id of the step's device. """
+        return self.device['id']
+
+    @property
+    def address(self) -> str:
+        """ Configured address of the step's device. """
+        return self.device['address']
+
+
+@dataclass(frozen=True)
+class ThemePlan:
+    """ Every step of a theme plus what could not be resolved. """
+    theme_id: int
+    name: str
+    steps: tuple[ThemeStep, ...]
+    stale: tuple[str, ...] = ()
+    by_device: dict[int, ThemeStep] = field(default_factory=dict, compare=False, repr=False)
+
+
+def compile_theme(theme: ThemeSelectionConfig, index: DeviceIndex) -> ThemePlan:
+    """ Resolve a theme against the config devices and the cached device presets. Inactive devices are left out. """
+    steps = []
+    stale = []
+    for preset in theme.get('presets', []):
+        option = preset.get('preset_name')
+        device = index.device(preset.get('device_id'))
+        if not option:
+            continue
+        if device is None:
+            stale.append(f"device {preset.get('device_id')} is not in the config")
+            continue
+        if not device['active']:
+            continue
+
+        parsed = parse_preset_option(option)
+        if parsed is None:
+            stale.append(f"{device['instance_name']}: '{option}' is not a preset")
+            continue
+        preset_id, name = parsed
+
+        brightness = None
+        device_presets = PRESET_CACHE.presets(device['address'])
+        if device_presets is not None:
+            device_preset = device_presets.get(str(preset_id))
+            if not device_preset:
+                stale.append(f"{device['instance_name']}: preset {preset_id} no longer exists")
+                continue
+            if device_preset.get('n') is not None and str(device_preset.get('n')) != name:
+                stale.append(f"{device['instance_name']}: preset {preset_id} is now '{device_preset.get('n')}'")
+                continue
+            brightness = device_preset.get('bri')
+
+        payload = {"ps": preset_id}
+        steps.append(ThemeStep(device, preset_id, option, brightness, payload, device_update_body(payload)))
+
+    return ThemePlan(
+        theme_id=theme['id'],
+        name=theme['name'],
+        steps=tuple(steps),
+        stale=tuple(stale),
+        by_device={step.device_id: step for step in steps}
+    )
+
+
+class ThemePlanCache:
+    """ Compiled plans of every theme, rebuilt when the config or the cached presets change. """
+    def __init__(self):
+        self._lock = Lock()
+        self._key: tuple[str, int] | None = None
+        self._plans: dict[int, ThemePlan] = {}
+
+    def plans(self) -> dict[int, ThemePlan]:
+        """ theme id -> plan, for the current config and presets. """
+        key = (CONFIG_STORE.token()['hash'], PRESET_CACHE.version)
+        with self._lock:
+            if key != self._key:
+                config = CONFIG_STORE.get()
+                index = CONFIG_STORE.index()
+                self._plans = {theme['id']: compile_theme(theme, index) for theme in config.get('themes', [])}
+                self._key = key
+                for plan in self._plans.values():
+                    if plan.stale:
+                        LogManager.print_message(
+                            "Theme '%s' has stale entries: %s",
+                            plan.name, "; ".join(plan.stale),
+                            to_log=TO_LOG,
+                            log_level=logging.WARNING
+                        )
+            return self._plans
+
+    def plan(self, theme_id: int) -> ThemePlan | None:
+        """ Compiled plan of one theme. """
+        return self.plans().get(theme_id)
+
+
+THEME_PLANS = ThemePlanCache()
@@ -3,15 +3,23 @@ import logging
 import time
 import json
 import os
+import sqlite3
 from typing import Callable, ParamSpec
 from functools import wraps
 
 from dotenv import load_dotenv
-from dash import ctx as callback_context
+from dash import ctx as callback_context, no_update
 from dash.exceptions import PreventUpdate
 
 from naari_logging.naari_logger import LogManager
-from naari_app.util.config_builder import DeviceConfig, write_empty_config
+from naari_app.util.config_builder import (DeviceConfig, UISettings, ConfigValidationError, validate_config,
+                                           make_empty_config, write_empty_config)
+from naari_app.util.rate_limiter import DEVICE_RATE_LIMITER
+from naari_app.util.concurrency import ADAPTIVE_CONCURRENCY
+from naari_app.util.dns_cache import DNS_CACHE
+from naari_app.util.config_writer import CONFIG_WRITER
+from naari_app.util.config_model import Settings
+from naari_app.util.config_sqlite import SQLITE_BACKEND
 
 FuncParms = ParamSpec("FuncParms")
 FuncReturn = ParamSpec("FuncReturn")
@@ -49,31 +57,64 @@ def function_time(func: Callable[FuncParms, FuncReturn]) -> Callable[FuncParms,
     return wrapper
 
 
-def naari_config_load(file_path: str = CONFIG_PATH):
+def naari_config_load(file_path: str = CONFIG_PATH, initial: bool = True):
     """
-    Load and return the device configuration from JSON.
+    Load and return the device configuration from JSON (or from SQLite when `CONFIG_BACKEND=sqlite`).
 
     Args:
-        file_path: Absolute or relative path to the JSON config file.
+        file_path: Absolute or relative path to the JSON config file. Ignored by the SQLite backend
+            (which migrates it once, the first time the database is opened).
+        initial: First load at startup: a missing/unreadable file is replaced by a base config
+            (the unreadable one kept as `.corrupt`). Reloads pass False, errors are raised and nothing on disk is touched.
 
     Returns:
-        Parsed configuration as a dictionary.
+        Parsed, validated and normalized configuration as a dictionary.
 
     Raises:
         FileNotFoundError: If the config file does not exist.
         json.JSONDecodeError: If the file contains invalid JSON.
         ValueError: If the loaded configuration is empty.
+        ConfigValidationError: If the configuration does not match the schema.
     """
+    if SQLITE_BACKEND is not None:
+        return _sqlite_config_load(file_path, initial)
+
     try:
         with open(file_path, 'r', encoding='utf-8') as file:
             config_file = json.load(file)
     except (FileNotFoundError, json.JSONDecodeError) as e:
+        if not initial:
+            raise
         LogManager.print_message(
-            "[device_load] Failed to load config from %s: %s \nCreating Base Config File",
+            "[device_load] Failed to load config from %s: %s",
             file_path, e,
             to_log=TO_LOG,
             log_level=logging.ERROR
         )
+        if isinstance(e, json.JSONDecodeError):
+            # Keep the unreadable file around instead of losing it to the empty config
+            try:
+                os.replace(file_path, f"{file_path}.corrupt")
+            except OSError as move_error:
+                LogManager.print_message(
+                    "[device_load] Could not move %s aside, leaving it as is: %s",
+                    file_path, move_error,
+                    to_log=TO_LOG,
+                    log_level=logging.ERROR
+                )
+                raise e from move_error
+            LogManager.print_message(
+                "[device_load] Unreadable config kept as %s.corrupt",
+                file_path,
+                to_log=TO_LOG,
+                log_level=logging.ERROR
+            )
+        LogManager.print_message(
+            "[device_load] Creating base config file %s",
+            file_path,
+            to_log=TO_LOG,
+            log_level=logging.WARNING
+        )
         return write_empty_config(file_path)
 
     if not config_file:
@@ -85,20 +126,54 @@ def naari_config_load(file_path: str = CONFIG_PATH):
         )
         raise ValueError(f"Config file {CONFIG_PATH} is empty")
 
+    config_file = _validated(config_file, file_path, "[device_load]")
+    apply_runtime_settings(config_file.get('ui_settings', {}))
+    DNS_CACHE.prewarm(device.get('address') for device in config_file.get('devices') or [])
+    return config_file
+
+
+def _sqlite_config_load(file_path: str, initial: bool = True) -> dict:
+    """ `naari_config_load` for the SQLite backend: migrate the JSON file once, seed an empty config if nothing exists. """
+    if SQLITE_BACKEND.json_path != file_path:
+        SQLITE_BACKEND.json_path = file_path
+    if initial and not SQLITE_BACKEND.migrate_from_json() and SQLITE_BACKEND.is_empty():
+        LogManager.print_message(
+            "[device_load] No config in %s, creating base config",
+            SQLITE_BACKEND.db_path,
+            to_log=TO_LOG,
+            log_level=logging.WARNING
+        )
+        SQLITE_BACKEND.save(make_empty_config())
+
+    config_file = _validated(SQLITE_BACKEND.load(), SQLITE_BACKEND.db_path, "[device_load]")
+    apply_runtime_settings(config_file.get('ui_settings', {}))
+    DNS_CACHE.prewarm(device.get('address') for device in config_file.get('devices') or [])
     return config_file
 
 
-def save_configer(config: dict, file_path: str = CONFIG_PATH):
+def serialize_config(config: dict) -> bytes:
+    """ Config dictionary -> bytes exactly as written to the config file. """
+    return json.dumps(config, indent=4, ensure_ascii=False).encode('utf-8')
+
+
+def save_configer(config: dict, file_path: str = CONFIG_PATH, defer: bool = False) -> bytes:
     """
-        Save the given configuration dictionary to a JSON file.
+        Save the given configuration dictionary to a JSON file (atomic replace).
+        With `CONFIG_BACKEND=sqlite` only the changed rows are written to the database instead (always immediate).
 
        Args:
            config: The configuration data to save.
            file_path: Absolute or relative path to the JSON config file.
+           defer: Queue the write on the background writer (coalesces rapid saves) instead of writing now.
+               Ignored while a background write of the path is failing, so the error reaches the caller.
+
+       Returns:
+           The serialized config as written / queued.
 
        Raises:
            ValueError: If the provided configuration is empty.
-           OSError: If the file cannot be written.
+           ConfigValidationError: If the configuration does not match the schema (nothing is written).
+           OSError: If the file cannot be written (deferred saves: when the previous background write failed).
        """
     if not config:
         LogManager.print_message(
@@ -109,9 +184,30 @@ def save_configer(config: dict, file_path: str = CONFIG_PATH):
         )
         raise ValueError(f"Attempted to save empty config to {file_path}")
 
+    config = _validated(config, file_path, "[save_configer]")
+    apply_runtime_settings(config.get('ui_settings', {}))
+    DNS_CACHE.prewarm(device.get('address') for device in config.get('devices') or [])
+
+    payload = serialize_config(config)
+    if SQLITE_BACKEND is not None:
+        try:
+            SQLITE_BACKEND.save(config)
+        except sqlite3.Error as e:
+            LogManager.print_message(
+                "[save_configer] Failed to save config to %s: %s",
+                SQLITE_BACKEND.db_path, e,
+                to_log=TO_LOG,
+                log_level=logging.ERROR
+            )
+            raise OSError from e
+        return payload
+
+    if defer and CONFIG_WRITER.last_error(file_path) is None:
+        CONFIG_WRITER.schedule(file_path, payload)
+        return payload
+
     try:
-        with open(file_path, "w", encoding="utf-8") as cfile:
-            json.dump(config, cfile, indent=4, ensure_ascii=False)
+        CONFIG_WRITER.write_now(file_path, payload)
     except OSError as e:
         LogManager.print_message(
             "[save_configer] Failed to save config to %s: %s",
@@ -120,12 +216,38 @@ def save_configer(config: dict, file_path: str = CONFIG_PATH):
             log_level=logging.ERROR
         )
         raise OSError from e
+    return payload
+
+
+def _validated(config: dict, file_path: str, tag: str) -> dict:
+    """ Validate + normalize a config, logging every problem before re-raising. """
+    try:
+        return validate_config(config)
+    except ConfigValidationError as e:
+        LogManager.print_message(
+            "%s Config %s failed validation: %s",
+            tag, file_path, e,
+            to_log=TO_LOG,
+            log_level=logging.ERROR
+        )
+        raise
+
+
+def apply_runtime_settings(ui_settings: UISettings) -> None:
+    """ Push config values used outside of callbacks (rate limits, concurrency ceiling) into their process-wide holders. """
+    settings = Settings.from_ui_settings(ui_settings)
+    DEVICE_RATE_LIMITER.configure(
+        rate=settings.rate_limit,
+        burst=settings.rate_burst
+    )
+    ADAPTIVE_CONCURRENCY.configure(ceiling=settings.max_concurrency)
 
 
 def get_devices_ip(naari_devices: list[DeviceConfig], get_inactive: bool = True) -> list[str]:
     """ Extract a list of device IP addresses from config settings dict """
     if not naari_devices or not isinstance(naari_devices, list):
-        naari_devices = naari_config_load().get('devices')
+        from naari_app.util.config_store import CONFIG_STORE     # pylint: disable=import-outside-toplevel, cyclic-import
+        naari_devices = CONFIG_STORE.get().get('devices')
 
     if get_inactive:
         return [device['address'] for device in naari_devices]
@@ -155,3 +277,15 @@ def device_polled_data_mapping(cach_data: list[dict], devices: list[DeviceConfig
 def get_master_device(devices: list[DeviceConfig]):
     """Return the (single) master device or None if not found."""
     return next((device for device in devices if device.get('master_sync')), None)
+
+
+def changed_only(values: list, current_values: list) -> list:
+    """ ALL-output values with `no_update` wherever the widget already shows that value. """
+    if len(values) != len(current_values):
+        return values
+    return [no_update if value == current else value for value, current in zip(values, current_values)]
+
+
+def stack_index(card_ids: list[dict], key: str, value: int) -> int | None:
+    """ Position of the card with `card_id[key] == value` in its stack (card ids given in stack order, e.g. an ALL 'id' State). """
+    return next((index for index, card_id in enumerate(card_ids) if card_id.get(key) == value), None)
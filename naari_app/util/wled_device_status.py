@@ -1,7 +1,7 @@
 import asyncio, httpx
 import json
 from typing import Any, Iterable, Optional
-from threading import Lock
+from threading import Lock, Thread
 import os
 import logging
 import time
@@ -9,7 +9,15 @@ import time
 from dotenv import load_dotenv
 
 from naari_logging.naari_logger import LogManager
-from naari_app.util.util_functions import naari_config_load, get_devices_ip
+from naari_app.util.config_store import CONFIG_STORE
+from naari_app.util.device_state_cache import DEVICE_STATE_CACHE
+from naari_app.util.rate_limiter import DEVICE_RATE_LIMITER
+from naari_app.util.io_governor import DEVICE_IO_GOVERNOR, DevicePreempted, Priority
+from naari_app.util.concurrency import ADAPTIVE_CONCURRENCY, ConcurrencyRound
+from naari_app.util.dns_cache import DNS_CACHE, UnresolvedHost
+from naari_app.util.capability_cache import CAPABILITY_CACHE
+from naari_app.util.preset_cache import PRESET_CACHE
+from naari_app.util.config_sqlite import SQLITE_BACKEND
 
 MAINDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ",,"))
 load_dotenv(os.path.join(MAINDIR, ".env"))
@@ -21,13 +29,10 @@ _POLL_LOCK = Lock()
 # TODO: PULL dynamic values from config file.
 CONNECT_TIMEOUT = 2.0         # seconds to establish TCP
 READ_TIMEOUT = 3.0            # seconds to read response
-MAX_CONCURRENCY = 10.0        # cap active requests
 RETRIES = 2
 RETRY_BACKOFF = 0.25        # slows down retry in seconds
-
-# For Initial Load, and use during Testing
-DEVICES_LOADED = naari_config_load()
-DEVICEs_IP = [info['address'] for info in DEVICES_LOADED['devices']]
+POLL_TOKEN_RESERVE = 1      # rate limit tokens polls leave for user commands
+MAX_PREEMPTIONS = 3         # times a preset refresh restarts for commands before counting it as a failed attempt
 
 
 class PollingThreadLock(RuntimeError):
@@ -41,42 +46,108 @@ def _timeout() -> httpx.Timeout:
     return httpx.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT, write=None, pool=None)
 
 
-async def _fetch_json( client: httpx.AsyncClient, ip: str, path: str, retries: int = RETRIES, simultaneous_ops : Optional[asyncio.Semaphore] = None,) -> dict[str, Any]:
-    """Generic GET->JSON with small retry/backoff and consistent result shape."""
-    for attempt in range(retries + 1):
+def _deferred_result(ip: str, path: str, reason: str = "device rate limit reached") -> dict[str, Any]:
+    """ Result for a GET that was skipped (rate limited or preempted): last known device entry when there is one. """
+    cached = DEVICE_STATE_CACHE.get_entry(ip) if path == "/json" else None
+    if cached and 'data' in cached:
+        return {**cached, "deferred": True}
+    return {
+        "ip": ip,
+        "error": True,
+        "error_reason": f"deferred: {reason}"
+    }
+
+
+async def _get(client: httpx.AsyncClient, ip: str, path: str, simultaneous_ops : Optional[asyncio.Semaphore]) -> httpx.Response:
+    """ Single GET, holding a concurrency slot when a semaphore is given. Hostnames go through the DNS cache. """
+    url = f"http://{await DNS_CACHE.resolve_async(ip)}{path}"
+    if simultaneous_ops is None:
+        return await client.get(url)
+    async with simultaneous_ops:
+        return await client.get(url)
+
+
+async def _fetch_json( client: httpx.AsyncClient, ip: str, path: str, retries: int = RETRIES, simultaneous_ops : Optional[asyncio.Semaphore] = None,     # pylint: disable=too-many-arguments, too-many-positional-arguments
+                       priority: Priority = Priority.PRESET_REFRESH, concurrency: Optional[ConcurrencyRound] = None) -> dict[str, Any]:
+    """
+        Generic GET->JSON with small retry/backoff and consistent result shape.
+
+        Every attempt takes a token from the device's rate limit bucket and runs in its device I/O lane:
+            - Priority.POLL: skipped when the bucket is empty or the device has user commands pending,
+              cancelled when a command arrives mid-request. Returns the last known entry instead.
+            - Priority.PRESET_REFRESH: waits for a token and for pending commands, restarts if interrupted.
+
+        When a `concurrency` round is given, each attempt's latency / error / timeout is recorded on it.
+    """
+    bucket = DEVICE_RATE_LIMITER.bucket(ip)
+    is_poll = priority >= Priority.POLL
+    attempt = preemptions = 0
+    failure = None
+    while attempt <= retries:
+        if is_poll:
+            if not bucket.try_acquire(reserve=POLL_TOKEN_RESERVE):
+                return _deferred_result(ip, path)
+        else:
+            await bucket.acquire()
         try:
-            if simultaneous_ops is None:
-                response_data = await client.get(f"http://{ip}{path}")
-            else:
-                async with simultaneous_ops:
-                    response_data = await client.get(f"http://{ip}{path}")
-
+            response_data = await DEVICE_IO_GOVERNOR.run(ip, priority, _get(client, ip, path, simultaneous_ops))
             response_data.raise_for_status()  # treat 4xx/5xx as failures
-            try:
-                return {
-                    "ip": ip,
-                    "data": response_data.json()
-                }
-            except ValueError as e:  # invalid JSON
-                return {
-                    "ip": ip,
-                    "error": True,
-                    "error_reason": f"invalid_json: {e}"
-                }
+            if concurrency is not None:
+                concurrency.record(latency=response_data.elapsed.total_seconds())
+            return _json_result(ip, response_data)
+
+        except DevicePreempted:
+            if is_poll:
+                return _deferred_result(ip, path, reason="user command pending")
+            # Preset refresh gave way to a command; only a failed attempt if it keeps happening
+            preemptions += 1
+            if preemptions <= MAX_PREEMPTIONS:
+                continue
+            failure = f"preempted: gave way to user commands {preemptions} times"
+
+        except UnresolvedHost as e:
+            # Lookup failures are negatively cached, retrying now would give the same answer
+            return _error_result(ip, f"{e.__class__.__name__}: {e}")
 
         except (httpx.TimeoutException, httpx.NetworkError, httpx.HTTPStatusError) as e:
             # TODO: Log Error event here
-            # Decide to retry or fail
-            if attempt >= retries:
-                return {
-                    "ip": ip,
-                    "error": True,
-                    "error_reason": f"{e.__class__.__name__}: {e}"
-                }
-            # exponential backoff: base * 2**attempt
-            await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+            _record_failure(ip, e, concurrency)
+            failure = f"{e.__class__.__name__}: {e}"
+            if attempt < retries:
+                # exponential backoff: base * 2**attempt
+                await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+        attempt += 1
 
     # TODO: Error event if for loop fails or has an outside issue? or Move it up top.
+    return _error_result(ip, failure or f"retries exhausted: {attempt} attempts")
+
+
+def _error_result(ip: str, reason: str) -> dict[str, Any]:
+    """ Result entry of a failed GET. """
+    return {
+        "ip": ip,
+        "error": True,
+        "error_reason": reason
+    }
+
+
+def _json_result(ip: str, response_data: httpx.Response) -> dict[str, Any]:
+    """ Result entry of a successful GET (an error entry when the body is not JSON). """
+    try:
+        return {
+            "ip": ip,
+            "data": response_data.json()
+        }
+    except ValueError as e:  # invalid JSON
+        return _error_result(ip, f"invalid_json: {e}")
+
+
+def _record_failure(ip: str, error: Exception, concurrency: Optional[ConcurrencyRound]) -> None:
+    """ Reports a failed attempt to the concurrency round; a refused connection marks the DNS entry stale. """
+    if concurrency is not None:
+        concurrency.record(error=True, timeout=isinstance(error, httpx.TimeoutException))
+    if isinstance(error, httpx.ConnectError):
+        DNS_CACHE.mark_stale(ip)     # device may have moved (DHCP), re-resolve in the background
 
 
 async def fetch_status(ip: str) -> dict[str, Any]:
@@ -99,28 +170,81 @@ async def fetch_presets(ip: str) -> dict[str, Any]:
         )
 
 
-async def run_status(device_address_list: Iterable[str], max_concurrency: int = MAX_CONCURRENCY) -> list[dict[str, Any]]:
+async def _run_round(device_address_list: Iterable[str], path: str, priority: Priority,
+                     max_concurrency: Optional[int]) -> list[dict[str, Any]]:
+    """
+        Fetches `path` from all devices concurrently.
+
+        max_concurrency:
+            None -> in-flight limit from the path's adaptive controller, which is then tuned from this round's results
+            0    -> no limit
+            > 0  -> fixed limit
+    """
+    device_address_list = list(device_address_list)
+    concurrency = ADAPTIVE_CONCURRENCY.controller(path) if max_concurrency is None else None
+    this_round = concurrency.start_round(len(device_address_list)) if concurrency is not None else None
+    limit = this_round.limit if this_round is not None else max_concurrency
+    simultaneous_ops = asyncio.Semaphore(limit) if limit > 0 else None
+
+    try:
+        async with httpx.AsyncClient(timeout=_timeout()) as client:
+            tasks = [
+                _fetch_json(client=client, ip=ip, path=path, simultaneous_ops=simultaneous_ops,
+                            priority=priority, concurrency=this_round)
+                for ip in device_address_list
+            ]
+            return await asyncio.gather(*tasks, return_exceptions=False)
+    finally:
+        if concurrency is not None:
+            new_limit = concurrency.end_round(this_round)
+            if new_limit != limit:
+                LogManager.print_message(
+                    "Concurrency for %s adjusted %s -> %s (ceiling %s)",
+                    path, limit, new_limit, concurrency.ceiling,
+                    to_log=TO_LOG,
+                    log_level=logging.DEBUG
+                )
+
+
+async def run_status(device_address_list: Iterable[str], max_concurrency: Optional[int] = None) -> list[dict[str, Any]]:
     """ Fetches /json status from all devices concurrently """
-    simultaneous_ops = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+    return await _run_round(device_address_list, "/json", Priority.POLL, max_concurrency)
 
-    async with httpx.AsyncClient(timeout=_timeout()) as client:
-        tasks = [
-            _fetch_json(client=client, ip=ip, path="/json", simultaneous_ops=simultaneous_ops)
-            for ip in device_address_list
-        ]
-        return await asyncio.gather(*tasks, return_exceptions=False)
 
+async def get_presets(device_address_list: Iterable[str], max_concurrency: Optional[int] = None) -> list[dict[str, Any]]:
+    """ Fetch /preset.json from all devices concurrently (kept in the server-side preset cache as well) """
+    fetched = await _run_round(device_address_list, "/presets.json", Priority.PRESET_REFRESH, max_concurrency)
+    PRESET_CACHE.update(fetched)
+    return fetched
 
-async def get_presets(device_address_list: Iterable[str], max_concurrency: int = MAX_CONCURRENCY) -> list[dict[str, Any]]:
-    """ Fetch /preset.json from all devices concurrently """
-    simultaneous_ops = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+
+async def get_capabilities(builds: dict[str, str]) -> None:
+    """ Fetch /json/eff + /json/pal once per firmware build ({key: address of a device running it}). """
+    async def fetch_build(client: httpx.AsyncClient, key: str, ip: str) -> None:
+        effects, palettes = await asyncio.gather(
+            _fetch_json(client=client, ip=ip, path="/json/eff"),
+            _fetch_json(client=client, ip=ip, path="/json/pal")
+        )
+        if isinstance(effects.get('data'), list) and isinstance(palettes.get('data'), list):
+            CAPABILITY_CACHE.store(key, effects['data'], palettes['data'], address=ip)
+        else:
+            CAPABILITY_CACHE.release(key)
+            LogManager.print_message(
+                "Capabilities for firmware %s not fetched from %s: %s",
+                key, ip, effects.get('error_reason') or palettes.get('error_reason'),
+                to_log=TO_LOG,
+                log_level=logging.WARNING
+            )
 
     async with httpx.AsyncClient(timeout=_timeout()) as client:
-        tasks = [
-            _fetch_json(client=client, ip=ip, path="/presets.json", simultaneous_ops=simultaneous_ops)
-            for ip in device_address_list
-        ]
-        return await asyncio.gather(*tasks, return_exceptions=False)
+        await asyncio.gather(*(fetch_build(client, key, ip) for key, ip in builds.items()))
+
+
+def _refresh_capabilities(polled_data: list[dict[str, Any]]) -> None:
+    """ Fetches firmware builds first seen in this poll in the background, off the polling path. """
+    builds = CAPABILITY_CACHE.claim_missing(polled_data)
+    if builds:
+        Thread(target=asyncio.run, args=(get_capabilities(builds),), name="capability-fetch", daemon=True).start()
 
 
 def poll_all_devices(device_address_list: Iterable[str]):
@@ -130,7 +254,14 @@ def poll_all_devices(device_address_list: Iterable[str]):
 
     #async with lock:
     try:
-        return asyncio.run(run_status(device_address_list))
+        started_at = time.monotonic()
+        polled_data = asyncio.run(run_status(device_address_list))
+        # Keeps state confirmed by commands during the poll from being overwritten by older poll data
+        polled_data = DEVICE_STATE_CACHE.update_from_poll(polled_data, started_at)
+        _refresh_capabilities(polled_data)
+        if SQLITE_BACKEND is not None:
+            SQLITE_BACKEND.record_states(polled_data)
+        return polled_data
     finally:
         _POLL_LOCK.release()
 
@@ -142,7 +273,7 @@ def poll_device_presets(device_address_list: Iterable[str]):
             to_log=TO_LOG,
             log_level=logging.ERROR
         )
-        device_address_list = get_devices_ip()
+        device_address_list = CONFIG_STORE.index().addresses()
     return asyncio.run(get_presets(device_address_list))
 
 
@@ -1,11 +1,14 @@
 
 import logging
 import os
+import sys
 
 from dotenv import load_dotenv
 
 from naari_logging.naari_logger import LogManager
 from naari_app.dash_app import dash_app
+from naari_app.util.config_builder import ConfigValidationError
+from naari_app.util.config_store import CONFIG_STORE
 
 load_dotenv(".env")
 TO_LOG = int(os.getenv("LOGGING", "0")) == 1
@@ -15,6 +18,14 @@ logger.setup_file_logging()
 
 try:
     server = dash_app().server
+except ConfigValidationError as err:
+    logger.print_message(
+        "Config %s can't be used, fix it and restart >> %s",
+        CONFIG_STORE.file_path, err,
+        to_log=TO_LOG,
+        log_level=logging.CRITICAL
+    )
+    sys.exit(1)
 except Exception as err:  # pylint: disable=broad-exception-caught
     logger.print_message(
         "Major problem during run >> %s",